@@ -1,5 +1,7 @@
 from django.contrib import admin
 from . import models
+from .forms import AppointmentAdminForm
+from .payments import mark_appointments_paid
 
 
 # Register your models here.
@@ -9,6 +11,7 @@ class CustomerAdmin(admin.ModelAdmin):
     search_fields = ('first_name', 'last_name', 'phone_no', 'email', 'postcode')
     list_display = ('id', 'first_name', 'last_name', 'phone_no', 'email', 'postcode')
     readonly_fields = ('date_activated', 'date_deactivated')
+    actions = ('activate_customers', 'deactivate_customers')
     fieldsets = (
         ('Name', {
             'fields': (('title', 'first_name', 'last_name'),)
@@ -27,14 +30,35 @@ class CustomerAdmin(admin.ModelAdmin):
             'fields': ('active', 'date_activated', 'date_deactivated')
         }))
 
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Searches the customer search index rather than the search_fields,
+        which stay set so the admin shows the search box
+        """
+        if not search_term.strip():
+            return queryset, False
+        return models.CustomerSearchIndex().search(queryset, search_term), False
+
+    def activate_customers(self, request, queryset):
+        num_of_customers = models.CustomerActivation().activate(queryset)
+        self.message_user(request, "Activated {} customers".format(num_of_customers))
+    activate_customers.short_description = 'Activate selected customers'
+
+    def deactivate_customers(self, request, queryset):
+        num_of_customers = models.CustomerActivation().deactivate(queryset)
+        self.message_user(request, "Deactivated {} customers".format(num_of_customers))
+    deactivate_customers.short_description = 'Deactivate selected customers'
+
 
 class AppointmentAdmin(admin.ModelAdmin):
-    list_filter = ('date', 'start_time')
-    list_display = ('date', 'start_time', 'end_time', 'customer', 'quote')
+    form = AppointmentAdminForm
+    list_filter = ('date', 'start_time', 'stylist')
+    list_display = ('date', 'start_time', 'end_time', 'customer', 'stylist', 'services_summary', 'quote')
+    list_select_related = ('customer', 'stylist')
 
     fieldsets = (
         ('Appointment Details', {
-            'fields': ('customer', ('date', 'start_time', 'end_time'), 'services')
+            'fields': ('customer', 'stylist', ('date', 'start_time', 'end_time'), 'services')
         }),
         ('Payment Information', {
             'fields': (('quote', 'date_paid'),)
@@ -42,17 +66,61 @@ class AppointmentAdmin(admin.ModelAdmin):
     )
 
     readonly_fields = ('end_time', 'quote')
+    actions = ('mark_paid',)
+
+    def get_queryset(self, request):
+        # Services for the whole changelist page are fetched in one query
+        return super(AppointmentAdmin, self).get_queryset(request).prefetch_related('services')
+
+    def services_summary(self, obj):
+        return ", ".join(service.service or '' for service in obj.services.all())
+    services_summary.short_description = 'Services'
 
     def save_model(self, request, obj, form, change):
-        super(AppointmentAdmin, self).save_model(request, obj, form, change)
-        obj.services.set(form.cleaned_data['services'])
-        obj.save()
+        # AppointmentAdminForm.clean() locked the date and checked for clashes in the
+        # same transaction as this save, see ModelAdmin.changeform_view
+        obj.save(services=form.cleaned_data['services'])
+
+    def save_related(self, request, form, formsets, change):
+        # save_model has already set the services, so save_m2m() is not to set them again
+        form.cleaned_data.pop('services', None)
+        super(AppointmentAdmin, self).save_related(request, form, formsets, change)
+
+    def mark_paid(self, request, queryset):
+        num_of_paid = mark_appointments_paid(queryset)
+        self.message_user(request, "Marked {} appointments as paid today".format(num_of_paid))
+    mark_paid.short_description = 'Mark selected appointments as paid today'
 
 
 class ServiceAdmin(admin.ModelAdmin):
     list_display = ('service', 'price', 'estimated_minutes')
 
 
+class OpeningHoursInline(admin.TabularInline):
+    model = models.OpeningHours
+    extra = 0
+
+
+class StylistAdmin(admin.ModelAdmin):
+    list_display = ('name', 'active')
+    list_filter = ('active',)
+    inlines = (OpeningHoursInline,)
+
+
+class OpeningHoursAdmin(admin.ModelAdmin):
+    list_display = ('weekday', 'start_time', 'end_time', 'stylist')
+    list_filter = ('stylist',)
+
+
+class ReminderAdmin(admin.ModelAdmin):
+    list_display = ('appointment', 'appointment_date', 'channel', 'recipient', 'date_sent')
+    list_filter = ('channel', 'date_sent')
+    list_select_related = ('appointment',)
+
+
 admin.site.register(models.Customer, CustomerAdmin)
 admin.site.register(models.Appointment, AppointmentAdmin)
 admin.site.register(models.Service, ServiceAdmin)
+admin.site.register(models.Stylist, StylistAdmin)
+admin.site.register(models.OpeningHours, OpeningHoursAdmin)
+admin.site.register(models.Reminder, ReminderAdmin)
@@ -0,0 +1,171 @@
+from django.db import models
+from django.db.models import Case, Count, F, Max, Min, Sum, Value, When
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from .models import Appointment, DailySummary, DailySummaryCache, OpeningHoursCalendar
+from .utils import time_to_minutes
+import calendar
+import datetime
+
+
+def get_month_end(month):
+    return month.replace(day=calendar.monthrange(month.year, month.month)[1])
+
+
+def get_next_month(month):
+    return get_month_end(month) + datetime.timedelta(days=1)
+
+
+class RevenueAnalytics:
+    """
+    Rolls up appointments by month from month_from to month_to (inclusive, any day
+    in the month will do): revenue, booked minutes and utilisation of the opening hours
+    per month, revenue and booked minutes per service, and the top customers by lifetime value.
+    Every figure comes from a grouped SQL aggregate rather than a loop over appointments.
+    Rollups of closed months, those before the current month, are kept in DailySummaryCache,
+    which drops a month's rollup whenever an appointment in it is saved, deleted or paid.
+    Service figures use the service's current price and estimated minutes.
+    """
+
+    def __init__(self, month_from, month_to, today=None, num_of_top_customers=10):
+        self.month_from = month_from.replace(day=1)
+        self.month_to = month_to.replace(day=1)
+        self.today = today or timezone.localdate()
+        self.num_of_top_customers = num_of_top_customers
+
+    def get_months(self):
+        months = []
+        month = self.month_from
+        while month <= self.month_to:
+            months.append(month)
+            month = get_next_month(month)
+        return months
+
+    def is_closed(self, month):
+        return month < self.today.replace(day=1)
+
+    def get_appointments(self, date_from, date_to):
+        return Appointment.objects.filter(date__gte=date_from, date__lte=date_to).order_by()
+
+    def get_monthly_revenue(self, date_from, date_to):
+        paid_quote = Case(When(date_paid__isnull=False, then=F('quote')),
+                          default=Value(0.0),
+                          output_field=models.FloatField())
+        return self.get_appointments(date_from, date_to).annotate(month=TruncMonth('date')).values('month') \
+            .annotate(num_of_appointments=Count('id'),
+                      num_of_customers=Count('customer', distinct=True),
+                      forecasted_income=Sum('quote'),
+                      paid_income=Sum(paid_quote))
+
+    def get_monthly_booked_minutes(self, date_from, date_to):
+        return DailySummary.objects.filter(date__gte=date_from, date__lte=date_to).order_by() \
+            .annotate(month=TruncMonth('date')).values('month') \
+            .annotate(booked_minutes=Sum('booked_minutes'))
+
+    def get_monthly_services(self, date_from, date_to):
+        return Appointment.services.through.objects \
+            .filter(appointment__date__gte=date_from, appointment__date__lte=date_to) \
+            .annotate(month=TruncMonth('appointment__date')) \
+            .values('month', 'service_id', 'service__service') \
+            .annotate(num_of_appointments=Count('appointment_id'),
+                      revenue=Sum('service__price'),
+                      booked_minutes=Sum('service__estimated_minutes'))
+
+    def get_open_minutes(self, month, opening_hours_calendar):
+        """
+        Minutes the salon is open in the month, one chair, as the appointment summary
+        report counts free time; the 09:00-17:00 day of TimeSlots unless opening hours are set
+        """
+        open_minutes = 0
+        date = month
+        while date <= get_month_end(month):
+            hours = opening_hours_calendar.get_hours(date)
+            if hours is not None:
+                open_minutes += time_to_minutes(hours[1]) - time_to_minutes(hours[0])
+            date += datetime.timedelta(days=1)
+        return open_minutes
+
+    def make_monthly_rollups(self, months):
+        """
+        Makes the rollups for the given months with three grouped queries over the range they span
+        """
+        date_from, date_to = months[0], get_month_end(months[-1])
+        opening_hours_calendar = OpeningHoursCalendar()
+        monthly_rollups = {month: {'month': month, 'num_of_appointments': 0, 'num_of_customers': 0,
+                                   'forecasted_income': 0.0, 'paid_income': 0.0, 'booked_minutes': 0,
+                                   'open_minutes': self.get_open_minutes(month, opening_hours_calendar),
+                                   'services': []}
+                           for month in months}
+        for monthly_revenue in self.get_monthly_revenue(date_from, date_to):
+            if monthly_revenue['month'] in monthly_rollups:
+                monthly_rollups[monthly_revenue['month']].update(monthly_revenue)
+        for monthly_booked_minutes in self.get_monthly_booked_minutes(date_from, date_to):
+            if monthly_booked_minutes['month'] in monthly_rollups:
+                monthly_rollups[monthly_booked_minutes['month']].update(monthly_booked_minutes)
+        for monthly_service in self.get_monthly_services(date_from, date_to):
+            month = monthly_service.pop('month')
+            if month in monthly_rollups:
+                monthly_rollups[month]['services'].append(monthly_service)
+        for monthly_rollup in monthly_rollups.values():
+            open_minutes = monthly_rollup['open_minutes']
+            monthly_rollup['utilisation'] = monthly_rollup['booked_minutes'] / open_minutes if open_minutes else 0.0
+        return monthly_rollups
+
+    def get_monthly_rollups(self):
+        months = self.get_months()
+        if not months:
+            return []
+        daily_summary_cache = DailySummaryCache()
+        monthly_rollups = daily_summary_cache.get_many_months([month for month in months if self.is_closed(month)])
+        missing_months = [month for month in months if month not in monthly_rollups]
+        if missing_months:
+            missing_monthly_rollups = self.make_monthly_rollups(missing_months)
+            daily_summary_cache.set_many_months({month: monthly_rollup
+                                                 for month, monthly_rollup in missing_monthly_rollups.items()
+                                                 if self.is_closed(month)})
+            monthly_rollups.update(missing_monthly_rollups)
+        return [monthly_rollups[month] for month in months]
+
+    def get_service_totals(self, monthly_rollups):
+        """
+        Adds up the per-month service figures, so the range needs no further query
+        """
+        service_totals = {}
+        for monthly_rollup in monthly_rollups:
+            for monthly_service in monthly_rollup['services']:
+                service_total = service_totals.setdefault(monthly_service['service_id'], {
+                    'service_id': monthly_service['service_id'],
+                    'service__service': monthly_service['service__service'],
+                    'num_of_appointments': 0, 'revenue': 0.0, 'booked_minutes': 0})
+                for key in ('num_of_appointments', 'revenue', 'booked_minutes'):
+                    service_total[key] += monthly_service[key] or 0
+        return sorted(service_totals.values(), key=lambda service_total: -service_total['revenue'])
+
+    def get_top_customers(self):
+        """
+        Customers with the highest total quoted for all their appointments up to the end of the range
+        """
+        paid_quote = Case(When(date_paid__isnull=False, then=F('quote')),
+                          default=Value(0.0),
+                          output_field=models.FloatField())
+        return list(Appointment.objects.filter(date__lte=get_month_end(self.month_to)).order_by()
+                    .values('customer_id', 'customer__first_name', 'customer__last_name')
+                    .annotate(num_of_appointments=Count('id'),
+                              lifetime_value=Sum('quote'),
+                              paid_income=Sum(paid_quote),
+                              first_date=Min('date'),
+                              last_date=Max('date'))
+                    .order_by('-lifetime_value', 'customer_id')[:self.num_of_top_customers])
+
+    def get_report(self):
+        monthly_rollups = self.get_monthly_rollups()
+        totals = {'num_of_appointments': 0, 'forecasted_income': 0.0, 'paid_income': 0.0,
+                  'booked_minutes': 0, 'open_minutes': 0}
+        for monthly_rollup in monthly_rollups:
+            for key in totals:
+                totals[key] += monthly_rollup[key] or 0
+        totals['utilisation'] = totals['booked_minutes'] / totals['open_minutes'] if totals['open_minutes'] else 0.0
+        return {'monthly_rollups': monthly_rollups,
+                'totals': totals,
+                'service_totals': self.get_service_totals(monthly_rollups),
+                'top_customers': self.get_top_customers()}
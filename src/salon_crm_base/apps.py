@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class SalonCrmBaseConfig(AppConfig):
     name = 'salon_crm_base'
+
+    def ready(self):
+        from . import signals  # noqa: F401
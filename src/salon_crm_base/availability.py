@@ -0,0 +1,112 @@
+from collections import defaultdict, namedtuple
+from heapq import merge
+from .models import Appointment, OpeningHoursCalendar, Stylist, TimeSlots
+from .utils import AppointmentUtil, minutes_to_time, time_to_minutes
+import datetime
+
+AvailableSlot = namedtuple('AvailableSlot', ['date', 'start_time', 'end_time', 'stylist'])
+
+
+class AvailabilityFinder:
+    """
+    Finds free time within opening hours for each day in a date range.
+    With active stylists, free time is found per stylist within their own hours,
+    so several stylists can be free at once; otherwise the salon is treated as one chair.
+    Appointments without a stylist cannot be booked while there are active stylists,
+    see check_stylist_selected in models.py.
+    The booked time slots for the whole range are loaded in one query,
+    then TimeSlots sweeps each stylist's days once to give their free intervals
+    as (start, end) minutes from midnight.
+    """
+
+    def __init__(self, date_from, date_to, not_before=None, stylists=None):
+        """
+        not_before is a datetime; free time earlier than it is skipped,
+        e.g. pass the current time so nothing earlier today is offered.
+        stylists limits the search to those stylists, by default all active stylists.
+        """
+        self.date_from = date_from
+        self.date_to = date_to
+        self.not_before = not_before
+        self.stylists = stylists
+
+    def get_stylists(self):
+        if self.stylists is not None:
+            return list(self.stylists)
+        return list(Stylist.objects.filter(active=True))
+
+    def get_first_date(self):
+        if self.not_before is not None and self.date_from < self.not_before.date():
+            return self.not_before.date()
+        return self.date_from
+
+    def get_dates(self):
+        date = self.get_first_date()
+        while date <= self.date_to:
+            yield date
+            date += datetime.timedelta(days=1)
+
+    def get_booked_time_slots(self):
+        return Appointment.objects.filter(date__gte=self.get_first_date(),
+                                          date__lte=self.date_to,
+                                          start_time__isnull=False,
+                                          end_time__isnull=False) \
+            .values_list('stylist_id', 'date', 'start_time', 'end_time').order_by('date', 'start_time')
+
+    def get_not_before_minutes(self, date):
+        if self.not_before is None or self.not_before.date() != date:
+            return None
+        return time_to_minutes(self.not_before) + (self.not_before.second > 0)
+
+    def iter_free_intervals_for_stylist(self, time_slot_rows, opening_hours_calendar, stylist=None):
+        free_intervals_by_date = TimeSlots.iter_free_intervals_for_dates(
+            time_slot_rows, dates=self.get_dates(), opening_hours_calendar=opening_hours_calendar,
+            stylist_id=stylist.id if stylist is not None else None)
+        for date, free_intervals in free_intervals_by_date:
+            not_before_minutes = self.get_not_before_minutes(date)
+            for start, end in free_intervals:
+                if not_before_minutes is not None:
+                    start = max(start, not_before_minutes)
+                if start < end:
+                    yield date, start, end, stylist
+
+    def iter_free_intervals(self):
+        """
+        Yields (date, start minutes, end minutes, stylist) for every free interval in the range
+        in date and time order, including days with no appointments.
+        stylist is None when no stylists are set up.
+        """
+        stylists = self.get_stylists()
+        opening_hours_calendar = OpeningHoursCalendar()
+        time_slot_rows = self.get_booked_time_slots()
+        if not stylists:
+            rows = (row[1:] for row in time_slot_rows.iterator())
+            for free_interval in self.iter_free_intervals_for_stylist(rows, opening_hours_calendar):
+                yield free_interval
+            return
+        rows_by_stylist = defaultdict(list)
+        for stylist_id, date, start_time, end_time in time_slot_rows:
+            rows_by_stylist[stylist_id].append((date, start_time, end_time))
+        free_intervals_by_stylist = [self.iter_free_intervals_for_stylist(rows_by_stylist[stylist.id],
+                                                                          opening_hours_calendar, stylist)
+                                     for stylist in stylists]
+        for free_interval in merge(*free_intervals_by_stylist, key=lambda free_interval: free_interval[:2]):
+            yield free_interval
+
+    def find_available_slots(self, minutes, limit=None):
+        """
+        Returns AvailableSlot tuples for the free intervals at least minutes long,
+        earliest first, at most limit of them.
+        """
+        available_slots = []
+        for date, start, end, stylist in self.iter_free_intervals():
+            if end - start < minutes:
+                continue
+            available_slots.append(AvailableSlot(date, minutes_to_time(start), minutes_to_time(end), stylist))
+            if limit is not None and len(available_slots) >= limit:
+                break
+        return available_slots
+
+    def find_available_slots_for_services(self, service_ids, limit=None):
+        appointment_util = AppointmentUtil.for_service_ids(service_ids, datetime.time(hour=0))
+        return self.find_available_slots(appointment_util.get_total_estimated_minutes(), limit=limit)
@@ -0,0 +1,226 @@
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from .availability import AvailabilityFinder
+from .models import (Appointment, AppointmentReportMaker, CachedDailySummaryReportMaker, Customer,
+                     CustomerSearchIndex, DailySummaryMaker, DailySummaryReportMaker, Service, TimeSlots,
+                     check_no_appointment_clashes)
+from .utils import AppointmentUtil, service_catalogue
+import datetime
+import django
+import random
+import statistics
+import time
+
+FIRST_NAMES = ('olivia', 'amelia', 'isla', 'ava', 'mia', 'ivy', 'lily', 'sophia', 'grace', 'freya',
+               'oliver', 'george', 'noah', 'arthur', 'leo', 'harry', 'oscar', 'archie', 'henry', 'theo')
+LAST_NAMES = ('smith', 'jones', 'taylor', 'brown', 'williams', 'wilson', 'johnson', 'davies', 'patel',
+              'robinson', 'wright', 'thompson', 'evans', 'walker', 'white', 'roberts', 'green', 'hall')
+
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'salon_crm_bench',
+    }
+}
+
+
+class SyntheticDataMaker:
+    """
+    Generates reproducible customers, services and appointments for benchmarks.
+    Appointments are booked back to back from 09:00 on every day of the range,
+    up to appointments_per_day a day, and written with bulk inserts.
+    """
+
+    def __init__(self, seed=1):
+        self.rng = random.Random(seed)
+
+    def make_customers(self, num_of_customers, first_num=0):
+        for num in range(first_num, first_num + num_of_customers):
+            phone_no = "07{:09d}".format(self.rng.randrange(10 ** 9))
+            yield Customer(first_name=self.rng.choice(FIRST_NAMES),
+                           last_name=self.rng.choice(LAST_NAMES) + str(num % 1000),
+                           email="customer{}@example.com".format(num),
+                           phone_no=phone_no[:5] + " " + phone_no[5:],
+                           postcode="G{} {}AU".format(self.rng.randrange(1, 99), self.rng.randrange(10)))
+
+    def create_customers(self, num_of_customers):
+        first_num = Customer.objects.count()
+        Customer.objects.bulk_create(self.make_customers(num_of_customers, first_num))
+        CustomerSearchIndex().rebuild()
+        return list(Customer.objects.order_by('-id').values_list('id', flat=True)[:num_of_customers])
+
+    def create_services(self, num_of_services):
+        Service.objects.bulk_create([Service(service="service {}".format(num),
+                                             price=self.rng.randrange(10, 120),
+                                             estimated_minutes=self.rng.choice((15, 30, 45, 60, 75)))
+                                     for num in range(num_of_services)])
+        return list(Service.objects.order_by('-id').values_list('id', flat=True)[:num_of_services])
+
+    def iter_appointments_for_date(self, date, customer_ids, service_ids, appointments_per_day):
+        start_time = datetime.time(hour=9)
+        for _ in range(appointments_per_day):
+            appointment_service_ids = self.rng.sample(service_ids, self.rng.randint(1, min(2, len(service_ids))))
+            appointment_util = AppointmentUtil.for_service_ids(appointment_service_ids, start_time)
+            if appointment_util.end_time > datetime.time(hour=17) or appointment_util.end_time < start_time:
+                return
+            appointment = Appointment(date=date, start_time=start_time, end_time=appointment_util.end_time,
+                                      quote=appointment_util.get_quote(),
+                                      customer_id=self.rng.choice(customer_ids),
+                                      date_paid=date if self.rng.random() < 0.8 else None)
+            yield appointment, appointment_service_ids
+            start_time = appointment_util.end_time
+
+    def create_appointments(self, date_from, date_to, customer_ids, service_ids, appointments_per_day):
+        last_id = Appointment.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        appointments_with_services = []
+        date = date_from
+        while date <= date_to:
+            appointments_with_services += self.iter_appointments_for_date(date, customer_ids, service_ids,
+                                                                          appointments_per_day)
+            date += datetime.timedelta(days=1)
+        Appointment.objects.bulk_create([appointment for appointment, _ in appointments_with_services])
+        appointment_ids = Appointment.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)
+        appointment_services = Appointment.services.through
+        appointment_services.objects.bulk_create([
+            appointment_services(appointment_id=appointment_id, service_id=service_id)
+            for appointment_id, (_, appointment_service_ids) in zip(appointment_ids, appointments_with_services)
+            for service_id in appointment_service_ids])
+        DailySummaryMaker().rebuild(date_from=date_from, date_to=date_to)
+        return len(appointments_with_services)
+
+
+class BenchmarkSuite:
+    """
+    Times the booking, reporting and availability hot paths and the admin changelists
+    against synthetic data. Everything runs in a transaction that is rolled back,
+    so the suite can be pointed at any database without leaving data behind.
+    Each result has the best and median wall time over repeat runs in milliseconds
+    and the number of queries made by one run.
+    """
+
+    def __init__(self, customers=1000, services=10, years=1, appointments_per_day=8, repeat=5, seed=1):
+        self.scale = {'customers': customers, 'services': services, 'years': years,
+                      'appointments_per_day': appointments_per_day}
+        self.repeat = repeat
+        self.synthetic_data_maker = SyntheticDataMaker(seed)
+        self.rng = random.Random(seed)
+        self.date_to = datetime.date(2019, 12, 31)
+        self.date_from = self.date_to.replace(year=self.date_to.year - years) + datetime.timedelta(days=1)
+
+    def measure(self, name, func):
+        with CaptureQueriesContext(connection) as context:
+            func()
+        num_of_queries = len(context.captured_queries)
+        timings = []
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return {'name': name,
+                'best_ms': round(min(timings), 3),
+                'median_ms': round(statistics.median(timings), 3),
+                'queries': num_of_queries}
+
+    def get_random_date(self):
+        return self.date_from + datetime.timedelta(days=self.rng.randrange((self.date_to - self.date_from).days + 1))
+
+    def get_benchmarks(self, customer_ids, service_ids):
+        request_factory = RequestFactory()
+        superuser = User.objects.create_superuser('bench', 'bench@example.com', None)
+        new_appointment_dates = iter(self.date_to + datetime.timedelta(days=days) for days in range(1, 10 ** 6))
+        month_from = self.date_to.replace(day=1)
+
+        def save_appointment():
+            appointment = Appointment(date=next(new_appointment_dates), start_time=datetime.time(hour=10),
+                                      customer_id=customer_ids[0])
+            appointment.save(services=service_ids[:2])
+
+        def check_clashes():
+            try:
+                check_no_appointment_clashes(None, self.get_random_date(), datetime.time(hour=12),
+                                             datetime.time(hour=13))
+            except ValidationError:
+                # A clash is an expected outcome of the check
+                pass
+
+        def changelist(model):
+            def view():
+                request = request_factory.get('/admin/')
+                request.user = superuser
+                admin.site._registry[model].changelist_view(request).render()
+            return view
+
+        return [
+            ('appointment_save', save_appointment),
+            ('check_no_appointment_clashes', check_clashes),
+            ('summary_report_all_dates', lambda: AppointmentReportMaker().get_appointment_summary_report()),
+            ('summary_report_month_from_appointments',
+             lambda: AppointmentReportMaker(date_from=month_from, date_to=self.date_to)
+             .get_appointment_summary_report()),
+            ('summary_report_month_from_daily_summaries',
+             lambda: DailySummaryReportMaker(date_from=month_from, date_to=self.date_to, page_size=31)
+             .get_appointment_summary_report()),
+            ('summary_report_month_cached',
+             lambda: CachedDailySummaryReportMaker(date_from=month_from, date_to=self.date_to, page_size=31)
+             .get_appointment_summary_report()),
+            ('time_slots_available_for_date',
+             lambda: TimeSlots(self.get_random_date()).get_time_slots_available_for_date()),
+            ('availability_month',
+             lambda: AvailabilityFinder(month_from, self.date_to).find_available_slots(75)),
+            ('appointment_changelist', changelist(Appointment)),
+            ('customer_changelist', changelist(Customer)),
+        ]
+
+    def run(self):
+        """
+        Runs the benchmarks in a transaction that is rolled back, with a private in-memory cache,
+        so neither the synthetic rows nor anything cached from them outlive the run
+        """
+        with override_settings(CACHES=BENCHMARK_CACHES):
+            cache.clear()
+            try:
+                return self.run_in_transaction()
+            finally:
+                # The catalogue may hold the rolled back services
+                service_catalogue.invalidate()
+                cache.clear()
+
+    def run_in_transaction(self):
+        results = []
+        started = time.perf_counter()
+        with transaction.atomic():
+            customer_ids = self.synthetic_data_maker.create_customers(self.scale['customers'])
+            service_ids = self.synthetic_data_maker.create_services(self.scale['services'])
+            num_of_appointments = self.synthetic_data_maker.create_appointments(
+                self.date_from, self.date_to, customer_ids, service_ids, self.scale['appointments_per_day'])
+            setup_seconds = round(time.perf_counter() - started, 3)
+            for name, func in self.get_benchmarks(customer_ids, service_ids):
+                results.append(self.measure(name, func))
+            transaction.set_rollback(True)
+        return {'django': django.get_version(),
+                'database': connection.vendor,
+                'scale': dict(self.scale, appointments=num_of_appointments),
+                'repeat': self.repeat,
+                'setup_seconds': setup_seconds,
+                'results': results}
+
+
+def compare_results(results, baseline):
+    """
+    Adds the baseline median and the ratio to it to each result with the same name
+    """
+    baseline_results = {result['name']: result for result in baseline.get('results', [])}
+    for result in results['results']:
+        baseline_result = baseline_results.get(result['name'])
+        if baseline_result is None:
+            continue
+        result['baseline_median_ms'] = baseline_result['median_ms']
+        result['baseline_queries'] = baseline_result['queries']
+        if baseline_result['median_ms']:
+            result['median_ratio'] = round(result['median_ms'] / baseline_result['median_ms'], 3)
+    return results
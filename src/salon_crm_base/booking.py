@@ -0,0 +1,94 @@
+from django.db import transaction
+from .models import (Appointment, BookingDateLock, DailySummaryMaker, check_no_appointment_clashes,
+                     check_no_appointment_clashes_for_appointments)
+from .utils import AppointmentUtil
+import datetime
+
+
+def lock_booking_dates(dates):
+    """
+    Locks the BookingDateLock rows for the given dates until the end of the current
+    transaction, creating any that are missing. See BookingDateLock.lock_dates.
+    """
+    return BookingDateLock.lock_dates(dates)
+
+
+def check_appointment_slot(appointment, service_ids):
+    """
+    Locks the appointment's date and checks that, with the given services, it does not
+    clash with another appointment. Call it inside a transaction, which keeps the date
+    locked until the appointment has been saved.
+    Raises ValidationError if the appointment clashes with another.
+    """
+    end_time = AppointmentUtil.for_service_ids(service_ids, appointment.start_time).end_time
+    # The date it is moved from is locked too, in the same ordered pass, as saving refreshes its summary
+    lock_booking_dates(sorted({appointment._loaded_date, appointment.date} - {None}))
+    check_no_appointment_clashes(appointment.id, appointment.date, appointment.start_time, end_time,
+                                 appointment.stylist)
+
+
+def save_appointment(appointment, services):
+    """
+    Saves a new or changed appointment with the given services (Service objects or ids)
+    once its date is locked and it is checked for clashes, as book_appointment does.
+    Raises ValidationError if the appointment clashes with another.
+    """
+    service_ids = [getattr(service, 'pk', service) for service in services]
+    with transaction.atomic():
+        check_appointment_slot(appointment, service_ids)
+        appointment.save(services=service_ids)
+    return appointment
+
+
+def book_appointment(customer, services, date, start_time, stylist=None):
+    """
+    Books the customer in for the services at the given date and start time.
+    services may be Service objects or ids.
+    The date is locked before the clash check, so two concurrent bookings of the same
+    slot cannot both pass the check and double book; bookings on other dates are not held up.
+    Raises ValidationError if the appointment clashes with another.
+    """
+    return save_appointment(Appointment(customer=customer, date=date, start_time=start_time, stylist=stylist),
+                            services)
+
+
+def book_recurring_series(customer, services, start_time, first_date, weeks, stylist=None):
+    """
+    Books the customer in for the same services and start time once a week
+    for the given number of weeks, starting on first_date.
+    services may be Service objects or ids.
+    The end time and quote are worked out once for the whole series from the service
+    catalogue and every date is checked for clashes in one pass before anything is written.
+    The appointments and their services are then inserted with one bulk insert each,
+    all in one transaction, so either the whole series is booked or none of it.
+    Every date in the series is locked for the clash check, as in book_appointment.
+    Raises ValidationError listing every clash.
+    """
+    service_ids = [getattr(service, 'pk', service) for service in services]
+    appointment_util = AppointmentUtil.for_service_ids(service_ids, start_time)
+    quote = appointment_util.get_quote() if appointment_util.end_time != start_time else 0
+    dates = [first_date + datetime.timedelta(weeks=week) for week in range(weeks)]
+    appointments = [Appointment(customer=customer,
+                                date=date,
+                                start_time=start_time,
+                                end_time=appointment_util.end_time,
+                                quote=quote,
+                                stylist=stylist) for date in dates]
+    with transaction.atomic():
+        lock_booking_dates(dates)
+        check_no_appointment_clashes_for_appointments(appointments)
+        appointments = Appointment.objects.bulk_create(appointments)
+        if any(appointment.pk is None for appointment in appointments):
+            # Not every database returns the ids of bulk inserted rows
+            appointments = list(Appointment.objects.filter(customer=customer,
+                                                           stylist=stylist,
+                                                           date__in=dates,
+                                                           start_time=start_time,
+                                                           end_time=appointment_util.end_time).order_by('date'))
+        appointment_services = Appointment.services.through
+        appointment_services.objects.bulk_create([appointment_services(appointment_id=appointment.pk,
+                                                                       service_id=service_id)
+                                                  for appointment in appointments
+                                                  for service_id in service_ids])
+        DailySummaryMaker().refresh_for_dates(dates)
+    return appointments
@@ -0,0 +1,32 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite backend for concurrent admin writers.
+    Two extra OPTIONS are read from the DATABASES setting:
+    init_pragmas is a dict of PRAGMAs run on every new connection, e.g. journal_mode=WAL,
+    synchronous=NORMAL, busy_timeout and mmap_size.
+    transaction_mode sets how transactions begin. With IMMEDIATE a transaction takes the
+    write lock when it starts, so a writer waits for busy_timeout instead of failing with
+    "database is locked" when its read lock cannot be upgraded.
+    """
+
+    def get_connection_params(self):
+        conn_params = super(DatabaseWrapper, self).get_connection_params()
+        conn_params.pop('init_pragmas', None)
+        conn_params.pop('transaction_mode', None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        conn = super(DatabaseWrapper, self).get_new_connection(conn_params)
+        for pragma, value in self.settings_dict['OPTIONS'].get('init_pragmas', {}).items():
+            conn.execute('PRAGMA {} = {}'.format(pragma, value))
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        transaction_mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        if transaction_mode:
+            self.cursor().execute('BEGIN {}'.format(transaction_mode))
+        else:
+            super(DatabaseWrapper, self)._start_transaction_under_autocommit()
@@ -0,0 +1,129 @@
+from abc import ABC, abstractmethod
+from django.core.serializers.json import DjangoJSONEncoder
+from .models import Appointment, Customer, DailySummary
+from .utils import service_catalogue
+import csv
+
+
+class Echo:
+    """
+    File-like object that returns what is written to it, so csv.writer
+    can produce one line at a time for a streaming response.
+    """
+
+    def write(self, value):
+        return value
+
+
+class Exporter(ABC):
+    """
+    Streams rows of a table as CSV or JSON in constant memory.
+    Subclasses set fields and provide iter_rows(), yielding tuples in the order of fields.
+    Rows are fetched with values_list in chunks of chunk_size rather than as model objects.
+    date_from and date_to limit exports of dated rows and are ignored otherwise.
+    Text cells of CSV exports that a spreadsheet would read as a formula are prefixed with '.
+    """
+    fields = ()
+    chunk_size = 2000
+    formula_prefixes = ('=', '+', '-', '@', '\t', '\r')
+
+    def __init__(self, date_from=None, date_to=None):
+        self.date_from = date_from
+        self.date_to = date_to
+
+    @abstractmethod
+    def iter_rows(self):
+        pass
+
+    def escape_csv_value(self, value):
+        if isinstance(value, str) and value.startswith(self.formula_prefixes):
+            return "'" + value
+        return value
+
+    def iter_csv(self):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.fields)
+        for row in self.iter_rows():
+            yield writer.writerow([self.escape_csv_value(value) for value in row])
+
+    def iter_json(self):
+        encoder = DjangoJSONEncoder()
+        separator = ''
+        yield '['
+        for row in self.iter_rows():
+            yield separator + encoder.encode(dict(zip(self.fields, row)))
+            separator = ',\n'
+        yield ']\n'
+
+    def iter_export(self, export_format):
+        if export_format == 'json':
+            return self.iter_json()
+        return self.iter_csv()
+
+
+class CustomerExporter(Exporter):
+    fields = ('id', 'title', 'first_name', 'last_name', 'phone_no', 'email', 'active',
+              'date_activated', 'date_deactivated', 'address_line_1', 'address_line_2', 'address_line_3',
+              'town', 'county', 'postcode', 'phone_is_contactable', 'SMS_is_contactable', 'email_is_contactable')
+
+    def iter_rows(self):
+        return Customer.objects.order_by('id').values_list(*self.fields).iterator(chunk_size=self.chunk_size)
+
+
+class AppointmentExporter(Exporter):
+    """
+    Appointments are read in id order, chunk_size at a time, and the services of
+    each chunk are looked up with one query on the services table, with the
+    service names taken from the service catalogue.
+    """
+    appointment_fields = ('id', 'date', 'start_time', 'end_time', 'quote', 'date_paid',
+                          'customer_id', 'stylist_id')
+    fields = appointment_fields + ('services',)
+
+    def get_appointments(self):
+        appointments = Appointment.objects.all()
+        if self.date_from is not None:
+            appointments = appointments.filter(date__gte=self.date_from)
+        if self.date_to is not None:
+            appointments = appointments.filter(date__lte=self.date_to)
+        return appointments.order_by('id').values_list(*self.appointment_fields)
+
+    def get_service_names_by_appointment(self, appointment_ids):
+        appointment_services = Appointment.services.through.objects.filter(appointment_id__in=appointment_ids) \
+            .order_by('appointment_id', 'service_id').values_list('appointment_id', 'service_id')
+        service_ids_by_appointment = {}
+        for appointment_id, service_id in appointment_services:
+            service_ids_by_appointment.setdefault(appointment_id, []).append(service_id)
+        return {appointment_id: "; ".join(service.service or '' for service in
+                                          service_catalogue.get_services(service_ids))
+                for appointment_id, service_ids in service_ids_by_appointment.items()}
+
+    def iter_rows(self):
+        last_id = 0
+        while True:
+            rows = list(self.get_appointments().filter(id__gt=last_id)[:self.chunk_size])
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            service_names = self.get_service_names_by_appointment([row[0] for row in rows])
+            for row in rows:
+                yield row + (service_names.get(row[0], ''),)
+
+
+class AppointmentSummaryExporter(Exporter):
+    fields = ('date', 'count', 'paid_income', 'forecasted_income', 'booked_minutes', 'time_slots_available')
+
+    def iter_rows(self):
+        daily_summaries = DailySummary.objects.all()
+        if self.date_from is not None:
+            daily_summaries = daily_summaries.filter(date__gte=self.date_from)
+        if self.date_to is not None:
+            daily_summaries = daily_summaries.filter(date__lte=self.date_to)
+        return daily_summaries.order_by('date').values_list(*self.fields).iterator(chunk_size=self.chunk_size)
+
+
+EXPORTERS = {
+    'customers': CustomerExporter,
+    'appointments': AppointmentExporter,
+    'appointment_summary': AppointmentSummaryExporter,
+}
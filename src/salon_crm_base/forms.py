@@ -1 +1,155 @@
+from django import forms
 from django.forms import ModelForm
+from . import booking
+from .models import Appointment, Service, Stylist
+from .schedule import AppointmentCalendar
+import calendar
+import datetime
+
+
+class AppointmentSummaryReportFilterForm(forms.Form):
+    """
+    Validates the date range and keyset pagination parameters
+    of the appointment summary report. The report defaults to the current month.
+    """
+    DEFAULT_PAGE_SIZE = 31
+    MAX_PAGE_SIZE = 366
+
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    page_size = forms.IntegerField(required=False, min_value=1, max_value=MAX_PAGE_SIZE)
+    after = forms.DateField(required=False, widget=forms.HiddenInput)
+
+    def clean(self):
+        cleaned_data = super(AppointmentSummaryReportFilterForm, self).clean()
+        date_from = cleaned_data.get('date_from')
+        date_to = cleaned_data.get('date_to')
+        if date_from is not None and date_to is not None and date_from > date_to:
+            raise forms.ValidationError('Please ensure the from date is not after the to date')
+        return cleaned_data
+
+    def get_report_filters(self, today=None):
+        today = today or datetime.date.today()
+        month_start = today.replace(day=1)
+        month_end = today.replace(day=calendar.monthrange(today.year, today.month)[1])
+        cleaned_data = self.cleaned_data if self.is_valid() else {}
+        date_from = cleaned_data.get('date_from')
+        date_to = cleaned_data.get('date_to')
+        if date_from is None and date_to is None:
+            date_from, date_to = month_start, month_end
+        return {'date_from': date_from,
+                'date_to': date_to,
+                'after': cleaned_data.get('after'),
+                'page_size': cleaned_data.get('page_size') or self.DEFAULT_PAGE_SIZE}
+
+
+class RevenueAnalyticsFilterForm(forms.Form):
+    """
+    Validates the month range of the revenue analytics report.
+    The report defaults to the twelve months up to and including the current month.
+    """
+    DEFAULT_NUM_OF_MONTHS = 12
+    MAX_NUM_OF_MONTHS = 60
+
+    month_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    month_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+
+    def clean(self):
+        cleaned_data = super(RevenueAnalyticsFilterForm, self).clean()
+        month_from = cleaned_data.get('month_from')
+        month_to = cleaned_data.get('month_to')
+        if month_from is not None and month_to is not None:
+            if month_from > month_to:
+                raise forms.ValidationError('Please ensure the from month is not after the to month')
+            if (month_to.year - month_from.year) * 12 + month_to.month - month_from.month >= self.MAX_NUM_OF_MONTHS:
+                raise forms.ValidationError('Please select at most {} months'.format(self.MAX_NUM_OF_MONTHS))
+        return cleaned_data
+
+    @staticmethod
+    def get_months_before(month, num_of_months):
+        month_index = month.year * 12 + month.month - 1 - num_of_months
+        return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+    def get_report_filters(self, today=None):
+        """
+        The range is capped at MAX_NUM_OF_MONTHS after month_to defaults to today,
+        as clean() can only check it when both months are given
+        """
+        today = today or datetime.date.today()
+        cleaned_data = self.cleaned_data if self.is_valid() else {}
+        month_to = (cleaned_data.get('month_to') or today).replace(day=1)
+        month_from = cleaned_data.get('month_from') or \
+            self.get_months_before(month_to, self.DEFAULT_NUM_OF_MONTHS - 1)
+        month_from = max(month_from.replace(day=1), self.get_months_before(month_to, self.MAX_NUM_OF_MONTHS - 1))
+        return {'month_from': month_from, 'month_to': month_to}
+
+
+class AvailableTimeSlotsSearchForm(forms.Form):
+    """
+    Validates a search for the next free time slots long enough for the selected services
+    """
+    services = forms.ModelMultipleChoiceField(queryset=Service.objects.order_by('service'))
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    weeks = forms.IntegerField(initial=4, min_value=1, max_value=26, required=False)
+    limit = forms.IntegerField(initial=10, min_value=1, max_value=100, required=False)
+
+
+class ExportForm(forms.Form):
+    """
+    Validates the format and optional date range of a data export
+    """
+    FORMATS = (('csv', 'CSV'), ('json', 'JSON'))
+
+    format = forms.ChoiceField(choices=FORMATS, required=False)
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
+
+
+class OutstandingPaymentsForm(forms.Form):
+    """
+    Validates the date the outstanding payments ledger is aged from, an optional customer and the format
+    """
+    FORMATS = (('html', 'HTML'), ('json', 'JSON'))
+
+    as_of = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    customer = forms.IntegerField(required=False, min_value=1, widget=forms.HiddenInput)
+    format = forms.ChoiceField(choices=FORMATS, required=False, widget=forms.HiddenInput)
+
+
+class AppointmentCalendarForm(forms.Form):
+    """
+    Validates the date, day or week view and optional stylist of the appointment calendar,
+    which defaults to this week for all stylists
+    """
+    date = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    view = forms.ChoiceField(choices=AppointmentCalendar.VIEWS, required=False)
+    stylist = forms.ModelChoiceField(queryset=Stylist.objects.order_by('name'), required=False)
+
+    def get_calendar_filters(self, today=None):
+        cleaned_data = self.cleaned_data if self.is_valid() else {}
+        return {'date': cleaned_data.get('date') or today or datetime.date.today(),
+                'view': cleaned_data.get('view') or 'week',
+                'stylist': cleaned_data.get('stylist')}
+
+
+class AppointmentAdminForm(ModelForm):
+    """
+    Appointment admin form that rejects appointments clashing with another.
+    The admin validates and saves a change form in one transaction, so the date locked
+    for the clash check stays locked until the appointment is saved and two terminals
+    cannot book the same slot.
+    """
+
+    class Meta:
+        model = Appointment
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super(AppointmentAdminForm, self).clean()
+        if self.errors or cleaned_data.get('date') is None or cleaned_data.get('start_time') is None:
+            return cleaned_data
+        appointment = Appointment(id=self.instance.id, date=cleaned_data['date'],
+                                  start_time=cleaned_data['start_time'], stylist=cleaned_data.get('stylist'))
+        appointment._loaded_date = self.instance._loaded_date
+        booking.check_appointment_slot(appointment, [service.pk for service in cleaned_data.get('services') or ()])
+        return cleaned_data
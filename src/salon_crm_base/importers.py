@@ -0,0 +1,125 @@
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from .models import Customer, CustomerSearchIndex
+import csv
+
+BOOLEAN_TRUE_VALUES = {'1', 'true', 't', 'yes', 'y'}
+BOOLEAN_FALSE_VALUES = {'0', 'false', 'f', 'no', 'n'}
+
+
+class CustomerImporter:
+    """
+    Imports customers from CSV rows with a header of Customer field names,
+    e.g. first_name, last_name, email, phone_no, postcode.
+    Rows are read one at a time, normalised and validated with the same
+    rules as the Customer admin form, and written with bulk inserts of
+    batch_size rows, each batch in its own transaction.
+    Emails already in the database or earlier in the file are skipped.
+    A bad row is recorded in errors as (line number, message) and the import carries on.
+    """
+    text_fields = ('title', 'first_name', 'last_name', 'phone_no', 'email',
+                   'address_line_1', 'address_line_2', 'address_line_3', 'town', 'county', 'postcode')
+    boolean_fields = ('active', 'phone_is_contactable', 'SMS_is_contactable', 'email_is_contactable')
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.num_of_created = 0
+        self.num_of_duplicates = 0
+        self.errors = []
+        self.emails = None
+
+    def load_existing_emails(self):
+        return {email.lower() for email in Customer.objects.values_list('email', flat=True).iterator()}
+
+    def iter_rows(self, csv_file):
+        """
+        Yields (line number, row dict) for each row of the file
+        """
+        reader = csv.DictReader(csv_file)
+        for row in reader:
+            yield reader.line_num, row
+
+    def parse_boolean(self, field_name, value):
+        value = value.strip().lower()
+        if value in BOOLEAN_TRUE_VALUES:
+            return True
+        if value in BOOLEAN_FALSE_VALUES:
+            return False
+        raise ValidationError('Please ensure {} is yes or no'.format(field_name))
+
+    def make_customer(self, row):
+        customer = Customer()
+        for field_name in self.text_fields:
+            value = (row.get(field_name) or '').strip()
+            if not value and Customer._meta.get_field(field_name).null:
+                value = None
+            setattr(customer, field_name, value)
+        for field_name in self.boolean_fields:
+            value = row.get(field_name) or ''
+            if value.strip():
+                setattr(customer, field_name, self.parse_boolean(field_name, value))
+        customer.full_clean(validate_unique=False)
+        customer.update_customer_active_status()
+        return customer
+
+    def iter_customers(self, rows):
+        """
+        Yields the valid customers not already imported, recording errors for the rest
+        """
+        for line_num, row in rows:
+            try:
+                customer = self.make_customer(row)
+            except ValidationError as error:
+                self.errors.append((line_num, "; ".join(error.messages)))
+                continue
+            except (TypeError, ValueError) as error:
+                # A value the validators did not expect skips the row rather than ending the import
+                self.errors.append((line_num, str(error)))
+                continue
+            if customer.email in self.emails:
+                self.num_of_duplicates += 1
+                continue
+            self.emails.add(customer.email)
+            yield line_num, customer
+
+    def create_customers(self, customers):
+        """
+        Inserts the customers and adds them to the customer search index
+        """
+        customers = Customer.objects.bulk_create(customers)
+        if any(customer.pk is None for customer in customers):
+            # Not every database returns the ids of bulk inserted rows
+            ids_by_email = dict(Customer.objects.filter(email__in=[customer.email for customer in customers])
+                                .values_list('email', 'id'))
+            for customer in customers:
+                customer.pk = ids_by_email[customer.email]
+        CustomerSearchIndex().index_customers(customers)
+
+    def save_batch(self, batch):
+        try:
+            with transaction.atomic():
+                self.create_customers([customer for _, customer in batch])
+            self.num_of_created += len(batch)
+        except IntegrityError:
+            # e.g. a customer added elsewhere during the import; find which rows fail
+            for line_num, customer in batch:
+                customer.pk = None
+                try:
+                    with transaction.atomic():
+                        self.create_customers([customer])
+                    self.num_of_created += 1
+                except IntegrityError as error:
+                    self.errors.append((line_num, str(error)))
+
+    def import_customers(self, csv_file):
+        if self.emails is None:
+            self.emails = self.load_existing_emails()
+        batch = []
+        for line_num, customer in self.iter_customers(self.iter_rows(csv_file)):
+            batch.append((line_num, customer))
+            if len(batch) >= self.batch_size:
+                self.save_batch(batch)
+                batch = []
+        if batch:
+            self.save_batch(batch)
+        return self.num_of_created
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from salon_crm_base.benchmarks import BenchmarkSuite, compare_results
+import json
+
+
+class Command(BaseCommand):
+    help = ("Benchmarks booking, reporting, availability and the admin changelists against "
+            "synthetic data and writes the timings and query counts as JSON. Changes are rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=1000)
+        parser.add_argument('--services', type=int, default=10)
+        parser.add_argument('--years', type=int, default=1)
+        parser.add_argument('--appointments-per-day', type=int, default=8)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', default=None, help="Path of the JSON file to write, by default stdout")
+        parser.add_argument('--compare', default=None, help="Path of an earlier JSON output to compare against")
+
+    def handle(self, *args, **options):
+        benchmark_suite = BenchmarkSuite(customers=options['customers'],
+                                         services=options['services'],
+                                         years=options['years'],
+                                         appointments_per_day=options['appointments_per_day'],
+                                         repeat=options['repeat'],
+                                         seed=options['seed'])
+        results = benchmark_suite.run()
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                results = compare_results(results, json.load(baseline_file))
+        output = json.dumps(results, indent=2)
+        if options['output'] is None:
+            self.stdout.write(output)
+            return
+        with open(options['output'], 'w') as output_file:
+            output_file.write(output + "\n")
@@ -0,0 +1,58 @@
+from django.contrib import admin
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from salon_crm_base.benchmarks import SyntheticDataMaker
+from salon_crm_base.models import Customer, CustomerSearchIndex
+import json
+import time
+
+
+class Command(BaseCommand):
+    help = ("Times the customer admin search with the search index against the default "
+            "icontains search over synthetic customers. Changes are rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def time_search(self, search, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            queryset = search()
+            queryset.count()
+            list(queryset[:100])
+            timings.append((time.perf_counter() - started) * 1000)
+        return round(min(timings), 3)
+
+    def handle(self, *args, **options):
+        synthetic_data_maker = SyntheticDataMaker(options['seed'])
+        customer_admin = admin.site._registry[Customer]
+        customer_search_index = CustomerSearchIndex()
+        results = []
+        with transaction.atomic():
+            synthetic_data_maker.create_customers(options['customers'])
+            sample = Customer.objects.order_by('?').first()
+            search_terms = {
+                'name_prefix': sample.last_name[:4],
+                'full_name': "{} {}".format(sample.first_name, sample.last_name),
+                'email_prefix': sample.email.split('@')[0],
+                'phone_no': sample.phone_no,
+                'postcode': sample.postcode,
+            }
+            queryset = Customer.objects.all()
+            for name, search_term in search_terms.items():
+                results.append({
+                    'search': name,
+                    'search_term': search_term,
+                    'customers': options['customers'],
+                    'icontains_ms': self.time_search(
+                        lambda: admin.ModelAdmin.get_search_results(customer_admin, None, queryset,
+                                                                    search_term)[0],
+                        options['repeat']),
+                    'search_index_ms': self.time_search(
+                        lambda: customer_search_index.search(queryset, search_term), options['repeat']),
+                })
+            transaction.set_rollback(True)
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from salon_crm_base.models import CustomerActivation
+
+
+class Command(BaseCommand):
+    help = ("Deactivates active customers with no appointment in the last N months "
+            "with one UPDATE, setting date_deactivated to today")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=18,
+                            help="Customers without an appointment for this many months are deactivated")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the customers that would be deactivated")
+
+    def handle(self, *args, **options):
+        customer_activation = CustomerActivation()
+        if options['dry_run']:
+            num_of_customers = customer_activation.get_lapsed_customers(options['months']).count()
+            self.stdout.write("Would deactivate {} customers".format(num_of_customers))
+            return
+        num_of_customers = customer_activation.deactivate_lapsed(options['months'])
+        self.stdout.write("Deactivated {} customers".format(num_of_customers))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from salon_crm_base.exporters import EXPORTERS
+import datetime
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+
+
+class Command(BaseCommand):
+    help = "Exports customers, appointments or the appointment summary as CSV or JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('export_name', choices=sorted(EXPORTERS))
+        parser.add_argument('--format', choices=('csv', 'json'), default='csv')
+        parser.add_argument('--output', default=None, help="Path of the file to write, by default stdout")
+        parser.add_argument('--date-from', type=parse_date, default=None,
+                            help="First date to export, as YYYY-MM-DD")
+        parser.add_argument('--date-to', type=parse_date, default=None,
+                            help="Last date to export, as YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+        exporter = EXPORTERS[options['export_name']](date_from=options['date_from'], date_to=options['date_to'])
+        if options['output'] is None:
+            for chunk in exporter.iter_export(options['format']):
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output_file:
+            for chunk in exporter.iter_export(options['format']):
+                output_file.write(chunk)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from salon_crm_base.importers import CustomerImporter
+import sys
+
+
+class Command(BaseCommand):
+    help = "Imports customers from a CSV file with a header row of customer field names"
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help="Path of the CSV file, or - to read from stdin")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Number of customers to insert per transaction")
+
+    def handle(self, *args, **options):
+        customer_importer = CustomerImporter(batch_size=options['batch_size'])
+        if options['csv_file'] == '-':
+            customer_importer.import_customers(sys.stdin)
+        else:
+            with open(options['csv_file'], newline='', encoding='utf-8-sig') as csv_file:
+                customer_importer.import_customers(csv_file)
+        for line_num, message in customer_importer.errors:
+            self.stderr.write("Line {}: {}".format(line_num, message))
+        self.stdout.write("Imported {} customers, skipped {} duplicate emails, {} rows with errors".format(
+            customer_importer.num_of_created, customer_importer.num_of_duplicates, len(customer_importer.errors)))
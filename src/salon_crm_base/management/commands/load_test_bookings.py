@@ -0,0 +1,89 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from salon_crm_base.booking import book_appointment
+from salon_crm_base.models import Appointment, Customer, Service, find_appointment_clashes
+import datetime
+import json
+import random
+import threading
+import time
+import uuid
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+
+
+class Command(BaseCommand):
+    help = ("Books random slots from several threads at once through book_appointment and reports "
+            "bookings per second and any double bookings as JSON. The test customer, service and "
+            "their appointments are deleted afterwards unless --keep is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--bookings-per-thread', type=int, default=25)
+        parser.add_argument('--dates', type=int, default=3,
+                            help="Number of dates the bookings are spread over; fewer dates means more clashes")
+        parser.add_argument('--first-date', type=parse_date, default=None,
+                            help="First date to book, as YYYY-MM-DD. Defaults to ten years from today")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--keep', action='store_true', help="Keep the test customer and appointments")
+
+    def book(self, thread_num, options, customer, service, dates, results):
+        rng = random.Random(options['seed'] + thread_num)
+        num_of_booked = num_of_clashes = 0
+        errors = []
+        try:
+            for _ in range(options['bookings_per_thread']):
+                minutes = 9 * 60 + 15 * rng.randrange(30)
+                try:
+                    book_appointment(customer, [service], rng.choice(dates),
+                                     datetime.time(minutes // 60, minutes % 60))
+                    num_of_booked += 1
+                except ValidationError:
+                    num_of_clashes += 1
+                except Exception as exception:
+                    errors.append(repr(exception))
+        finally:
+            connection.close()
+            results[thread_num] = (num_of_booked, num_of_clashes, errors)
+
+    def handle(self, *args, **options):
+        first_date = options['first_date'] or datetime.date.today() + datetime.timedelta(days=3650)
+        dates = [first_date + datetime.timedelta(days=days) for days in range(options['dates'])]
+        customer = Customer.objects.create(first_name='load', last_name='test',
+                                           email='load.test.{}@example.com'.format(uuid.uuid4().hex))
+        service = Service.objects.create(service='load test', price=10, estimated_minutes=30)
+        results = [None] * options['threads']
+        threads = [threading.Thread(target=self.book, args=(thread_num, options, customer, service, dates, results))
+                   for thread_num in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - started
+        num_of_booked = sum(result[0] for result in results)
+        num_of_attempts = options['threads'] * options['bookings_per_thread']
+        errors = [error for result in results for error in result[2]]
+        double_bookings = find_appointment_clashes(list(Appointment.objects.filter(customer=customer)))
+        report = {'database': connection.vendor,
+                  'threads': options['threads'],
+                  'dates': options['dates'],
+                  'attempts': num_of_attempts,
+                  'booked': num_of_booked,
+                  'clashes': sum(result[1] for result in results),
+                  'errors': len(errors),
+                  'seconds': round(seconds, 3),
+                  'bookings_per_second': round(num_of_booked / seconds, 1),
+                  'attempts_per_second': round(num_of_attempts / seconds, 1),
+                  'double_bookings': len(double_bookings)}
+        if not options['keep']:
+            customer.delete()
+            service.delete()
+        self.stdout.write(json.dumps(report, indent=2))
+        for error in errors[:5]:
+            self.stderr.write(error)
+        if errors or double_bookings:
+            raise CommandError("{} errors and {} double bookings".format(len(errors), len(double_bookings)))
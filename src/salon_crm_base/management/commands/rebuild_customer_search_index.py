@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from salon_crm_base.models import CustomerSearchIndex
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the customer search index used by the customer admin search"
+
+    def handle(self, *args, **options):
+        num_of_customers = CustomerSearchIndex().rebuild()
+        self.stdout.write("Indexed {} customers".format(num_of_customers))
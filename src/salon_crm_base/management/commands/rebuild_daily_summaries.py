@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from salon_crm_base.models import DailySummaryMaker
+import datetime
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+
+
+class Command(BaseCommand):
+    help = ("Rebuilds the DailySummary table used by the appointment summary report from appointments. "
+            "Run after upgrading, so stored summaries use the current free time slot format")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-from', type=parse_date, default=None,
+                            help="First date to rebuild, as YYYY-MM-DD")
+        parser.add_argument('--date-to', type=parse_date, default=None,
+                            help="Last date to rebuild, as YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+        num_of_summaries = DailySummaryMaker().rebuild(date_from=options['date_from'],
+                                                       date_to=options['date_to'])
+        self.stdout.write("Rebuilt {} daily summaries".format(num_of_summaries))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from salon_crm_base.reminders import ReminderDispatcher, get_reminder_backend
+import datetime
+import json
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+
+
+class Command(BaseCommand):
+    help = ("Sends reminders for the appointments on a date, tomorrow by default, to customers "
+            "who can be contacted by email or SMS. Reminders already sent are skipped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=parse_date, default=None,
+                            help="Date of the appointments to remind, as YYYY-MM-DD")
+        parser.add_argument('--backend', default=None,
+                            help="Dotted path of the reminder backend, by default settings.REMINDER_BACKEND")
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--max-attempts', type=int, default=3)
+
+    def handle(self, *args, **options):
+        reminder_dispatcher = ReminderDispatcher(backend=get_reminder_backend(options['backend']),
+                                                 date=options['date'],
+                                                 batch_size=options['batch_size'],
+                                                 max_workers=options['workers'],
+                                                 max_attempts=options['max_attempts'])
+        results = reminder_dispatcher.dispatch()
+        self.stdout.write(json.dumps(results))
+        if results['failed']:
+            raise CommandError("{} reminders could not be sent".format(results['failed']))
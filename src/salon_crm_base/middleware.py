@@ -0,0 +1,121 @@
+from django.conf import settings
+from django.db import connection
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper that records the SQL and duration in milliseconds of each query
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, (time.perf_counter() - started) * 1000))
+
+    def get_db_ms(self):
+        return sum(duration for sql, duration in self.queries)
+
+    def get_top_queries(self, num_of_queries):
+        return sorted(self.queries, key=lambda query: query[1], reverse=True)[:num_of_queries]
+
+
+class RequestStats:
+    """
+    Aggregates request count, wall time, query count and database time per view.
+    Stats are kept in memory, so each server process has its own.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats_by_view = {}
+
+    def record(self, view_name, wall_ms, num_of_queries, db_ms):
+        with self.lock:
+            view_stats = self.stats_by_view.setdefault(view_name, {
+                'requests': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'queries': 0, 'max_queries': 0, 'db_ms': 0.0})
+            view_stats['requests'] += 1
+            view_stats['total_ms'] += wall_ms
+            view_stats['max_ms'] = max(view_stats['max_ms'], wall_ms)
+            view_stats['queries'] += num_of_queries
+            view_stats['max_queries'] = max(view_stats['max_queries'], num_of_queries)
+            view_stats['db_ms'] += db_ms
+
+    def get_stats(self):
+        with self.lock:
+            stats = []
+            for view_name, view_stats in sorted(self.stats_by_view.items()):
+                num_of_requests = view_stats['requests']
+                stats.append({'view': view_name,
+                              'requests': num_of_requests,
+                              'mean_ms': round(view_stats['total_ms'] / num_of_requests, 3),
+                              'max_ms': round(view_stats['max_ms'], 3),
+                              'mean_queries': round(view_stats['queries'] / num_of_requests, 2),
+                              'max_queries': view_stats['max_queries'],
+                              'mean_db_ms': round(view_stats['db_ms'] / num_of_requests, 3),
+                              'total_ms': round(view_stats['total_ms'], 3)})
+            return stats
+
+    def reset(self):
+        with self.lock:
+            self.stats_by_view = {}
+
+
+request_stats = RequestStats()
+
+
+class RequestTimingMiddleware:
+    """
+    Records wall time, query count and database time for each request against its view,
+    adds them to the response as a Server-Timing header for staff users or when DEBUG is on,
+    and logs requests slower than
+    settings.SLOW_REQUEST_MS with their slowest queries.
+    For streaming responses only the time to build the response is measured.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        query_recorder = QueryRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(query_recorder):
+            response = self.get_response(request)
+        wall_ms = (time.perf_counter() - started) * 1000
+        db_ms = query_recorder.get_db_ms()
+        view_name = self.get_view_name(request)
+        request_stats.record(view_name, wall_ms, len(query_recorder.queries), db_ms)
+        if self.show_server_timing(request):
+            response['Server-Timing'] = 'total;dur={:.1f}, db;dur={:.1f};desc="{} queries"'.format(
+                wall_ms, db_ms, len(query_recorder.queries))
+        if wall_ms >= getattr(settings, 'SLOW_REQUEST_MS', 500):
+            logger.warning("Slow request %s %s (%s): %.1f ms, %d queries, %.1f ms in database\n%s",
+                           request.method, request.path, view_name, wall_ms, len(query_recorder.queries), db_ms,
+                           "\n".join("  {:.1f} ms: {}".format(duration, sql)
+                                     for sql, duration in query_recorder.get_top_queries(
+                                         getattr(settings, 'SLOW_REQUEST_TOP_QUERIES', 5))))
+        return response
+
+    @staticmethod
+    def show_server_timing(request):
+        # Backend timings are only shown to staff, or to anyone when DEBUG is on
+        if settings.DEBUG:
+            return True
+        user = getattr(request, 'user', None)
+        return user is not None and user.is_staff
+
+    @staticmethod
+    def get_view_name(request):
+        resolver_match = getattr(request, 'resolver_match', None)
+        if resolver_match is None:
+            return '<unresolved>'
+        return resolver_match.view_name or resolver_match._func_path
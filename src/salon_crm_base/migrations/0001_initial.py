@@ -0,0 +1,100 @@
+# Generated by Django 2.1.7 on 2026-10-18 13:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Appointment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('date', models.DateField(null=True)),
+                ('start_time', models.TimeField(null=True)),
+                ('end_time', models.TimeField(null=True)),
+                ('quote', models.FloatField(blank=True, default=0, null=True)),
+                ('date_paid', models.DateField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-date', 'start_time'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Customer',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(blank=True, max_length=35, null=True)),
+                ('first_name', models.CharField(max_length=35)),
+                ('last_name', models.CharField(max_length=35)),
+                ('phone_no', models.CharField(blank=True, max_length=14, null=True)),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('active', models.BooleanField(blank=True, default=True)),
+                ('date_activated', models.DateField(auto_now_add=True, null=True)),
+                ('date_deactivated', models.DateField(blank=True, null=True)),
+                ('address_line_1', models.CharField(blank=True, max_length=35, null=True)),
+                ('address_line_2', models.CharField(blank=True, max_length=35, null=True)),
+                ('address_line_3', models.CharField(blank=True, max_length=35, null=True)),
+                ('town', models.CharField(blank=True, max_length=35, null=True)),
+                ('county', models.CharField(blank=True, max_length=35, null=True)),
+                ('postcode', models.CharField(blank=True, max_length=8, null=True)),
+                ('phone_is_contactable', models.BooleanField(default=False)),
+                ('SMS_is_contactable', models.BooleanField(default=False)),
+                ('email_is_contactable', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailySummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('forecasted_income', models.FloatField(default=0)),
+                ('paid_income', models.FloatField(default=0)),
+                ('booked_minutes', models.PositiveIntegerField(default=0)),
+                ('time_slots_available', models.CharField(blank=True, max_length=255)),
+            ],
+            options={
+                'verbose_name_plural': 'daily summaries',
+                'ordering': ['date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Service',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service', models.CharField(blank=True, max_length=35, null=True)),
+                ('price', models.IntegerField(blank=True, null=True)),
+                ('estimated_minutes', models.PositiveIntegerField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='customer',
+            unique_together={('first_name', 'last_name', 'email')},
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='customer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='salon_crm_base.Customer'),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='services',
+            field=models.ManyToManyField(blank=True, to='salon_crm_base.Service'),
+        ),
+    ]
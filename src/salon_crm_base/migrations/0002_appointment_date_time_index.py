@@ -0,0 +1,17 @@
+# Generated by Django 2.1.7 on 2026-10-18 13:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon_crm_base', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['date', 'start_time', 'end_time'], name='appointment_date_time_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.1.7 on 2026-10-18 13:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon_crm_base', '0003_stylists_and_opening_hours'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerSearchToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('name', 'Name'), ('email', 'Email'), ('phone', 'Phone'), ('postcode', 'Postcode')], max_length=8)),
+                ('token', models.CharField(max_length=254)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='salon_crm_base.Customer')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='customersearchtoken',
+            index=models.Index(fields=['kind', 'token'], name='customer_search_token_idx'),
+        ),
+    ]
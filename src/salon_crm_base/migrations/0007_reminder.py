@@ -0,0 +1,28 @@
+# Generated by Django 2.1.7 on 2026-10-18 13:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon_crm_base', '0006_booking_date_lock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reminder',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel', models.CharField(choices=[('email', 'Email'), ('sms', 'SMS')], max_length=5)),
+                ('recipient', models.CharField(max_length=254)),
+                ('date_sent', models.DateTimeField(auto_now_add=True)),
+                ('appointment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='salon_crm_base.Appointment')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='reminder',
+            unique_together={('appointment', 'channel')},
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.1.7 on 2026-10-18 13:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon_crm_base', '0007_reminder'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appointment_date_paid_idx',
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['date_paid', 'customer', 'date', 'quote'], name='appointment_unpaid_idx'),
+        ),
+    ]
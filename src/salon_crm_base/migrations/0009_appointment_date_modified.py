@@ -0,0 +1,18 @@
+# Generated by Django 2.1.7 on 2026-10-18 13:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon_crm_base', '0008_appointment_unpaid_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='date_modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
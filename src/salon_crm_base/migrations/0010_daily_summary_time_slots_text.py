@@ -0,0 +1,18 @@
+# Generated by Django 2.1.7 on 2026-10-18 13:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon_crm_base', '0009_appointment_date_modified'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dailysummary',
+            name='time_slots_available',
+            field=models.TextField(blank=True),
+        ),
+    ]
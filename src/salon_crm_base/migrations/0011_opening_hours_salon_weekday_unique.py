@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    unique_together on (stylist, weekday) does not stop two salon rows,
+    with a null stylist, for the same weekday, so those get a partial unique index
+    """
+
+    dependencies = [
+        ('salon_crm_base', '0010_daily_summary_time_slots_text'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            ['CREATE UNIQUE INDEX "openinghours_salon_weekday_uniq" '
+             'ON "salon_crm_base_openinghours" ("weekday") WHERE "stylist_id" IS NULL'],
+            ['DROP INDEX "openinghours_salon_weekday_uniq"'],
+        ),
+    ]
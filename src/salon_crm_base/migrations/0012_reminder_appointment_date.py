@@ -0,0 +1,32 @@
+# Generated by Django 2.1.7 on 2026-10-18 13:54
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def set_appointment_dates(apps, schema_editor):
+    # Reminders already sent were for the date their appointment is on now
+    Appointment = apps.get_model('salon_crm_base', 'Appointment')
+    Reminder = apps.get_model('salon_crm_base', 'Reminder')
+    Reminder.objects.update(appointment_date=Subquery(
+        Appointment.objects.filter(id=OuterRef('appointment_id')).values('date')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon_crm_base', '0011_opening_hours_salon_weekday_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reminder',
+            name='appointment_date',
+            field=models.DateField(null=True),
+        ),
+        migrations.RunPython(set_appointment_dates, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='reminder',
+            unique_together={('appointment', 'appointment_date', 'channel')},
+        ),
+    ]
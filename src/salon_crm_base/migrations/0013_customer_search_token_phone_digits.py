@@ -0,0 +1,18 @@
+# Generated by Django 2.1.7 on 2026-10-18 14:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon_crm_base', '0012_reminder_appointment_date'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customersearchtoken',
+            name='kind',
+            field=models.CharField(choices=[('name', 'Name'), ('email', 'Email'), ('phone', 'Phone'), ('digits', 'Phone digits'), ('postcode', 'Postcode')], max_length=8),
+        ),
+    ]
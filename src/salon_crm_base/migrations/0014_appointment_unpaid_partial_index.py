@@ -0,0 +1,26 @@
+# Generated by Django 2.1.7 on 2026-10-18 14:13
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Replaces the full composite appointment_unpaid_idx with a partial index over
+    the unpaid appointments only, which the outstanding payments ledger reads
+    """
+
+    dependencies = [
+        ('salon_crm_base', '0013_customer_search_token_phone_digits'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appointment_unpaid_idx',
+        ),
+        migrations.RunSQL(
+            ['CREATE INDEX "appointment_unpaid_idx" '
+             'ON "salon_crm_base_appointment" ("customer_id", "date", "quote") WHERE "date_paid" IS NULL'],
+            ['DROP INDEX "appointment_unpaid_idx"'],
+        ),
+    ]
@@ -1,11 +1,19 @@
-from django.db import models
+from django.core.cache import cache
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
 from django.contrib.auth.models import User
+import calendar
 import datetime
+import time
 from collections import defaultdict
-from .utils import AppointmentUtil
+from itertools import groupby
+from operator import itemgetter
+from .utils import AppointmentUtil, format_minutes, time_to_minutes
 import re
 from django.core.exceptions import ValidationError
 
+UK_POSTCODE_RULE_1 = re.compile(r"[A-Z]{1,2}\d{1,2} \d[A-Z]{1,2}")
+
 
 # Create your models here.
 class UserProfile(models.Model):
@@ -39,10 +47,16 @@ class Customer(models.Model):
 
     class Meta:
         unique_together = (('first_name', 'last_name', 'email'))
+        indexes = [
+            models.Index(fields=['last_name', 'first_name'], name='customer_name_idx'),
+            models.Index(fields=['postcode'], name='customer_postcode_idx'),
+            models.Index(fields=['active'], name='customer_active_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         self.update_customer_active_status()
         super(Customer, self).save(*args, **kwargs)  # this is the real save method
+        CustomerSearchIndex().index_customers([self])
 
     def clean(self):
         self.validate_postcode()
@@ -62,8 +76,7 @@ class Customer(models.Model):
     def validate_postcode(self):
         if self.postcode != None:
             self.postcode = self.postcode.upper()
-            uk_postcode_rule_1 = re.compile("[A-Z]{1,2}\d{1,2} \d[A-Z]{1,2}")
-            if uk_postcode_rule_1.match(self.postcode) != None:
+            if UK_POSTCODE_RULE_1.match(self.postcode) != None:
                 return True
             raise ValidationError('Please ensure valid postcode is provided, with space included')
 
@@ -72,8 +85,10 @@ class Customer(models.Model):
         if self.phone_no != None:
             self.phone_no = self.phone_no.lstrip("+")
             self.phone_no = self.phone_no.replace(" ", "")
-            self.phone_no = int(self.phone_no)
-            self.phone_no = str(self.phone_no)
+            # str.isdigit() also accepts non ASCII digits such as '²', which int() rejects
+            if not re.fullmatch(r"[0-9]+", self.phone_no):
+                raise ValidationError('Please ensure valid UK phone number is provided')
+            self.phone_no = str(int(self.phone_no))
             if self.phone_no[0:2] == "44":
                 self.phone_no = self.phone_no[2:]
             if len(self.phone_no) == 10 and self.phone_no[0] != "0":
@@ -85,6 +100,213 @@ class Customer(models.Model):
             raise ValidationError('Please ensure valid UK phone number is provided')
 
 
+class CustomerSearchToken(models.Model):
+    """
+    Normalised search terms for a customer, kept in sync by CustomerSearchIndex
+    """
+    NAME = 'name'
+    EMAIL = 'email'
+    PHONE = 'phone'
+    PHONE_DIGITS = 'digits'
+    POSTCODE = 'postcode'
+    KINDS = ((NAME, 'Name'), (EMAIL, 'Email'), (PHONE, 'Phone'), (PHONE_DIGITS, 'Phone digits'),
+             (POSTCODE, 'Postcode'))
+
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='search_tokens')
+    kind = models.CharField(max_length=8, choices=KINDS)
+    token = models.CharField(max_length=254)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'token'], name='customer_search_token_idx'),
+        ]
+
+
+class CustomerSearchIndex:
+    """
+    Searches customers through the CustomerSearchToken table instead of
+    LIKE '%term%' scans over each customer field.
+    Names are split into words on spaces, hyphens and apostrophes, and each name is also
+    indexed with those removed, so 'o'brien', 'obrien' and 'brien' all find O'Brien.
+    Names and emails match on a prefix, and the domain and each part of an email are indexed too.
+    Each ending of a phone number is indexed, so any run of its digits matches on a prefix.
+    Whole phone numbers and postcodes match exactly once normalised.
+    Prefixes are matched with a token range, e.g. >= 'smi' and < 'smj',
+    so the (kind, token) index is used.
+    """
+    word_separator = re.compile(r"[\s\-']+")
+    email_separator = re.compile(r"[@.\-_+]+")
+    min_phone_digits = 3
+
+    def normalise_phone_no(self, phone_no):
+        digits = re.sub(r"\D", "", phone_no or "")
+        if digits[0:2] == "44":
+            digits = digits[2:]
+        if digits and digits[0] != "0":
+            digits = "0" + digits
+        return digits
+
+    def normalise_postcode(self, postcode):
+        return re.sub(r"\s", "", postcode or "").lower()
+
+    def get_name_words(self, name):
+        return [word for word in self.word_separator.split((name or "").lower()) if word]
+
+    def get_tokens(self, customer):
+        tokens = set()
+        for name in (customer.first_name, customer.last_name):
+            words = self.get_name_words(name)
+            for word in words + ["".join(words)]:
+                if word:
+                    tokens.add((CustomerSearchToken.NAME, word))
+        if customer.email:
+            email = customer.email.lower()
+            tokens.add((CustomerSearchToken.EMAIL, email))
+            tokens.add((CustomerSearchToken.EMAIL, email.rpartition('@')[2]))
+            for part in self.email_separator.split(email):
+                if part:
+                    tokens.add((CustomerSearchToken.EMAIL, part))
+        if customer.phone_no:
+            phone_no = self.normalise_phone_no(customer.phone_no)
+            tokens.add((CustomerSearchToken.PHONE, phone_no))
+            for start in range(len(phone_no) - self.min_phone_digits + 1):
+                tokens.add((CustomerSearchToken.PHONE_DIGITS, phone_no[start:]))
+        if customer.postcode:
+            tokens.add((CustomerSearchToken.POSTCODE, self.normalise_postcode(customer.postcode)))
+        return tokens
+
+    def index_customers(self, customers):
+        """
+        Replaces the search tokens of saved customers with two queries for the batch
+        """
+        customers = [customer for customer in customers if customer.pk is not None]
+        if not customers:
+            return
+        with transaction.atomic():
+            CustomerSearchToken.objects.filter(customer_id__in=[customer.pk for customer in customers]).delete()
+            CustomerSearchToken.objects.bulk_create([
+                CustomerSearchToken(customer_id=customer.pk, kind=kind, token=token)
+                for customer in customers
+                for kind, token in self.get_tokens(customer)])
+
+    def rebuild(self, batch_size=2000):
+        num_of_customers = 0
+        batch = []
+        with transaction.atomic():
+            CustomerSearchToken.objects.all().delete()
+            for customer in Customer.objects.only('id', 'first_name', 'last_name', 'email', 'phone_no',
+                                                  'postcode').iterator(chunk_size=batch_size):
+                batch.append(customer)
+                if len(batch) >= batch_size:
+                    self.index_customers(batch)
+                    num_of_customers += len(batch)
+                    batch = []
+            self.index_customers(batch)
+        return num_of_customers + len(batch)
+
+    def get_prefix_range(self, prefix):
+        return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+    def get_prefix_filter(self, kind, prefix):
+        lower, upper = self.get_prefix_range(prefix)
+        return models.Q(kind=kind, token__gte=lower, token__lt=upper)
+
+    def get_customer_filter(self, token_filter):
+        return models.Q(id__in=CustomerSearchToken.objects.filter(token_filter).values('customer_id'))
+
+    def get_term_filter(self, term):
+        """
+        Matches a customer when the term is a prefix of an email or of a run of phone digits,
+        is their postcode, or when every word of the term, split as names are,
+        is a prefix of one of their names, e.g. 'o'brien-smi' for O'Brien-Smith
+        """
+        term = term.lower()
+        name_words = self.get_name_words(term)
+        token_filter = self.get_prefix_filter(CustomerSearchToken.EMAIL, term)
+        token_filter |= models.Q(kind=CustomerSearchToken.POSTCODE, token=self.normalise_postcode(term))
+        digits = re.sub(r"\D", "", term)
+        if re.fullmatch(r"[\d+()]+", term) and len(digits) >= self.min_phone_digits:
+            token_filter |= self.get_prefix_filter(CustomerSearchToken.PHONE_DIGITS, digits)
+            phone_no = self.normalise_phone_no(term)
+            if len(phone_no) >= 10:
+                token_filter |= models.Q(kind=CustomerSearchToken.PHONE, token=phone_no)
+        if name_words == [term]:
+            # A single name word is matched in the same subquery as the other kinds
+            token_filter |= self.get_prefix_filter(CustomerSearchToken.NAME, term)
+            name_words = []
+        customer_filter = self.get_customer_filter(token_filter)
+        if name_words:
+            name_filter = models.Q()
+            for word in name_words:
+                name_filter &= self.get_customer_filter(self.get_prefix_filter(CustomerSearchToken.NAME, word))
+            customer_filter |= name_filter
+        return customer_filter
+
+    def search(self, queryset, search_term):
+        """
+        Filters the queryset to customers matching every word of the search term.
+        A search term that is a whole phone number or postcode, e.g. '01632 960343'
+        or 'G74 4AU', is matched exactly as one term.
+        """
+        search_term = search_term.strip()
+        phone_no = self.normalise_phone_no(search_term)
+        if re.fullmatch(r"[\d\s+()]+", search_term) and len(phone_no) >= 10:
+            term_filters = [self.get_customer_filter(models.Q(kind=CustomerSearchToken.PHONE, token=phone_no))]
+        elif UK_POSTCODE_RULE_1.fullmatch(search_term.upper()):
+            term_filters = [self.get_customer_filter(models.Q(kind=CustomerSearchToken.POSTCODE,
+                                                              token=self.normalise_postcode(search_term)))]
+        else:
+            term_filters = [self.get_term_filter(term) for term in search_term.split()]
+        for term_filter in term_filters:
+            queryset = queryset.filter(term_filter)
+        return queryset
+
+
+class CustomerActivation:
+    """
+    Activates and deactivates customers in bulk with one UPDATE per call,
+    setting the same fields as Customer.update_customer_active_status does on save:
+    activating sets date_activated to today and clears date_deactivated;
+    deactivating clears date_activated and sets date_deactivated to today.
+    Customers whose fields already match are left as they are, so an earlier
+    date_deactivated is kept.
+    """
+
+    def __init__(self, today=None):
+        self.today = today or datetime.date.today()
+
+    def activate(self, customers):
+        return customers.filter(Q(active=False) | Q(date_activated__isnull=True) |
+                                Q(date_deactivated__isnull=False)) \
+            .update(active=True, date_activated=self.today, date_deactivated=None)
+
+    def deactivate(self, customers):
+        return customers.filter(Q(active=True) | Q(date_deactivated__isnull=True)) \
+            .update(active=False, date_activated=None, date_deactivated=self.today)
+
+    def get_months_before(self, months):
+        month_index = self.today.year * 12 + self.today.month - 1 - months
+        year, month = divmod(month_index, 12)
+        day = min(self.today.day, calendar.monthrange(year, month + 1)[1])
+        return datetime.date(year, month + 1, day)
+
+    def get_lapsed_customers(self, months):
+        """
+        Active customers with no appointment on or after the date months ago,
+        i.e. whose latest appointment is older than that or who have none,
+        and who were not activated since then. Customers with recent appointments are
+        found with a subquery, so this is one statement whatever the number of customers.
+        """
+        cutoff_date = self.get_months_before(months)
+        recent_customer_ids = Appointment.objects.filter(date__gte=cutoff_date).values('customer_id')
+        return Customer.objects.filter(Q(date_activated__lt=cutoff_date) | Q(date_activated__isnull=True),
+                                       active=True) \
+            .exclude(id__in=recent_customer_ids)
+
+    def deactivate_lapsed(self, months):
+        return self.deactivate(self.get_lapsed_customers(months))
+
+
 class Service(models.Model):
     service = models.CharField(max_length=35, null=True, blank=True)
     price = models.IntegerField(blank=True, null=True)
@@ -94,6 +316,80 @@ class Service(models.Model):
         return self.service
 
 
+class Stylist(models.Model):
+    name = models.CharField(max_length=35)
+    active = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class OpeningHours(models.Model):
+    """
+    Opening hours for a day of the week.
+    Rows without a stylist are the salon's hours; a stylist with rows of their own
+    works only those days and hours, otherwise they work the salon's hours.
+    With no salon rows at all the salon is open 09:00-17:00 every day.
+    Saving or deleting salon rows refreshes the daily summaries of the weekdays they change.
+    Each weekday has at most one salon row; the unique index for this is a partial
+    index on weekday where stylist is null, since unique_together treats NULLs as distinct.
+    """
+    WEEKDAYS = ((0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'),
+                (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday'))
+
+    stylist = models.ForeignKey(Stylist, on_delete=models.CASCADE, null=True, blank=True,
+                                related_name='opening_hours')
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAYS)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+
+    class Meta:
+        ordering = ['stylist', 'weekday']
+        unique_together = (('stylist', 'weekday'),)
+        verbose_name_plural = 'opening hours'
+
+    _loaded_stylist_weekday = None
+
+    def __str__(self):
+        return "{} {}-{}".format(self.get_weekday_display(), self.start_time.strftime("%H:%M"),
+                                 self.end_time.strftime("%H:%M"))
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Keeps the stylist and weekday the row was loaded with,
+        so the daily summaries of the old weekday are refreshed when they are changed.
+        """
+        instance = super(OpeningHours, cls).from_db(db, field_names, values)
+        loaded_values = dict(zip(field_names, values))
+        instance._loaded_stylist_weekday = (loaded_values.get('stylist_id'), loaded_values.get('weekday'))
+        return instance
+
+    def clean(self):
+        if self.start_time is not None and self.end_time is not None and self.start_time >= self.end_time:
+            raise ValidationError('Please ensure the closing time is after the opening time')
+        if self.stylist_id is None and OpeningHours.objects.filter(stylist__isnull=True, weekday=self.weekday) \
+                .exclude(pk=self.pk).exists():
+            raise ValidationError('The salon already has opening hours for {}'.format(self.get_weekday_display()))
+
+    def get_salon_weekdays_changed(self):
+        """
+        Weekdays whose salon hours this row sets, now or as loaded.
+        Every weekday changes when the salon gets its first row or loses its last one,
+        as days without a row go from 09:00-17:00 to closed or back.
+        """
+        stylist_weekdays = [(self.stylist_id, self.weekday)]
+        if self._loaded_stylist_weekday is not None:
+            stylist_weekdays.append(self._loaded_stylist_weekday)
+        weekdays = {weekday for stylist_id, weekday in stylist_weekdays if stylist_id is None}
+        if weekdays and OpeningHours.objects.filter(stylist__isnull=True).count() <= 1:
+            return set(range(7))
+        return weekdays
+
+
 class Appointment(models.Model):
     id = models.AutoField(auto_created=True, primary_key=True, serialize=False)
     date = models.DateField(null=True)
@@ -103,19 +399,31 @@ class Appointment(models.Model):
     date_paid = models.DateField(blank=True, null=True)
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
     services = models.ManyToManyField(Service, blank=True)
+    stylist = models.ForeignKey(Stylist, on_delete=models.SET_NULL, null=True, blank=True)
+    date_modified = models.DateTimeField(auto_now=True)
+
+    _loaded_date = None
+    _saving_services = False
 
     class Meta:
         ordering = ['-date', 'start_time']
+        indexes = [
+            models.Index(fields=['date', 'start_time', 'end_time'], name='appointment_date_time_idx'),
+            models.Index(fields=['date', 'stylist', 'start_time', 'end_time'], name='appointment_stylist_time_idx'),
+            models.Index(fields=['date', 'quote', 'date_paid'], name='appointment_date_totals_idx'),
+        ]
 
     def __str__(self):
         return "Appointment " + str(self.date) + ", @" + str(self.start_time)[:-2]
 
-    def save(self, *args, **kwargs):
+    def save(self, *args, services=None, **kwargs):
         """
-        First super save necessary without force insert so appointment obj
-        is created first, before many to many service obj is associated.
-        A quote is calculated based on services selected.
-        Then this is saved under the second super save.
+        The end time and quote are calculated from the services selected
+        before the appointment is written, so each save is a single insert or update.
+        Pass services (Service objects or ids) when they are already known, e.g. from the admin form,
+        so they are not fetched from the DB; they are then also set on the
+        services many to many field once the appointment has been saved.
+        Prices and estimated minutes come from the in-process service catalogue.
         Have defined the service many to many field as an
         alternative to setting up a separate model with foreign keys to
         the service and appointment objects
@@ -123,32 +431,218 @@ class Appointment(models.Model):
         services when creating or updating an appointment in the appointment detail view.
         The services field is also easy to set up in the admin.py Appointment Admin class
         """
-        super(Appointment, self).save(*args, **kwargs)
-        kwargs['force_insert'] = False
-        appointment_util = AppointmentUtil(self.services.all(), self.start_time)
+        if services is not None:
+            service_ids = [getattr(service, 'pk', service) for service in services]
+        elif self.pk is not None:
+            service_ids = self.services.values_list('id', flat=True)
+        else:
+            service_ids = []
+        appointment_util = AppointmentUtil.for_service_ids(service_ids, self.start_time)
         self.end_time = appointment_util.end_time
         if self.start_time != self.end_time:
             self.quote = appointment_util.get_quote()
-        super(Appointment, self).save(*args, **kwargs)
+        # The appointment, its services and the daily summaries are written together or not at all
+        with transaction.atomic():
+            super(Appointment, self).save(*args, **kwargs)
+            if services is not None:
+                # date_modified was just set by this save, so the services signal does not set it again
+                self._saving_services = True
+                try:
+                    self.services.set(service_ids)
+                finally:
+                    self._saving_services = False
+            DailySummaryMaker().refresh_for_dates([self._loaded_date, self.date])
+        self._loaded_date = self.date
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Keeps the date the appointment was loaded with,
+        so the daily summary for it is refreshed when the date is changed.
+        """
+        instance = super(Appointment, cls).from_db(db, field_names, values)
+        instance._loaded_date = dict(zip(field_names, values)).get('date')
+        return instance
+
+
+class DailySummary(models.Model):
+    """
+    Materialised per-day totals for the appointment summary report.
+    Kept up to date by DailySummaryMaker on appointment writes.
+    """
+    date = models.DateField(unique=True)
+    count = models.PositiveIntegerField(default=0)
+    forecasted_income = models.FloatField(default=0)
+    paid_income = models.FloatField(default=0)
+    booked_minutes = models.PositiveIntegerField(default=0)
+    time_slots_available = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['date']
+        verbose_name_plural = 'daily summaries'
+
+    def __str__(self):
+        return "Daily summary " + str(self.date)
+
+
+class BookingDateLock(models.Model):
+    """
+    One row per date that bookings lock with select_for_update,
+    so clash checks and inserts for the same date run one at a time
+    while bookings on other dates go ahead in parallel. See booking.lock_booking_dates.
+    """
+    date = models.DateField(unique=True)
+
+    def __str__(self):
+        return "Booking lock " + str(self.date)
+
+    @classmethod
+    def lock_dates(cls, dates):
+        """
+        Locks the rows for the given dates until the end of the current transaction,
+        creating any that are missing. Rows are locked in date order so two
+        transactions locking overlapping dates cannot deadlock. On SQLite, which has no row locks,
+        the IMMEDIATE transactions set up in settings.py already let only one writer in at a time.
+        """
+        dates = sorted({date for date in dates if date is not None})
+        if not dates:
+            return []
+        existing_dates = set(cls.objects.filter(date__in=dates).values_list('date', flat=True))
+        missing_dates = [date for date in dates if date not in existing_dates]
+        if missing_dates:
+            try:
+                with transaction.atomic():
+                    cls.objects.bulk_create([cls(date=date) for date in missing_dates])
+            except IntegrityError:
+                # Another transaction created some of the rows first
+                for date in missing_dates:
+                    cls.objects.get_or_create(date=date)
+        return list(cls.objects.select_for_update().filter(date__in=dates).order_by('date'))
 
 
-def check_no_appointment_clashes(id, date, start_time, end_time):
-    overlapping_appointments = Appointment.objects.filter(date=date,
-                                                          start_time__lt=end_time,
-                                                          end_time__gt=start_time).exclude(id=id)
-    if len(overlapping_appointments) > 0:
+class Reminder(models.Model):
+    """
+    Records an appointment reminder sent on a channel for the date the appointment was on,
+    so the reminder dispatcher skips it when run again for the same day
+    but reminds again if the appointment is moved to another date
+    """
+    CHANNELS = (('email', 'Email'), ('sms', 'SMS'))
+
+    appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE)
+    appointment_date = models.DateField(null=True)
+    channel = models.CharField(max_length=5, choices=CHANNELS)
+    recipient = models.CharField(max_length=254)
+    date_sent = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (('appointment', 'appointment_date', 'channel'),)
+
+    def __str__(self):
+        return "Reminder by {} for {}".format(self.channel, self.appointment)
+
+
+def check_stylist_selected(stylist):
+    """
+    Once the salon has active stylists every appointment must be with one of them,
+    as clashes and free time are then worked out per stylist
+    and an appointment without a stylist would not count against any of them.
+    """
+    if stylist is None and Stylist.objects.filter(active=True).exists():
+        raise ValidationError("Please select a stylist")
+    return True
+
+
+def check_no_appointment_clashes(id, date, start_time, end_time, stylist=None):
+    """
+    Appointments clash when they overlap and are with the same stylist.
+    Appointments without a stylist all share one chair, as for a single stylist salon,
+    and are only allowed while the salon has no active stylists.
+    """
+    check_stylist_selected(stylist)
+    overlapping_appointment = Appointment.objects.filter(date=date,
+                                                         stylist=stylist,
+                                                         start_time__lt=end_time,
+                                                         end_time__gt=start_time).exclude(id=id) \
+        .order_by('start_time').first()
+    if overlapping_appointment is not None:
         raise ValidationError(
-            "Please select another appointment time. Clashes with {}".format(overlapping_appointments[0]))
+            "Please select another appointment time. Clashes with {}".format(overlapping_appointment))
+    return True
+
+
+def find_appointment_clashes(appointments):
+    """
+    Finds every clash for a batch of proposed appointments, e.g. a recurring series,
+    both with existing appointments and within the batch itself.
+    Existing appointments on the dates of the batch are loaded in one query,
+    then each date and stylist is swept in start time order keeping only the
+    appointments that have not yet ended.
+    Returns a list of (proposed appointment, clashing appointment) pairs.
+    """
+    appointments = [appointment for appointment in appointments
+                    if None not in (appointment.date, appointment.start_time, appointment.end_time)]
+    if not appointments:
+        return []
+    appointments_by_chair = defaultdict(list)
+    for appointment in appointments:
+        appointments_by_chair[(appointment.date, appointment.stylist_id)].append((appointment, True))
+    proposed_ids = {appointment.id for appointment in appointments if appointment.id is not None}
+    existing_appointments = Appointment.objects.filter(date__in=list({date for date, _ in appointments_by_chair}),
+                                                       start_time__isnull=False,
+                                                       end_time__isnull=False) \
+        .exclude(id__in=proposed_ids).only('id', 'date', 'start_time', 'end_time', 'stylist')
+    for appointment in existing_appointments:
+        chair = (appointment.date, appointment.stylist_id)
+        if chair in appointments_by_chair:
+            appointments_by_chair[chair].append((appointment, False))
+    clashes = []
+    for chair in sorted(appointments_by_chair, key=lambda chair: (chair[0], chair[1] or 0)):
+        active_appointments = []
+        for appointment, is_proposed in sorted(appointments_by_chair[chair], key=lambda item: item[0].start_time):
+            active_appointments = [(active, active_is_proposed)
+                                   for active, active_is_proposed in active_appointments
+                                   if active.end_time > appointment.start_time]
+            for active, active_is_proposed in active_appointments:
+                if not (is_proposed or active_is_proposed):
+                    continue
+                if appointment.start_time < active.end_time and appointment.end_time > active.start_time:
+                    if is_proposed:
+                        clashes.append((appointment, active))
+                    else:
+                        clashes.append((active, appointment))
+            active_appointments.append((appointment, is_proposed))
+    return clashes
+
+
+def check_no_appointment_clashes_for_appointments(appointments):
+    if any(appointment.stylist_id is None for appointment in appointments):
+        check_stylist_selected(None)
+    clashes = find_appointment_clashes(appointments)
+    if clashes:
+        raise ValidationError(["{} clashes with {}".format(appointment, clashing_appointment)
+                               for appointment, clashing_appointment in clashes])
     return True
 
 
 # noinspection SpellCheckingInspection
 class AppointmentReportMaker:
-    def __init__(self):
+    def __init__(self, date_from=None, date_to=None, after=None, page_size=None, dates=None):
+        """
+        date_from and date_to bound the report inclusively.
+        after and page_size give keyset pagination on date: only dates later
+        than after are reported, at most page_size of them.
+        dates restricts the report to the given dates only.
+        """
+        self.date_from = date_from
+        self.date_to = date_to
+        self.for_dates = dates
+        self.after = after
+        self.page_size = page_size
+        self.next_after = None
         self.dates = self.get_appointment_dates()
 
     def get_appointment_dates(self):
-        dates = Appointment.objects.dates('date', 'day')
+        dates = self.get_appointments_for_report().dates('date', 'day')
         return dates
 
     def get_appointments_dict_for_date(self, date):
@@ -159,17 +653,79 @@ class AppointmentReportMaker:
 
     def get_appointment_summary_report(self):
         context_dict = defaultdict(list)
-        for date in self.dates:
-            daily_appointment_summary = self.get_income_summary_for_date(date)
-            daily_appointment_summary['date'] = daily_appointment_summary.get('date', date)
-            daily_appointment_summary['count'] = daily_appointment_summary. \
-                get('count', self.get_num_of_appointments_for_date(date))
-            daily_appointment_summary['time_slots_available'] = daily_appointment_summary.get('time_slots_available',
-                                                                                              self.get_time_slots_available_for_date(
-                                                                                                  date))
+        for daily_appointment_summary in self.iter_appointment_summary():
             context_dict['appointment_summary'].append(daily_appointment_summary)
+        if self.next_after is not None:
+            context_dict['next_after'] = self.next_after
         return {'success': True, 'context_dict': dict(context_dict)}
 
+    def iter_appointment_summary(self):
+        """
+        Yields the daily summary dicts for the report in date order.
+        Totals for every date come from one grouped query and the booked
+        time slots from a second query ordered by date, so the number of
+        queries does not grow with the number of dates in the report.
+        """
+        opening_hours_calendar = OpeningHoursCalendar()
+        for daily_totals, time_slots in self.iter_daily_totals_with_time_slots():
+            date = daily_totals['date']
+            time_slots_for_date = TimeSlots.for_opening_hours(date, opening_hours_calendar)
+            daily_appointment_summary = {
+                'forecasted_income': daily_totals['forecasted_income'],
+                'paid_income': daily_totals['paid_income'],
+                'date': date,
+                'count': daily_totals['count'],
+                'time_slots_available': time_slots_for_date.consolidate_available_time_slots_for_date(time_slots),
+            }
+            yield daily_appointment_summary
+
+    def iter_daily_totals_with_time_slots(self):
+        """
+        Yields (daily totals dict, booked time slots) pairs in date order.
+        When a page size is set, one extra date is fetched to find out whether
+        there is a next page and next_after is set to the cursor for it.
+        """
+        daily_totals_for_dates = self.get_daily_totals()
+        if self.page_size is None:
+            daily_totals_for_dates = daily_totals_for_dates.iterator()
+            time_slot_rows = self.get_time_slot_rows()
+        else:
+            daily_totals_for_dates = list(daily_totals_for_dates[:self.page_size + 1])
+            if len(daily_totals_for_dates) > self.page_size:
+                daily_totals_for_dates = daily_totals_for_dates[:self.page_size]
+                self.next_after = daily_totals_for_dates[-1]['date']
+            if not daily_totals_for_dates:
+                return
+            time_slot_rows = self.get_time_slot_rows(daily_totals_for_dates[-1]['date'])
+        yield from TimeSlots.iter_time_slots_for_dates(time_slot_rows, daily_totals_for_dates, key=itemgetter('date'))
+
+    def get_appointments_for_report(self):
+        appointments = Appointment.objects.filter(date__isnull=False)
+        if self.date_from is not None:
+            appointments = appointments.filter(date__gte=self.date_from)
+        if self.date_to is not None:
+            appointments = appointments.filter(date__lte=self.date_to)
+        if self.after is not None:
+            appointments = appointments.filter(date__gt=self.after)
+        if self.for_dates is not None:
+            appointments = appointments.filter(date__in=list(self.for_dates))
+        return appointments
+
+    def get_daily_totals(self):
+        paid_quote = Case(When(date_paid__isnull=False, then=F('quote')),
+                          default=Value(0.0),
+                          output_field=models.FloatField())
+        return self.get_appointments_for_report().values('date').annotate(
+            count=Count('id'),
+            forecasted_income=Sum('quote'),
+            paid_income=Sum(paid_quote)).order_by('date')
+
+    def get_time_slot_rows(self, last_date=None):
+        time_slots = self.get_appointments_for_report()
+        if last_date is not None:
+            time_slots = time_slots.filter(date__lte=last_date)
+        return time_slots.values_list('date', 'start_time', 'end_time').order_by('date', 'start_time').iterator()
+
     def get_income_summary_for_date(self, date):
         daily_appointments_dict = {}
         for appointment_dict in self.get_appointments_dict_for_date(date):
@@ -187,41 +743,364 @@ class AppointmentReportMaker:
             return 0.0
 
     def get_time_slots_available_for_date(self, date):
-        time_slots = TimeSlots(date)
+        time_slots = TimeSlots.for_opening_hours(date, OpeningHoursCalendar())
         return time_slots.get_time_slots_available_for_date()
 
 
+class DailySummaryReportMaker(AppointmentReportMaker):
+    """
+    Reads the appointment summary report from the DailySummary table,
+    so a report page costs one query per page regardless of the number of appointments.
+    Takes the same date range and keyset pagination arguments as AppointmentReportMaker.
+    """
+
+    def get_daily_summaries_for_report(self):
+        daily_summaries = DailySummary.objects.all()
+        if self.date_from is not None:
+            daily_summaries = daily_summaries.filter(date__gte=self.date_from)
+        if self.date_to is not None:
+            daily_summaries = daily_summaries.filter(date__lte=self.date_to)
+        if self.after is not None:
+            daily_summaries = daily_summaries.filter(date__gt=self.after)
+        if self.for_dates is not None:
+            daily_summaries = daily_summaries.filter(date__in=list(self.for_dates))
+        return daily_summaries.values('forecasted_income', 'paid_income', 'date', 'count',
+                                      'time_slots_available').order_by('date')
+
+    def iter_appointment_summary(self):
+        daily_summaries = self.get_daily_summaries_for_report()
+        if self.page_size is None:
+            daily_summaries = daily_summaries.iterator()
+        else:
+            daily_summaries = list(daily_summaries[:self.page_size + 1])
+            if len(daily_summaries) > self.page_size:
+                daily_summaries = daily_summaries[:self.page_size]
+                self.next_after = daily_summaries[-1]['date']
+        for daily_appointment_summary in daily_summaries:
+            yield daily_appointment_summary
+
+
+class DailySummaryCache:
+    """
+    Caches the daily summary dicts of the appointment summary report, one key per date,
+    and the monthly rollups of the analytics report, one key per month.
+    Dates without appointments are cached as an empty dict, so a repeat view of a date
+    range is served without a query. Refreshing the summaries for some dates deletes
+    only their keys and those of their months; a rebuild moves every key to a new
+    generation instead.
+    """
+    key_prefix = 'salon_crm_base:daily_summary'
+    timeout = 60 * 60 * 24
+
+    def make_generation(self):
+        # Generations are timestamps, so one made after the generation key was evicted
+        # is still newer than every generation cached before
+        return int(time.time() * 1000000)
+
+    def get_generation(self):
+        return cache.get_or_set(self.key_prefix + ':generation', self.make_generation, None)
+
+    def get_key(self, date, generation):
+        return '{}:{}:{}'.format(self.key_prefix, generation, date.isoformat())
+
+    def get_many(self, dates):
+        generation = self.get_generation()
+        dates_by_key = {self.get_key(date, generation): date for date in dates}
+        return {dates_by_key[key]: daily_summary
+                for key, daily_summary in cache.get_many(list(dates_by_key)).items()}
+
+    def set_many(self, daily_summaries_by_date):
+        generation = self.get_generation()
+        cache.set_many({self.get_key(date, generation): daily_summary
+                        for date, daily_summary in daily_summaries_by_date.items()}, self.timeout)
+
+    def get_month_key(self, month, generation):
+        return '{}:{}:month:{:%Y-%m}'.format(self.key_prefix, generation, month)
+
+    def get_many_months(self, months):
+        generation = self.get_generation()
+        months_by_key = {self.get_month_key(month, generation): month for month in months}
+        return {months_by_key[key]: monthly_rollup
+                for key, monthly_rollup in cache.get_many(list(months_by_key)).items()}
+
+    def set_many_months(self, monthly_rollups_by_month):
+        generation = self.get_generation()
+        cache.set_many({self.get_month_key(month, generation): monthly_rollup
+                        for month, monthly_rollup in monthly_rollups_by_month.items()}, self.timeout)
+
+    def invalidate_dates(self, dates):
+        """
+        Deletes the keys for the given dates and their months now and again when the
+        transaction commits, so a report read before the commit cannot leave the old summary cached
+        """
+        dates = {date for date in dates if date is not None}
+        if not dates:
+            return
+        months = {date.replace(day=1) for date in dates}
+
+        def delete_keys():
+            generation = self.get_generation()
+            cache.delete_many([self.get_key(date, generation) for date in dates] +
+                              [self.get_month_key(month, generation) for month in months])
+        delete_keys()
+        transaction.on_commit(delete_keys)
+
+    def invalidate_all(self):
+        def next_generation():
+            generation = cache.get(self.key_prefix + ':generation') or 0
+            cache.set(self.key_prefix + ':generation', max(self.make_generation(), generation + 1), None)
+        next_generation()
+        transaction.on_commit(next_generation)
+
+
+class CachedDailySummaryReportMaker(DailySummaryReportMaker):
+    """
+    Serves the appointment summary report from DailySummaryCache, reading only the
+    dates missing from the cache from the DailySummary table in one query.
+    Reports without both ends of the date range, or longer than max_cached_dates,
+    are read from the table as DailySummaryReportMaker does.
+    """
+    max_cached_dates = 366
+
+    def get_calendar_dates(self):
+        if self.date_from is None or self.date_to is None:
+            return None
+        date_from = self.date_from
+        if self.after is not None:
+            date_from = max(date_from, self.after + datetime.timedelta(days=1))
+        num_of_dates = (self.date_to - date_from).days + 1
+        if num_of_dates > self.max_cached_dates:
+            return None
+        return [date_from + datetime.timedelta(days=days) for days in range(max(num_of_dates, 0))]
+
+    def get_daily_summaries_by_date(self, dates):
+        daily_summary_cache = DailySummaryCache()
+        daily_summaries_by_date = daily_summary_cache.get_many(dates)
+        missing_dates = [date for date in dates if date not in daily_summaries_by_date]
+        if missing_dates:
+            missing_daily_summaries = {date: {} for date in missing_dates}
+            for daily_summary in DailySummaryReportMaker(dates=missing_dates).get_daily_summaries_for_report():
+                missing_daily_summaries[daily_summary['date']] = daily_summary
+            daily_summary_cache.set_many(missing_daily_summaries)
+            daily_summaries_by_date.update(missing_daily_summaries)
+        return daily_summaries_by_date
+
+    def iter_appointment_summary(self):
+        dates = self.get_calendar_dates()
+        if dates is None:
+            yield from super(CachedDailySummaryReportMaker, self).iter_appointment_summary()
+            return
+        daily_summaries_by_date = self.get_daily_summaries_by_date(dates)
+        daily_summaries = [daily_summaries_by_date[date] for date in dates if daily_summaries_by_date[date]]
+        if self.page_size is not None and len(daily_summaries) > self.page_size:
+            daily_summaries = daily_summaries[:self.page_size]
+            self.next_after = daily_summaries[-1]['date']
+        for daily_appointment_summary in daily_summaries:
+            yield daily_appointment_summary
+
+
+class DailySummaryMaker:
+    """
+    Maintains the DailySummary table from Appointment rows.
+    Appointment.save() and deletes refresh only the dates they touch;
+    rebuild() recreates the whole table, e.g. from the rebuild_daily_summaries command.
+    """
+    batch_size = 500
+
+    def iter_daily_summaries(self, appointment_report_maker):
+        opening_hours_calendar = OpeningHoursCalendar()
+        for daily_totals, time_slots in appointment_report_maker.iter_daily_totals_with_time_slots():
+            date = daily_totals['date']
+            time_slots_for_date = TimeSlots.for_opening_hours(date, opening_hours_calendar)
+            yield DailySummary(date=date,
+                               count=daily_totals['count'],
+                               forecasted_income=daily_totals['forecasted_income'] or 0,
+                               paid_income=daily_totals['paid_income'] or 0,
+                               booked_minutes=self.get_booked_minutes(time_slots),
+                               time_slots_available=time_slots_for_date.consolidate_available_time_slots_for_date(
+                                   time_slots))
+
+    def get_booked_minutes(self, time_slots):
+        booked_minutes = 0
+        for start_time, end_time in time_slots:
+            if start_time is not None and end_time is not None:
+                booked_minutes += (end_time.hour * 60 + end_time.minute) - (start_time.hour * 60 + start_time.minute)
+        return booked_minutes
+
+    def refresh_for_dates(self, dates):
+        """
+        Recomputes the summaries for the given dates only,
+        with the same number of queries however many dates are given.
+        The dates are locked first, as for a booking, so two refreshes of the same date
+        cannot both delete and re-insert its summary.
+        """
+        dates = {date for date in dates if date is not None}
+        if not dates:
+            return
+        with transaction.atomic():
+            BookingDateLock.lock_dates(dates)
+            appointment_report_maker = AppointmentReportMaker(dates=dates)
+            DailySummary.objects.filter(date__in=list(dates)).delete()
+            DailySummary.objects.bulk_create(self.iter_daily_summaries(appointment_report_maker))
+            DailySummaryCache().invalidate_dates(dates)
+
+    def refresh_for_weekdays(self, weekdays):
+        """
+        Recomputes the summaries stored for every date on the given weekdays (0 is Monday),
+        a batch of dates at a time, e.g. after the opening hours of those weekdays change.
+        """
+        if not weekdays:
+            return
+        # The week_day lookup counts from 1 for Sunday
+        dates = list(DailySummary.objects.filter(date__week_day__in=[(weekday + 1) % 7 + 1 for weekday in weekdays])
+                     .values_list('date', flat=True))
+        with transaction.atomic():
+            for start in range(0, len(dates), self.batch_size):
+                self.refresh_for_dates(dates[start:start + self.batch_size])
+
+    def rebuild(self, date_from=None, date_to=None):
+        appointment_report_maker = AppointmentReportMaker(date_from=date_from, date_to=date_to)
+        with transaction.atomic():
+            DailySummaryCache().invalidate_all()
+            daily_summaries = DailySummary.objects.all()
+            if date_from is not None:
+                daily_summaries = daily_summaries.filter(date__gte=date_from)
+            if date_to is not None:
+                daily_summaries = daily_summaries.filter(date__lte=date_to)
+            daily_summaries.delete()
+            num_of_summaries = 0
+            batch = []
+            for daily_summary in self.iter_daily_summaries(appointment_report_maker):
+                batch.append(daily_summary)
+                if len(batch) >= self.batch_size:
+                    DailySummary.objects.bulk_create(batch)
+                    num_of_summaries += len(batch)
+                    batch = []
+            DailySummary.objects.bulk_create(batch)
+            num_of_summaries += len(batch)
+        return num_of_summaries
+
+
+class OpeningHoursCalendar:
+    """
+    Looks up the opening hours of the salon and each stylist by date.
+    All opening hours are loaded in one query when the calendar is made.
+    """
+    default_hours = (datetime.time(hour=9), datetime.time(hour=17))
+
+    def __init__(self):
+        self.hours = {}
+        self.stylists_with_hours = set()
+        for stylist_id, weekday, start_time, end_time in OpeningHours.objects.values_list(
+                'stylist_id', 'weekday', 'start_time', 'end_time'):
+            self.hours[(stylist_id, weekday)] = (start_time, end_time)
+            self.stylists_with_hours.add(stylist_id)
+
+    def get_hours(self, date, stylist_id=None):
+        """
+        Returns the (start_time, end_time) of the day or None when closed.
+        """
+        if stylist_id is not None and stylist_id in self.stylists_with_hours:
+            return self.hours.get((stylist_id, date.weekday()))
+        if None in self.stylists_with_hours:
+            return self.hours.get((None, date.weekday()))
+        return self.default_hours
+
+
 class TimeSlots:
-    def __init__(self, date):
+    """
+    Works out the free time between the opening hours of a day.
+    Free intervals are (start, end) pairs of minutes from midnight,
+    with format_free_intervals giving the display string used in the report.
+    A day_start_time of None means closed all day.
+    """
+
+    def __init__(self, date, day_start_time=datetime.time(hour=9), day_end_time=datetime.time(hour=17)):
         self.date = date
-        self.day_start_time = datetime.time(hour=9)
-        self.day_end_time = datetime.time(hour=17)
+        self.day_start_time = day_start_time
+        self.day_end_time = day_end_time
+
+    @classmethod
+    def for_opening_hours(cls, date, opening_hours_calendar, stylist_id=None):
+        day_start_time, day_end_time = opening_hours_calendar.get_hours(date, stylist_id) or (None, None)
+        return cls(date, day_start_time, day_end_time)
 
     def get_time_slots_for_date(self):
         return Appointment.objects.values_list('start_time', 'end_time').filter(date=self.date).order_by('start_time')
 
-    def consolidate_available_time_slots_for_date(self, time_slots):
-        free_time_slots = ''
-        cur_available_slot_start_time = self.day_start_time
-        for time_slot in time_slots:
-            time_slot = list(time_slot)
-            start_time = min(time_slot)
-            end_time = max(time_slot)
-            if start_time <= cur_available_slot_start_time:
-                # Continue looking for a free time slot after this appointment ends.
-                cur_available_slot_start_time = end_time
+    def get_free_intervals(self, time_slots):
+        """
+        time_slots are booked (start_time, end_time) pairs ordered by start time.
+        Overlapping appointments are merged and the free intervals are
+        clipped to the opening hours of the day.
+        """
+        if self.day_start_time is None:
+            return []
+        day_end_minutes = time_to_minutes(self.day_end_time)
+        cur_available_slot_start = time_to_minutes(self.day_start_time)
+        free_intervals = []
+        for start_time, end_time in time_slots:
+            if start_time is None or end_time is None:
                 continue
-            # If the appointment starts later than the current time look for a free slot.
-            # If free time before the next appointment add this to the free time slots parameter
-            free_time_slots += cur_available_slot_start_time.strftime("%H:%M") + "-" + start_time.strftime(
-                "%H:%M") + " | "
-            cur_available_slot_start_time = end_time
-        # Check cur_available_slot_start_time against self.day_end_time
-        if cur_available_slot_start_time <= self.day_end_time:
-            free_time_slots += cur_available_slot_start_time.strftime("%H:%M") + "-" + self.day_end_time.strftime(
-                "%H:%M")
-        return free_time_slots
+            start = time_to_minutes(start_time)
+            if start > cur_available_slot_start:
+                # Free time before this appointment starts
+                free_intervals.append((cur_available_slot_start, min(start, day_end_minutes)))
+            # Continue looking for a free time slot after this appointment ends.
+            cur_available_slot_start = max(cur_available_slot_start, time_to_minutes(end_time))
+            if cur_available_slot_start >= day_end_minutes:
+                break
+        if cur_available_slot_start < day_end_minutes:
+            free_intervals.append((cur_available_slot_start, day_end_minutes))
+        return [(start, end) for start, end in free_intervals if start < end]
+
+    @staticmethod
+    def format_free_intervals(free_intervals):
+        return " | ".join(format_minutes(start) + "-" + format_minutes(end) for start, end in free_intervals)
+
+    def consolidate_available_time_slots_for_date(self, time_slots):
+        return self.format_free_intervals(self.get_free_intervals(time_slots))
 
     def get_time_slots_available_for_date(self):
         time_slots = self.get_time_slots_for_date()
         return self.consolidate_available_time_slots_for_date(time_slots)
+
+    @staticmethod
+    def iter_time_slots_for_dates(time_slot_rows, items, key=None):
+        """
+        Pairs each of items, in ascending date order, with the list of (start_time, end_time)
+        rows for its date, walking time_slot_rows (date, start_time, end_time) ordered by date
+        alongside them. Rows for dates not among the items are skipped.
+        key gives the date of an item; by default the items are dates.
+        """
+        time_slots_by_date = groupby(time_slot_rows, key=itemgetter(0))
+        slots_date, rows = next(time_slots_by_date, (None, ()))
+        for item in items:
+            date = item if key is None else key(item)
+            while slots_date is not None and slots_date < date:
+                slots_date, rows = next(time_slots_by_date, (None, ()))
+            yield item, [row[1:] for row in rows] if slots_date == date else []
+
+    @classmethod
+    def iter_free_intervals_for_dates(cls, time_slot_rows, dates=None, opening_hours_calendar=None,
+                                      stylist_id=None):
+        """
+        Batched variant of get_free_intervals for many dates in one pass.
+        time_slot_rows are (date, start_time, end_time) rows ordered by date and start time,
+        e.g. from one query covering a month. Yields (date, free intervals) in date order.
+        When dates is given, in ascending order, those dates are yielded even if
+        they have no rows, and rows for other dates are skipped.
+        Opening hours come from opening_hours_calendar for the stylist when given,
+        otherwise every day is 09:00-17:00.
+        """
+        def make_time_slots(date):
+            if opening_hours_calendar is None:
+                return cls(date)
+            return cls.for_opening_hours(date, opening_hours_calendar, stylist_id)
+
+        if dates is None:
+            for date, rows in groupby(time_slot_rows, key=itemgetter(0)):
+                yield date, make_time_slots(date).get_free_intervals(row[1:] for row in rows)
+            return
+        for date, time_slots in cls.iter_time_slots_for_dates(time_slot_rows, dates):
+            yield date, make_time_slots(date).get_free_intervals(time_slots)
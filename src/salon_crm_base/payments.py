@@ -0,0 +1,77 @@
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Min, Sum, Value, When
+from django.utils import timezone
+from .models import Appointment, DailySummaryMaker
+import datetime
+
+AGING_BUCKETS = (('0_30', '0-30 days', 0, 30),
+                 ('31_60', '31-60 days', 31, 60),
+                 ('61_90', '61-90 days', 61, 90),
+                 ('over_90', 'Over 90 days', 91, None))
+
+
+class OutstandingPaymentsLedger:
+    """
+    Lists what each customer owes for appointments up to as_of (today by default)
+    that have a quote but no date_paid, with the amount split into aging buckets
+    by how many days ago the appointment was.
+    The balances for every customer come from one grouped query over the
+    appointment_unpaid_idx partial index of unpaid appointments (see migration 0014),
+    largest balance first.
+    """
+
+    def __init__(self, as_of=None, customer_id=None):
+        self.as_of = as_of or timezone.localdate()
+        self.customer_id = customer_id
+
+    def get_unpaid_appointments(self):
+        unpaid_appointments = Appointment.objects.filter(date_paid__isnull=True,
+                                                         date__lte=self.as_of,
+                                                         quote__gt=0)
+        if self.customer_id is not None:
+            unpaid_appointments = unpaid_appointments.filter(customer_id=self.customer_id)
+        return unpaid_appointments
+
+    def get_bucket_sum(self, min_days, max_days):
+        date_range = {'date__lte': self.as_of - datetime.timedelta(days=min_days)}
+        if max_days is not None:
+            date_range['date__gte'] = self.as_of - datetime.timedelta(days=max_days)
+        return Sum(Case(When(then=F('quote'), **date_range),
+                        default=Value(0.0),
+                        output_field=models.FloatField()))
+
+    def get_customer_balances(self):
+        buckets = {'aged_' + name: self.get_bucket_sum(min_days, max_days)
+                   for name, _, min_days, max_days in AGING_BUCKETS}
+        return self.get_unpaid_appointments() \
+            .values('customer_id', 'customer__first_name', 'customer__last_name', 'customer__email') \
+            .annotate(num_of_appointments=Count('id'),
+                      outstanding=Sum('quote'),
+                      oldest_date=Min('date'),
+                      **buckets) \
+            .order_by('-outstanding', 'customer_id')
+
+    def get_ledger(self):
+        customer_balances = list(self.get_customer_balances())
+        totals = {'num_of_appointments': 0, 'outstanding': 0.0}
+        totals.update({'aged_' + name: 0.0 for name, _, _, _ in AGING_BUCKETS})
+        for customer_balance in customer_balances:
+            for key in totals:
+                totals[key] += customer_balance[key]
+        return {'as_of': self.as_of, 'customer_balances': customer_balances, 'totals': totals}
+
+
+def mark_appointments_paid(appointments, date_paid=None):
+    """
+    Sets date_paid on the unpaid appointments in the queryset with one UPDATE,
+    rather than saving each through Appointment.save(), and refreshes the daily
+    summaries of the dates they were on. Returns the number of appointments marked paid.
+    """
+    date_paid = date_paid or timezone.localdate()
+    unpaid_appointments = appointments.filter(date_paid__isnull=True)
+    with transaction.atomic():
+        dates = list(unpaid_appointments.order_by().values_list('date', flat=True).distinct())
+        # update() skips auto_now, so date_modified is set here for the calendar's ETag
+        num_of_paid = unpaid_appointments.update(date_paid=date_paid, date_modified=timezone.now())
+        DailySummaryMaker().refresh_for_dates(dates)
+    return num_of_paid
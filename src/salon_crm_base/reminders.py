@@ -0,0 +1,170 @@
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Appointment, Reminder
+import datetime
+import json
+import logging
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ReminderMessage = namedtuple('ReminderMessage', ['appointment_id', 'channel', 'recipient', 'text'])
+
+
+class ConsoleReminderBackend:
+    """
+    Writes reminders to a stream, stdout by default, one line each.
+    Backends take a channel and a batch of ReminderMessages and raise an exception
+    if the batch could not be sent; they may be called from several threads at once.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.lock = threading.Lock()
+
+    def send_messages(self, channel, messages):
+        with self.lock:
+            for message in messages:
+                self.stream.write("[{}] {}: {}\n".format(channel, message.recipient, message.text))
+            self.stream.flush()
+
+
+class FileReminderBackend:
+    """
+    Appends reminders to a file as JSON lines, e.g. to check a reminder run without sending anything
+    """
+
+    def __init__(self, file_path=None):
+        self.file_path = file_path or getattr(settings, 'REMINDER_FILE_PATH', 'reminders.jsonl')
+        self.lock = threading.Lock()
+
+    def send_messages(self, channel, messages):
+        with self.lock:
+            with open(self.file_path, 'a') as reminder_file:
+                for message in messages:
+                    reminder_file.write(json.dumps(message._asdict()) + "\n")
+
+
+def get_reminder_backend(backend_path=None):
+    return import_string(backend_path or getattr(settings, 'REMINDER_BACKEND',
+                                                 'salon_crm_base.reminders.ConsoleReminderBackend'))()
+
+
+class ReminderDispatcher:
+    """
+    Sends reminders for the appointments on a date, tomorrow by default, on every channel
+    the customer can be contacted on: email when email_is_contactable and SMS when
+    SMS_is_contactable and they have a phone number.
+    The appointments and their customers are loaded in one select_related query and the
+    reminders already sent for the date in one more, so reruns only send what is missing;
+    an appointment moved to another date is reminded again for its new date.
+    Messages are grouped by channel into batches of batch_size, which are sent by up to
+    max_workers threads. A failed batch is retried up to max_attempts times, waiting
+    retry_delay seconds and twice as long after each failure; if it still fails it is
+    not recorded, so the next run tries it again.
+    """
+
+    def __init__(self, backend=None, date=None, batch_size=50, max_workers=4, max_attempts=3, retry_delay=1.0):
+        self.backend = backend or get_reminder_backend()
+        self.date = date or timezone.localdate() + datetime.timedelta(days=1)
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.num_of_sent = 0
+        self.num_of_failed = 0
+        self.num_of_already_sent = 0
+
+    def get_appointments(self):
+        return Appointment.objects.filter(date=self.date, customer__active=True) \
+            .select_related('customer', 'stylist').order_by('start_time')
+
+    def get_sent_reminders(self):
+        return set(Reminder.objects.filter(appointment_date=self.date).values_list('appointment_id', 'channel'))
+
+    def get_recipients(self, customer):
+        if customer.email_is_contactable and customer.email:
+            yield 'email', customer.email
+        if customer.SMS_is_contactable and customer.phone_no:
+            yield 'sms', customer.phone_no
+
+    def get_text(self, appointment):
+        text = "Hi {}, this is a reminder of your appointment on {:%d/%m/%Y}".format(
+            appointment.customer.first_name, appointment.date)
+        if appointment.start_time is not None:
+            text += " at {:%H:%M}".format(appointment.start_time)
+        if appointment.stylist is not None:
+            text += " with {}".format(appointment.stylist.name)
+        return text + "."
+
+    def get_messages_by_channel(self):
+        sent_reminders = self.get_sent_reminders()
+        messages_by_channel = defaultdict(list)
+        for appointment in self.get_appointments():
+            for channel, recipient in self.get_recipients(appointment.customer):
+                if (appointment.id, channel) in sent_reminders:
+                    self.num_of_already_sent += 1
+                    continue
+                messages_by_channel[channel].append(
+                    ReminderMessage(appointment.id, channel, recipient, self.get_text(appointment)))
+        return messages_by_channel
+
+    def iter_batches(self, messages_by_channel):
+        for channel, messages in sorted(messages_by_channel.items()):
+            for start in range(0, len(messages), self.batch_size):
+                yield channel, messages[start:start + self.batch_size]
+
+    def send_batch(self, channel, messages):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.backend.send_messages(channel, messages)
+                return
+            except Exception:
+                if attempt == self.max_attempts:
+                    raise
+                logger.warning("Sending %d %s reminders failed, attempt %d of %d",
+                               len(messages), channel, attempt, self.max_attempts, exc_info=True)
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+
+    def record_sent(self, messages):
+        reminders = [Reminder(appointment_id=message.appointment_id, appointment_date=self.date,
+                              channel=message.channel, recipient=message.recipient) for message in messages]
+        try:
+            with transaction.atomic():
+                Reminder.objects.bulk_create(reminders)
+        except IntegrityError:
+            # Another run recorded some of them first
+            for reminder in reminders:
+                Reminder.objects.get_or_create(appointment_id=reminder.appointment_id,
+                                               appointment_date=reminder.appointment_date,
+                                               channel=reminder.channel,
+                                               defaults={'recipient': reminder.recipient})
+
+    def dispatch(self):
+        """
+        Sends the reminders and returns the numbers sent, failed and already sent.
+        Only the worker threads call the backend; reminders are recorded from this thread.
+        """
+        messages_by_channel = self.get_messages_by_channel()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.send_batch, channel, messages): (channel, messages)
+                       for channel, messages in self.iter_batches(messages_by_channel)}
+            for future in as_completed(futures):
+                channel, messages = futures[future]
+                if future.exception() is not None:
+                    logger.error("Giving up sending %d %s reminders", len(messages), channel,
+                                 exc_info=future.exception())
+                    self.num_of_failed += len(messages)
+                    continue
+                self.record_sent(messages)
+                self.num_of_sent += len(messages)
+        return {'date': self.date.isoformat(),
+                'sent': self.num_of_sent,
+                'failed': self.num_of_failed,
+                'already_sent': self.num_of_already_sent}
@@ -0,0 +1,116 @@
+from collections import namedtuple
+from django.db.models import Count, Max
+from .models import Appointment, OpeningHours, OpeningHoursCalendar, TimeSlots
+from .utils import format_minutes, time_to_minutes
+import datetime
+import hashlib
+
+CalendarBlock = namedtuple('CalendarBlock', ['start_time', 'end_time', 'top', 'height', 'appointment'])
+CalendarDay = namedtuple('CalendarDay', ['date', 'appointment_blocks', 'free_blocks', 'untimed_appointments', 'closed'])
+
+
+class AppointmentCalendar:
+    """
+    Lays out the appointments of a day, or of the Monday to Sunday week containing date,
+    as blocks on a time grid, with the free intervals from TimeSlots drawn between them.
+    Without a stylist the salon is treated as one chair, as in the appointment summary report.
+    The appointments for the whole range come from one select_related query with
+    their services prefetched, so the number of queries does not grow with the appointments.
+    get_etag() changes whenever an appointment in the range is added, changed or deleted,
+    its services, customer or stylist change, or the opening hours change, for conditional
+    GETs from terminals polling the calendar; see the signals moving Appointment.date_modified.
+    """
+    VIEWS = (('week', 'Week'), ('day', 'Day'))
+    minute_height = 1
+    min_block_height = 15
+
+    def __init__(self, date, view='week', stylist=None):
+        self.date = date
+        self.view = view
+        self.stylist = stylist
+        if view == 'day':
+            self.date_from = self.date_to = date
+        else:
+            self.date_from = date - datetime.timedelta(days=date.weekday())
+            self.date_to = self.date_from + datetime.timedelta(days=6)
+        self.num_of_days = (self.date_to - self.date_from).days + 1
+
+    def get_dates(self):
+        return [self.date_from + datetime.timedelta(days=days) for days in range(self.num_of_days)]
+
+    def get_previous_date(self):
+        return self.date_from - datetime.timedelta(days=self.num_of_days)
+
+    def get_next_date(self):
+        return self.date_from + datetime.timedelta(days=self.num_of_days)
+
+    def get_appointments_in_range(self):
+        appointments = Appointment.objects.filter(date__gte=self.date_from, date__lte=self.date_to)
+        if self.stylist is not None:
+            appointments = appointments.filter(stylist=self.stylist)
+        return appointments
+
+    def get_appointments(self):
+        return self.get_appointments_in_range().select_related('customer', 'stylist') \
+            .prefetch_related('services').order_by('date', 'start_time')
+
+    def get_etag(self):
+        appointments = self.get_appointments_in_range().order_by() \
+            .aggregate(num_of_appointments=Count('id'), last_modified=Max('date_modified'))
+        opening_hours = list(OpeningHours.objects.order_by('id')
+                             .values_list('stylist_id', 'weekday', 'start_time', 'end_time'))
+        state = (self.view, self.date_from, getattr(self.stylist, 'pk', None),
+                 appointments['num_of_appointments'], appointments['last_modified'], opening_hours)
+        return hashlib.md5(repr(state).encode('utf-8')).hexdigest()
+
+    def make_block(self, start_minutes, end_minutes, grid_start_minutes, appointment=None):
+        return CalendarBlock(start_time=format_minutes(start_minutes),
+                             end_time=format_minutes(end_minutes),
+                             top=(start_minutes - grid_start_minutes) * self.minute_height,
+                             height=max((end_minutes - start_minutes) * self.minute_height, self.min_block_height),
+                             appointment=appointment)
+
+    def get_calendar(self):
+        """
+        Returns the days of the range with their blocks and the hours of the grid,
+        which runs from the earliest opening or appointment start to the latest closing or end.
+        """
+        opening_hours_calendar = OpeningHoursCalendar()
+        stylist_id = getattr(self.stylist, 'pk', None)
+        appointments_by_date = {}
+        for appointment in self.get_appointments():
+            appointments_by_date.setdefault(appointment.date, []).append(appointment)
+        days = []
+        grid_start_minutes, grid_end_minutes = 9 * 60, 17 * 60
+        for date in self.get_dates():
+            appointments = appointments_by_date.get(date, [])
+            timed_appointments = [appointment for appointment in appointments
+                                  if appointment.start_time is not None and appointment.end_time is not None]
+            time_slots = TimeSlots.for_opening_hours(date, opening_hours_calendar, stylist_id)
+            free_intervals = time_slots.get_free_intervals(
+                [(appointment.start_time, appointment.end_time) for appointment in timed_appointments])
+            if time_slots.day_start_time is not None:
+                grid_start_minutes = min(grid_start_minutes, time_to_minutes(time_slots.day_start_time))
+                grid_end_minutes = max(grid_end_minutes, time_to_minutes(time_slots.day_end_time))
+            for appointment in timed_appointments:
+                grid_start_minutes = min(grid_start_minutes, time_to_minutes(appointment.start_time))
+                grid_end_minutes = max(grid_end_minutes, time_to_minutes(appointment.end_time))
+            days.append((date, timed_appointments, free_intervals, time_slots.day_start_time is None,
+                         [appointment for appointment in appointments
+                          if appointment.start_time is None or appointment.end_time is None]))
+        grid_start_minutes -= grid_start_minutes % 60
+        calendar_days = [
+            CalendarDay(date=date,
+                        appointment_blocks=[self.make_block(time_to_minutes(appointment.start_time),
+                                                            time_to_minutes(appointment.end_time),
+                                                            grid_start_minutes, appointment)
+                                            for appointment in timed_appointments],
+                        free_blocks=[self.make_block(start, end, grid_start_minutes) for start, end in free_intervals],
+                        untimed_appointments=untimed_appointments,
+                        closed=closed)
+            for date, timed_appointments, free_intervals, closed, untimed_appointments in days]
+        hours = [self.make_block(minutes, minutes + 60, grid_start_minutes)
+                 for minutes in range(grid_start_minutes, grid_end_minutes, 60)]
+        return {'days': calendar_days,
+                'hours': hours,
+                'grid_height': (grid_end_minutes - grid_start_minutes) * self.minute_height}
@@ -0,0 +1,62 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import Appointment, Customer, DailySummaryCache, DailySummaryMaker, OpeningHours, Service, Stylist
+from .utils import service_catalogue
+
+
+@receiver(post_delete, sender=Appointment)
+def refresh_daily_summary_on_appointment_delete(sender, instance, **kwargs):
+    DailySummaryMaker().refresh_for_dates([instance.date])
+
+
+@receiver(post_save, sender=OpeningHours)
+@receiver(post_delete, sender=OpeningHours)
+def refresh_daily_summaries_on_opening_hours_change(sender, instance, **kwargs):
+    # The free time slots of the daily summaries are worked out from the salon's opening hours
+    DailySummaryMaker().refresh_for_weekdays(instance.get_salon_weekdays_changed())
+    instance._loaded_stylist_weekday = (instance.stylist_id, instance.weekday)
+    # as are the open minutes and utilisation of the cached monthly rollups of the analytics report
+    DailySummaryCache().invalidate_all()
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def invalidate_service_catalogue(sender, **kwargs):
+    service_catalogue.invalidate()
+    # The monthly rollups of the analytics report use the current service prices
+    DailySummaryCache().invalidate_all()
+
+
+@receiver(m2m_changed, sender=Appointment.services.through)
+def invalidate_on_appointment_services_change(sender, instance, action, reverse, pk_set, **kwargs):
+    # Changing services also moves date_modified, which the appointment calendar's ETag is worked out from
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        DailySummaryCache().invalidate_dates([instance.date])
+        if not instance._saving_services:
+            instance.date_modified = timezone.now()
+            Appointment.objects.filter(id=instance.id).update(date_modified=instance.date_modified)
+        return
+    appointments = Appointment.objects.filter(services=instance)
+    if pk_set is not None:
+        appointments = Appointment.objects.filter(id__in=pk_set)
+    DailySummaryCache().invalidate_dates(appointments.values_list('date', flat=True).distinct())
+    appointments.update(date_modified=timezone.now())
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Stylist)
+@receiver(pre_delete, sender=Stylist)
+@receiver(post_save, sender=Service)
+@receiver(pre_delete, sender=Service)
+def touch_appointments_on_calendar_change(sender, instance, created=False, **kwargs):
+    """
+    Moves date_modified on the appointments showing the customer, stylist or service,
+    so the appointment calendar's ETag changes when they are renamed or deleted
+    """
+    if created:
+        return
+    lookup = {Customer: 'customer', Stylist: 'stylist', Service: 'services'}[sender]
+    Appointment.objects.filter(**{lookup: instance}).update(date_modified=timezone.now())
@@ -1,10 +1,34 @@
-from django.test import TestCase
-from django.db import IntegrityError
+from django.test import TestCase, TransactionTestCase
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db import models as django_models
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.urls import reverse
 from django.core.exceptions import ValidationError
-from . import models
+from . import benchmarks, booking, exporters, middleware, models, payments
+from .analytics import RevenueAnalytics
+from .forms import RevenueAnalyticsFilterForm
+from .availability import AvailabilityFinder, AvailableSlot
+from .importers import CustomerImporter
+from .reminders import ConsoleReminderBackend, ReminderDispatcher
+from .schedule import AppointmentCalendar
+from .utils import AppointmentUtil, ServiceCatalogue, service_catalogue
 # from faker import Faker
+import csv
+import json
 import logging
 import datetime
+import os
+import tempfile
+import threading
+from io import StringIO
+from operator import itemgetter
+from unittest import mock
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -77,9 +101,20 @@ class CustomerTestCase(TestCase):
         with self.assertRaises(ValidationError):
             self.customer_1.validate_phone_no()
 
+    def test_phone_not_valid_format_3(self):
+        self.customer_1.phone_no = "01632 96O343"
+        with self.assertRaises(ValidationError):
+            self.customer_1.validate_phone_no()
+
+    def test_phone_with_non_ascii_digits_not_valid(self):
+        self.customer_1.phone_no = "01632 96034\u00b2"
+        with self.assertRaises(ValidationError):
+            self.customer_1.validate_phone_no()
+
 
 class GenericTestCase(TestCase):
     def setUp(self):
+        cache.clear()
         self.date = datetime.date(2019, 4, 9)
         self.service_1 = models.Service.objects.create(service="hair service1",
                                                        price=40,
@@ -168,3 +203,1780 @@ class AppointmentReportMakerTestCase(GenericTestCase):
         """
         time_slots_available = self.appointment_report_maker.get_time_slots_available_for_date(self.date)
         self.assertEqual(time_slots_available, '09:00-11:00 | 12:20-17:00')
+
+    def test_summary_report_matches_per_date_summary(self):
+        self.appointment_1.date_paid = self.date
+        self.appointment_1.save()
+        appointment_3 = models.Appointment.objects.create(date=self.date + datetime.timedelta(days=1),
+                                                          start_time=datetime.time(9, 0),
+                                                          customer=self.customer_1)
+        appointment_3.services.add(self.service_2)
+        appointment_3.save()
+        summary_report = self.appointment_report_maker.get_appointment_summary_report()
+        expected = []
+        for date in self.appointment_report_maker.get_appointment_dates():
+            daily_appointment_summary = self.appointment_report_maker.get_income_summary_for_date(date)
+            daily_appointment_summary['date'] = date
+            daily_appointment_summary['count'] = self.appointment_report_maker.get_num_of_appointments_for_date(date)
+            daily_appointment_summary['time_slots_available'] = \
+                self.appointment_report_maker.get_time_slots_available_for_date(date)
+            expected.append(daily_appointment_summary)
+        self.assertEqual(summary_report['context_dict']['appointment_summary'], expected)
+
+    def test_summary_report_query_count_independent_of_dates(self):
+        """
+        One query each for the daily totals, booked time slots and opening hours
+        """
+        for days in range(1, 6):
+            appointment = models.Appointment.objects.create(date=self.date + datetime.timedelta(days=days),
+                                                            start_time=datetime.time(10, 0),
+                                                            customer=self.customer_1)
+            appointment.services.add(self.service_1)
+            appointment.save()
+        with self.assertNumQueries(3):
+            summary_report = self.appointment_report_maker.get_appointment_summary_report()
+        self.assertEqual(len(summary_report['context_dict']['appointment_summary']), 6)
+
+
+class AppointmentReportMakerPaginationTestCase(GenericTestCase):
+    """
+    TestCase for date range filtering and keyset pagination in AppointmentReportMaker
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.AppointmentReportMakerPaginationTestCase
+    """
+
+    def setUp(self):
+        super(AppointmentReportMakerPaginationTestCase, self).setUp()
+        for days in range(1, 5):
+            appointment = models.Appointment.objects.create(date=self.date + datetime.timedelta(days=days),
+                                                            start_time=datetime.time(10, 0),
+                                                            customer=self.customer_1)
+            appointment.services.add(self.service_1)
+            appointment.save()
+
+    def get_report_dates(self, appointment_report_maker):
+        summary_report = appointment_report_maker.get_appointment_summary_report()
+        return [day['date'] for day in summary_report['context_dict'].get('appointment_summary', [])]
+
+    def test_date_range_is_inclusive(self):
+        appointment_report_maker = models.AppointmentReportMaker(date_from=self.date + datetime.timedelta(days=1),
+                                                                 date_to=self.date + datetime.timedelta(days=2))
+        self.assertEqual(self.get_report_dates(appointment_report_maker),
+                         [self.date + datetime.timedelta(days=1), self.date + datetime.timedelta(days=2)])
+
+    def test_page_size_sets_next_after(self):
+        appointment_report_maker = models.AppointmentReportMaker(page_size=2)
+        summary_report = appointment_report_maker.get_appointment_summary_report()
+        self.assertEqual(len(summary_report['context_dict']['appointment_summary']), 2)
+        self.assertEqual(summary_report['context_dict']['next_after'], self.date + datetime.timedelta(days=1))
+
+    def test_keyset_pages_cover_all_dates_once(self):
+        report_dates = []
+        after = None
+        while True:
+            appointment_report_maker = models.AppointmentReportMaker(after=after, page_size=2)
+            report_dates += self.get_report_dates(appointment_report_maker)
+            after = appointment_report_maker.next_after
+            if after is None:
+                break
+        self.assertEqual(report_dates, [self.date + datetime.timedelta(days=days) for days in range(5)])
+
+    def test_last_page_has_no_next_after(self):
+        appointment_report_maker = models.AppointmentReportMaker(after=self.date + datetime.timedelta(days=2),
+                                                                 page_size=2)
+        summary_report = appointment_report_maker.get_appointment_summary_report()
+        self.assertNotIn('next_after', summary_report['context_dict'])
+
+    def test_paginated_report_time_slots_for_date(self):
+        appointment_report_maker = models.AppointmentReportMaker(page_size=1)
+        summary_report = appointment_report_maker.get_appointment_summary_report()
+        self.assertEqual(summary_report['context_dict']['appointment_summary'][0]['time_slots_available'],
+                         '09:00-11:00 | 11:40-17:00')
+
+
+class AppointmentSummaryReportViewTestCase(GenericTestCase):
+    """
+    TestCase for the appointment_summary_report view in views.py
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.AppointmentSummaryReportViewTestCase
+    """
+
+    def setUp(self):
+        super(AppointmentSummaryReportViewTestCase, self).setUp()
+        User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.client.login(username='admin', password='password')
+        self.url = reverse('appointment_summary_report')
+
+    def test_defaults_to_current_month(self):
+        response = self.client.get(self.url)
+        today = datetime.date.today()
+        self.assertEqual(response.context['date_from'], today.replace(day=1))
+        self.assertNotContains(response, 'hair service1')
+        self.assertNotIn('appointment_summary', response.context)
+
+    def test_date_range_filter(self):
+        response = self.client.get(self.url, {'date_from': '2019-04-01', 'date_to': '2019-04-30'})
+        self.assertEqual([day['date'] for day in response.context['appointment_summary']], [self.date])
+
+    def test_next_page_link(self):
+        appointment = models.Appointment.objects.create(date=self.date + datetime.timedelta(days=1),
+                                                        start_time=datetime.time(10, 0),
+                                                        customer=self.customer_1)
+        appointment.services.add(self.service_1)
+        appointment.save()
+        response = self.client.get(self.url, {'date_from': '2019-04-01', 'date_to': '2019-04-30',
+                                              'page_size': 1})
+        self.assertIn('after=2019-04-09', response.context['next_page_query'])
+
+    def test_invalid_range_shows_error(self):
+        response = self.client.get(self.url, {'date_from': '2019-04-30', 'date_to': '2019-04-01'})
+        self.assertContains(response, 'Please ensure the from date is not after the to date')
+
+
+class DailySummaryTestCase(GenericTestCase):
+    """
+    TestCase for the DailySummary table maintained by DailySummaryMaker in models.py
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.DailySummaryTestCase
+    """
+
+    def get_daily_summary(self, date=None):
+        return models.DailySummary.objects.get(date=date or self.date)
+
+    def test_summary_created_on_appointment_save(self):
+        daily_summary = self.get_daily_summary()
+        self.assertEqual(daily_summary.count, 1)
+        self.assertEqual(daily_summary.forecasted_income, 40)
+        self.assertEqual(daily_summary.paid_income, 0)
+        self.assertEqual(daily_summary.booked_minutes, 40)
+        self.assertEqual(daily_summary.time_slots_available, '09:00-11:00 | 11:40-17:00')
+
+    def test_summary_updates_when_paid(self):
+        self.appointment_1.date_paid = self.date
+        self.appointment_1.save()
+        self.assertEqual(self.get_daily_summary().paid_income, 40)
+
+    def test_summary_updates_when_services_change(self):
+        self.appointment_1.services.add(self.service_2)
+        self.appointment_1.save()
+        daily_summary = self.get_daily_summary()
+        self.assertEqual(daily_summary.forecasted_income, 90)
+        self.assertEqual(daily_summary.booked_minutes, 90)
+
+    def test_summary_moves_when_date_changes(self):
+        appointment = models.Appointment.objects.get(id=self.appointment_1.id)
+        new_date = self.date + datetime.timedelta(days=1)
+        appointment.date = new_date
+        appointment.save()
+        self.assertFalse(models.DailySummary.objects.filter(date=self.date).exists())
+        self.assertEqual(self.get_daily_summary(new_date).count, 1)
+
+    def test_summary_removed_on_appointment_delete(self):
+        self.appointment_1.delete()
+        self.assertFalse(models.DailySummary.objects.filter(date=self.date).exists())
+
+    def test_rebuild_matches_appointment_report(self):
+        models.DailySummary.objects.all().delete()
+        call_command('rebuild_daily_summaries', stdout=StringIO())
+        summary_report = models.AppointmentReportMaker().get_appointment_summary_report()
+        daily_summary_report = models.DailySummaryReportMaker().get_appointment_summary_report()
+        self.assertEqual(daily_summary_report, summary_report)
+
+    def test_daily_summary_report_is_one_query(self):
+        with self.assertNumQueries(1):
+            models.DailySummaryReportMaker(page_size=31).get_appointment_summary_report()
+
+    def test_time_slots_available_is_not_limited_to_255_characters(self):
+        # A day with a short appointment every twenty minutes has more free intervals than fit in 255 characters
+        time_slots = [(datetime.time(hour, minute), datetime.time(hour, minute + 10))
+                      for hour in range(9, 17) for minute in (0, 20, 40)]
+        time_slots_available = models.TimeSlots(self.date).consolidate_available_time_slots_for_date(time_slots)
+        self.assertGreater(len(time_slots_available), 255)
+        self.assertIsInstance(models.DailySummary._meta.get_field('time_slots_available'), django_models.TextField)
+
+    def test_appointment_save_rolled_back_when_summary_refresh_fails(self):
+        with mock.patch.object(models.DailySummaryMaker, 'refresh_for_dates', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                models.Appointment(date=self.date, start_time=datetime.time(14, 0),
+                                   customer=self.customer_1).save(services=[self.service_1])
+        self.assertFalse(models.Appointment.objects.filter(start_time=datetime.time(14, 0)).exists())
+
+    def test_refresh_locks_dates_in_its_transaction(self):
+        new_date = self.date + datetime.timedelta(days=1)
+        lock_dates = models.BookingDateLock.lock_dates
+        lock_calls = []
+
+        def record_lock(dates):
+            lock_calls.append((sorted(dates), connection.in_atomic_block))
+            return lock_dates(dates)
+        with mock.patch.object(models.BookingDateLock, 'lock_dates', side_effect=record_lock):
+            models.DailySummaryMaker().refresh_for_dates([new_date, self.date, None])
+        self.assertEqual(lock_calls, [([self.date, new_date], True)])
+        self.assertTrue(models.BookingDateLock.objects.filter(date=new_date).exists())
+
+
+class AppointmentAdminSaveTestCase(GenericTestCase):
+    """
+    TestCase for the number of queries made when saving an appointment
+    through AppointmentAdmin in admin.py
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.AppointmentAdminSaveTestCase
+    """
+
+    def setUp(self):
+        super(AppointmentAdminSaveTestCase, self).setUp()
+        User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.client.login(username='admin', password='password')
+
+    def get_appointment_post_data(self, **kwargs):
+        post_data = {'customer': self.customer_1.id,
+                     'date': '2019-04-09',
+                     'start_time': '14:00',
+                     'services': [self.service_1.id, self.service_2.id],
+                     'date_paid': ''}
+        post_data.update(kwargs)
+        return post_data
+
+    def get_appointment_writes(self, queries):
+        return [query['sql'] for query in queries
+                if query['sql'].startswith(('INSERT INTO "salon_crm_base_appointment" ',
+                                            'UPDATE "salon_crm_base_appointment" '))]
+
+    def test_admin_add_writes_appointment_once(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse('admin:salon_crm_base_appointment_add'),
+                                        self.get_appointment_post_data())
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(self.get_appointment_writes(context.captured_queries)), 1)
+        appointment = models.Appointment.objects.get(start_time=datetime.time(14, 0))
+        self.assertEqual(appointment.end_time, datetime.time(15, 30))
+        self.assertEqual(appointment.quote, 90)
+        self.assertEqual(set(appointment.services.all()), {self.service_1, self.service_2})
+
+    def test_admin_change_writes_appointment_once(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse('admin:salon_crm_base_appointment_change',
+                                                args=[self.appointment_1.id]),
+                                        self.get_appointment_post_data(start_time='11:00'))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(self.get_appointment_writes(context.captured_queries)), 1)
+        self.appointment_1.refresh_from_db()
+        self.assertEqual(self.appointment_1.end_time, datetime.time(12, 30))
+        self.assertEqual(self.appointment_1.quote, 90)
+
+    def test_admin_add_rejects_clashing_appointment(self):
+        response = self.client.post(reverse('admin:salon_crm_base_appointment_add'),
+                                    self.get_appointment_post_data(start_time='11:20'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Please select another appointment time')
+        self.assertEqual(models.Appointment.objects.count(), 1)
+
+    def test_admin_save_locks_date_in_its_transaction(self):
+        lock_booking_dates = booking.lock_booking_dates
+        lock_calls = []
+
+        def record_lock(dates):
+            lock_calls.append((dates, connection.in_atomic_block))
+            return lock_booking_dates(dates)
+        with mock.patch('salon_crm_base.booking.lock_booking_dates', side_effect=record_lock):
+            response = self.client.post(reverse('admin:salon_crm_base_appointment_change',
+                                                args=[self.appointment_1.id]),
+                                        self.get_appointment_post_data(start_time='11:00'))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(lock_calls, [([self.date], True)])
+
+    def test_admin_change_can_keep_its_own_slot(self):
+        response = self.client.post(reverse('admin:salon_crm_base_appointment_change',
+                                            args=[self.appointment_1.id]),
+                                    self.get_appointment_post_data(start_time='11:10'))
+        self.assertEqual(response.status_code, 302)
+        self.appointment_1.refresh_from_db()
+        self.assertEqual(self.appointment_1.start_time, datetime.time(11, 10))
+
+    def test_save_with_services_query_count(self):
+        """
+        A single update of the appointment with no select of its services,
+        three queries to set the services and nine to lock the date and refresh the daily summary,
+        all inside one savepoint.
+        """
+        services = [self.service_1, self.service_2]
+        with self.assertNumQueries(15):
+            self.appointment_1.save(services=services)
+        self.assertEqual(self.appointment_1.end_time, datetime.time(12, 30))
+
+    def test_admin_change_query_count(self):
+        """
+        Pins the queries of a whole change form POST: the services are set once by save_model
+        and not again by save_related, so the through table is written by three queries only.
+        Four of the queries lock the date, check for active stylists and check for clashes,
+        and two more take the same lock again before the daily summary is refreshed.
+        """
+        ContentType.objects.clear_cache()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse('admin:salon_crm_base_appointment_change',
+                                                args=[self.appointment_1.id]),
+                                        self.get_appointment_post_data(start_time='11:00'))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(context.captured_queries), 30)
+        services_writes = [query['sql'] for query in context.captured_queries
+                           if 'salon_crm_base_appointment_services' in query['sql'] and
+                           'prefetch_related' not in query['sql']]
+        self.assertEqual(len(services_writes), 3)
+        self.assertEqual(set(self.appointment_1.services.all()), {self.service_1, self.service_2})
+
+
+class AppointmentClashTestCase(GenericTestCase):
+    """
+    TestCase for check_no_appointment_clashes and find_appointment_clashes in models.py
+    appointment_1 is booked 11:00-11:40
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.AppointmentClashTestCase
+    """
+
+    def make_appointment(self, start_time, end_time, date=None):
+        return models.Appointment(date=date or self.date, start_time=start_time, end_time=end_time,
+                                  customer=self.customer_1)
+
+    def test_clash_raises_validation_error(self):
+        with self.assertRaises(ValidationError):
+            models.check_no_appointment_clashes(None, self.date, datetime.time(11, 30), datetime.time(12, 0))
+
+    def test_clash_check_is_one_query(self):
+        # One more query checks for active stylists when the appointment has no stylist
+        with self.assertNumQueries(2):
+            models.check_no_appointment_clashes(None, self.date, datetime.time(12, 0), datetime.time(13, 0))
+
+    def test_no_clash_with_itself(self):
+        self.assertEqual(models.check_no_appointment_clashes(self.appointment_1.id, self.date,
+                                                             datetime.time(11, 0), datetime.time(11, 40)), True)
+
+    def test_adjacent_appointments_do_not_clash(self):
+        appointments = [self.make_appointment(datetime.time(10, 0), datetime.time(11, 0)),
+                        self.make_appointment(datetime.time(11, 40), datetime.time(12, 0))]
+        self.assertEqual(models.find_appointment_clashes(appointments), [])
+
+    def test_finds_every_clash_in_one_query(self):
+        clashing_existing = self.make_appointment(datetime.time(11, 30), datetime.time(12, 0))
+        clashing_in_batch = self.make_appointment(datetime.time(11, 50), datetime.time(12, 30))
+        free = self.make_appointment(datetime.time(11, 0), datetime.time(12, 0),
+                                     date=self.date + datetime.timedelta(days=7))
+        with self.assertNumQueries(1):
+            clashes = models.find_appointment_clashes([clashing_existing, clashing_in_batch, free])
+        self.assertEqual(len(clashes), 2)
+        self.assertEqual(clashes[0][0], clashing_existing)
+        self.assertEqual(clashes[0][1].id, self.appointment_1.id)
+        self.assertEqual(clashes[1], (clashing_in_batch, clashing_existing))
+
+    def test_bulk_check_reports_all_clashes(self):
+        appointments = [self.make_appointment(datetime.time(10, 30), datetime.time(11, 10)),
+                        self.make_appointment(datetime.time(11, 30), datetime.time(12, 0),
+                                              date=self.date)]
+        with self.assertRaises(ValidationError) as context:
+            models.check_no_appointment_clashes_for_appointments(appointments)
+        self.assertEqual(len(context.exception.messages), 2)
+
+
+class BookRecurringSeriesTestCase(GenericTestCase):
+    """
+    TestCase for book_recurring_series in booking.py
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.BookRecurringSeriesTestCase
+    """
+
+    def book_series(self, weeks, start_time=datetime.time(14, 0)):
+        return booking.book_recurring_series(self.customer_1, [self.service_1, self.service_2], start_time,
+                                             self.date, weeks)
+
+    def test_books_every_week(self):
+        appointments = self.book_series(4)
+        self.assertEqual([appointment.date for appointment in appointments],
+                         [self.date + datetime.timedelta(weeks=week) for week in range(4)])
+        for appointment in models.Appointment.objects.filter(start_time=datetime.time(14, 0)):
+            self.assertEqual(appointment.end_time, datetime.time(15, 30))
+            self.assertEqual(appointment.quote, 90)
+            self.assertEqual(set(appointment.services.all()), {self.service_1, self.service_2})
+
+    def test_updates_daily_summaries(self):
+        self.book_series(2)
+        self.assertEqual(models.DailySummary.objects.get(date=self.date).count, 2)
+        self.assertEqual(models.DailySummary.objects.get(date=self.date + datetime.timedelta(weeks=1)).count, 1)
+
+    def test_clash_books_nothing(self):
+        with self.assertRaises(ValidationError):
+            self.book_series(3, start_time=datetime.time(10, 30))
+        self.assertEqual(models.Appointment.objects.count(), 1)
+
+    def test_query_count_independent_of_weeks(self):
+        with CaptureQueriesContext(connection) as context:
+            self.book_series(2)
+        with self.assertNumQueries(len(context.captured_queries)):
+            self.book_series(20, start_time=datetime.time(16, 0))
+
+
+class BookAppointmentTestCase(GenericTestCase):
+    """
+    TestCase for book_appointment and lock_booking_dates in booking.py
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.BookAppointmentTestCase
+    """
+
+    def test_books_free_slot(self):
+        appointment = booking.book_appointment(self.customer_1, [self.service_2], self.date, datetime.time(14, 0))
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.end_time, datetime.time(14, 50))
+        self.assertEqual(appointment.quote, 50)
+        self.assertEqual(list(appointment.services.all()), [self.service_2])
+        self.assertTrue(models.BookingDateLock.objects.filter(date=self.date).exists())
+
+    def test_clash_books_nothing(self):
+        with self.assertRaises(ValidationError):
+            booking.book_appointment(self.customer_1, [self.service_2], self.date, datetime.time(11, 30))
+        self.assertEqual(models.Appointment.objects.count(), 1)
+
+    def test_lock_booking_dates_creates_missing_rows_once(self):
+        dates = [self.date, self.date + datetime.timedelta(days=1)]
+        booking.lock_booking_dates(dates[:1])
+        locks = booking.lock_booking_dates(dates + dates)
+        self.assertEqual([lock.date for lock in locks], dates)
+        self.assertEqual(models.BookingDateLock.objects.count(), 2)
+
+
+class FlakyReminderBackend(ConsoleReminderBackend):
+    def __init__(self, failures):
+        super(FlakyReminderBackend, self).__init__(stream=StringIO())
+        self.failures = failures
+
+    def send_messages(self, channel, messages):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("gateway unavailable")
+        super(FlakyReminderBackend, self).send_messages(channel, messages)
+
+
+class ReminderDispatcherTestCase(GenericTestCase):
+    """
+    TestCase for ReminderDispatcher in reminders.py and the send_reminders command
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.ReminderDispatcherTestCase
+    """
+
+    def setUp(self):
+        super(ReminderDispatcherTestCase, self).setUp()
+        self.customer_1.email_is_contactable = True
+        self.customer_1.SMS_is_contactable = True
+        self.customer_1.phone_no = '07123 456789'
+        self.customer_1.save()
+        self.customer_2 = models.Customer.objects.create(first_name='jane', last_name='doe', email='jane@test.com',
+                                                         email_is_contactable=True)
+        self.customer_3 = models.Customer.objects.create(first_name='jim', last_name='doe', email='jim@test.com')
+        for customer, start_time in ((self.customer_2, datetime.time(13, 0)),
+                                     (self.customer_3, datetime.time(14, 0))):
+            models.Appointment.objects.create(date=self.date, start_time=start_time, customer=customer)
+
+    def dispatch(self, backend=None, **kwargs):
+        self.backend = backend or ConsoleReminderBackend(stream=StringIO())
+        return ReminderDispatcher(backend=self.backend, date=self.date, retry_delay=0, **kwargs).dispatch()
+
+    def test_sends_on_contactable_channels_only(self):
+        results = self.dispatch(batch_size=1)
+        self.assertEqual((results['sent'], results['failed']), (3, 0))
+        output = self.backend.stream.getvalue()
+        self.assertIn('[sms] 07123 456789: Hi test_first_name', output)
+        self.assertIn('[email] jane@test.com', output)
+        self.assertNotIn('jim@test.com', output)
+        self.assertEqual(set(models.Reminder.objects.values_list('channel', 'recipient')),
+                         {('email', 'test@test.com'), ('sms', '07123 456789'), ('email', 'jane@test.com')})
+
+    def test_rerun_sends_nothing_with_two_queries(self):
+        self.dispatch()
+        with self.assertNumQueries(2):
+            results = self.dispatch()
+        self.assertEqual((results['sent'], results['already_sent']), (0, 3))
+        self.assertEqual(self.backend.stream.getvalue(), '')
+
+    def test_rescheduled_appointment_is_reminded_again(self):
+        self.dispatch()
+        self.appointment_1.date = self.date + datetime.timedelta(days=7)
+        self.appointment_1.save()
+        self.date = self.appointment_1.date
+        results = self.dispatch()
+        self.assertEqual((results['sent'], results['already_sent']), (2, 0))
+        self.assertEqual(models.Reminder.objects.filter(appointment=self.appointment_1).count(), 4)
+
+    def test_appointment_without_time_is_reminded_without_it(self):
+        models.Appointment.objects.filter(id=self.appointment_1.id).update(start_time=None, end_time=None)
+        results = self.dispatch()
+        self.assertEqual((results['sent'], results['failed']), (3, 0))
+        self.assertIn('[email] test@test.com: Hi test_first_name, this is a reminder of your appointment on '
+                      '09/04/2019.', self.backend.stream.getvalue())
+
+    def test_retries_failed_batches(self):
+        with self.assertLogs('salon_crm_base.reminders', level='WARNING') as logs:
+            results = self.dispatch(backend=FlakyReminderBackend(failures=2), max_workers=1)
+        self.assertEqual(len(logs.output), 2)
+        self.assertEqual((results['sent'], results['failed']), (3, 0))
+
+    def test_failed_batches_are_not_recorded(self):
+        with self.assertLogs('salon_crm_base.reminders', level='ERROR'):
+            results = self.dispatch(backend=FlakyReminderBackend(failures=10), max_attempts=2, max_workers=1)
+        self.assertEqual((results['sent'], results['failed']), (0, 3))
+        self.assertFalse(models.Reminder.objects.exists())
+
+    def test_send_reminders_command_with_file_backend(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, 'reminders.jsonl')
+            stdout = StringIO()
+            with self.settings(REMINDER_FILE_PATH=file_path):
+                call_command('send_reminders', date=self.date, backend='salon_crm_base.reminders.FileReminderBackend',
+                             stdout=stdout)
+            with open(file_path) as reminder_file:
+                reminders = [json.loads(line) for line in reminder_file]
+        self.assertEqual(json.loads(stdout.getvalue())['sent'], 3)
+        self.assertEqual(sorted(reminder['channel'] for reminder in reminders), ['email', 'email', 'sms'])
+
+
+class OutstandingPaymentsTestCase(GenericTestCase):
+    """
+    TestCase for OutstandingPaymentsLedger and mark_appointments_paid in payments.py,
+    the outstanding_payments view and the mark paid admin action
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.OutstandingPaymentsTestCase
+    """
+
+    def setUp(self):
+        super(OutstandingPaymentsTestCase, self).setUp()
+        self.as_of = self.date + datetime.timedelta(days=45)
+        self.customer_2 = models.Customer.objects.create(first_name='jane', last_name='doe', email='jane@test.com')
+        for customer, days, services, date_paid in ((self.customer_1, 40, [self.service_2], None),
+                                                    (self.customer_2, 10, [self.service_1, self.service_2], None),
+                                                    (self.customer_2, 20, [self.service_1], self.date),
+                                                    (self.customer_2, 60, [self.service_1], None)):
+            models.Appointment(date=self.date + datetime.timedelta(days=days), start_time=datetime.time(10, 0),
+                               customer=customer, date_paid=date_paid).save(services=services)
+        User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.client.login(username='admin', password='password')
+
+    def test_balances_per_customer_with_aging_buckets(self):
+        with self.assertNumQueries(1):
+            ledger = payments.OutstandingPaymentsLedger(as_of=self.as_of).get_ledger()
+        customer_1_balance, customer_2_balance = ledger['customer_balances']
+        self.assertEqual(customer_1_balance['customer_id'], self.customer_1.id)
+        self.assertEqual((customer_1_balance['num_of_appointments'], customer_1_balance['outstanding']), (2, 90))
+        self.assertEqual((customer_1_balance['aged_0_30'], customer_1_balance['aged_31_60']), (50, 40))
+        self.assertEqual(customer_1_balance['oldest_date'], self.date)
+        self.assertEqual((customer_2_balance['num_of_appointments'], customer_2_balance['outstanding']), (1, 90))
+        self.assertEqual(customer_2_balance['aged_31_60'], 90)
+        self.assertEqual(ledger['totals']['outstanding'], 180)
+        self.assertEqual(ledger['totals']['aged_over_90'], 0)
+
+    def test_unpaid_query_uses_index(self):
+        unpaid_appointments = payments.OutstandingPaymentsLedger(as_of=self.as_of).get_unpaid_appointments() \
+            .values('customer_id').annotate(outstanding=Sum('quote'))
+        sql, params = unpaid_appointments.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            query_plan = [row[-1] for row in cursor.fetchall()]
+        self.assertTrue(any('appointment_unpaid_idx' in step for step in query_plan), query_plan)
+
+    def test_view_and_json(self):
+        response = self.client.get(reverse('outstanding_payments'), {'as_of': self.as_of.isoformat()})
+        self.assertContains(response, 'jane doe')
+        self.assertContains(response, '31-60 days')
+        response = self.client.get(reverse('outstanding_payments'), {'as_of': self.as_of.isoformat(),
+                                                                     'customer': self.customer_2.id,
+                                                                     'format': 'json'})
+        customer_balances = response.json()['customer_balances']
+        self.assertEqual([balance['customer__email'] for balance in customer_balances], ['jane@test.com'])
+        response = self.client.get(reverse('admin:salon_crm_base_appointment_changelist'),
+                                   {'customer__id__exact': self.customer_2.id, 'date_paid__isnull': 'True'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_mark_paid_with_one_update_refreshes_summaries(self):
+        unpaid_appointments = models.Appointment.objects.filter(customer=self.customer_2)
+        num_of_paid = payments.mark_appointments_paid(unpaid_appointments, date_paid=self.as_of)
+        self.assertEqual(num_of_paid, 2)
+        self.assertEqual(models.Appointment.objects.filter(date_paid=self.as_of).count(), 2)
+        daily_summary = models.DailySummary.objects.get(date=self.date + datetime.timedelta(days=10))
+        self.assertEqual(daily_summary.paid_income, 90)
+
+    def test_mark_paid_admin_action(self):
+        appointment_ids = models.Appointment.objects.filter(customer=self.customer_1).values_list('id', flat=True)
+        response = self.client.post(reverse('admin:salon_crm_base_appointment_changelist'),
+                                    {'action': 'mark_paid', '_selected_action': list(appointment_ids)},
+                                    follow=True)
+        self.assertContains(response, 'Marked 2 appointments as paid today')
+        self.assertFalse(models.Appointment.objects.filter(customer=self.customer_1, date_paid=None).exists())
+
+
+class RevenueAnalyticsTestCase(GenericTestCase):
+    """
+    TestCase for RevenueAnalytics in analytics.py and the revenue_analytics view
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.RevenueAnalyticsTestCase
+    """
+
+    def setUp(self):
+        super(RevenueAnalyticsTestCase, self).setUp()
+        self.customer_2 = models.Customer.objects.create(first_name='jane', last_name='doe', email='jane@test.com')
+        for customer, date, services, date_paid in (
+                (self.customer_1, datetime.date(2019, 4, 20), [self.service_1, self.service_2], self.date),
+                (self.customer_2, datetime.date(2019, 5, 2), [self.service_2], None),
+                (self.customer_2, datetime.date(2019, 3, 31), [self.service_2], None)):
+            models.Appointment(date=date, start_time=datetime.time(10, 0), customer=customer,
+                               date_paid=date_paid).save(services=services)
+        self.today = datetime.date(2019, 5, 15)
+
+    def get_report(self):
+        return RevenueAnalytics(datetime.date(2019, 4, 1), datetime.date(2019, 5, 31), today=self.today).get_report()
+
+    def test_monthly_rollups(self):
+        april, may = self.get_report()['monthly_rollups']
+        self.assertEqual((april['num_of_appointments'], april['num_of_customers']), (2, 1))
+        self.assertEqual((april['forecasted_income'], april['paid_income']), (130, 90))
+        self.assertEqual(april['booked_minutes'], 40 + 90)
+        self.assertEqual(april['open_minutes'], 30 * 8 * 60)
+        self.assertAlmostEqual(april['utilisation'], 130 / (30 * 8 * 60))
+        self.assertEqual((may['num_of_appointments'], may['forecasted_income']), (1, 50))
+
+    def test_service_totals_and_top_customers(self):
+        report = self.get_report()
+        self.assertEqual([(service['service__service'], service['num_of_appointments'], service['revenue'])
+                          for service in report['service_totals']],
+                         [('hair service2', 2, 100), ('hair service1', 2, 80)])
+        self.assertEqual([(customer['customer_id'], customer['lifetime_value'])
+                          for customer in report['top_customers']],
+                         [(self.customer_1.id, 130), (self.customer_2.id, 100)])
+        self.assertEqual(report['totals']['forecasted_income'], 180)
+
+    def test_closed_months_are_cached_until_changed(self):
+        with self.assertNumQueries(5):
+            self.get_report()
+        with self.assertNumQueries(5):
+            self.get_report()
+        self.today = datetime.date(2019, 6, 1)
+        self.get_report()
+        with self.assertNumQueries(1):
+            report = self.get_report()
+        self.assertEqual(report['monthly_rollups'][0]['forecasted_income'], 130)
+        models.Appointment(date=datetime.date(2019, 4, 25), start_time=datetime.time(10, 0),
+                           customer=self.customer_2).save(services=[self.service_1])
+        self.assertEqual(self.get_report()['monthly_rollups'][0]['forecasted_income'], 170)
+
+    def test_opening_hours_change_invalidates_closed_months(self):
+        self.today = datetime.date(2019, 6, 1)
+        self.assertEqual(self.get_report()['monthly_rollups'][0]['open_minutes'], 30 * 8 * 60)
+        models.OpeningHours.objects.create(weekday=6, start_time=datetime.time(10, 0), end_time=datetime.time(16, 0))
+        # Only Sundays are open now; April 2019 had four
+        self.assertEqual(self.get_report()['monthly_rollups'][0]['open_minutes'], 4 * 6 * 60)
+
+    def test_report_page(self):
+        User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.client.login(username='admin', password='password')
+        response = self.client.get(reverse('revenue_analytics'), {'month_from': '2019-04-01',
+                                                                  'month_to': '2019-05-01'})
+        self.assertEqual([month['month'] for month in response.context['monthly_rollups']],
+                         [datetime.date(2019, 4, 1), datetime.date(2019, 5, 1)])
+        self.assertContains(response, 'hair service2')
+        response = self.client.get(reverse('revenue_analytics'), {'month_from': '2019-05-01',
+                                                                  'month_to': '2019-04-01'})
+        self.assertContains(response, 'Please ensure the from month is not after the to month')
+
+    def test_month_range_is_capped_without_month_to(self):
+        filter_form = RevenueAnalyticsFilterForm({'month_from': '1900-01-01'})
+        report_filters = filter_form.get_report_filters(today=self.today)
+        self.assertEqual(report_filters, {'month_from': datetime.date(2014, 6, 1),
+                                          'month_to': datetime.date(2019, 5, 1)})
+        self.assertEqual(len(RevenueAnalytics(today=self.today, **report_filters).get_months()),
+                         RevenueAnalyticsFilterForm.MAX_NUM_OF_MONTHS)
+        self.assertEqual(RevenueAnalyticsFilterForm({}).get_report_filters(today=self.today),
+                         {'month_from': datetime.date(2018, 6, 1), 'month_to': datetime.date(2019, 5, 1)})
+
+
+class AppointmentCalendarTestCase(GenericTestCase):
+    """
+    TestCase for AppointmentCalendar in schedule.py and the appointment_calendar view
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.AppointmentCalendarTestCase
+    """
+
+    def setUp(self):
+        super(AppointmentCalendarTestCase, self).setUp()
+        self.appointment_1.save(services=[self.service_1, self.service_2])
+        User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.client.login(username='admin', password='password')
+
+    def test_week_layout(self):
+        calendar = AppointmentCalendar(self.date)
+        self.assertEqual((calendar.date_from, calendar.date_to),
+                         (datetime.date(2019, 4, 8), datetime.date(2019, 4, 14)))
+        days = calendar.get_calendar()['days']
+        self.assertEqual([day.date for day in days], calendar.get_dates())
+        day = days[1]
+        self.assertEqual([(block.start_time, block.end_time, block.top, block.height, block.appointment)
+                          for block in day.appointment_blocks],
+                         [('11:00', '12:30', 120, 90, self.appointment_1)])
+        self.assertEqual([(block.start_time, block.end_time) for block in day.free_blocks],
+                         [('09:00', '11:00'), ('12:30', '17:00')])
+        self.assertEqual([(block.start_time, block.end_time) for block in days[0].free_blocks], [('09:00', '17:00')])
+
+    def test_day_layout_with_opening_hours(self):
+        models.OpeningHours.objects.create(weekday=self.date.weekday(), start_time=datetime.time(8, 30),
+                                           end_time=datetime.time(18, 0))
+        calendar = AppointmentCalendar(self.date, view='day')
+        self.assertEqual((calendar.get_previous_date(), calendar.get_next_date()),
+                         (datetime.date(2019, 4, 8), datetime.date(2019, 4, 10)))
+        result = calendar.get_calendar()
+        self.assertEqual(result['grid_height'], 10 * 60)
+        self.assertEqual([hour.start_time for hour in result['hours']][:2], ['08:00', '09:00'])
+        day, = result['days']
+        self.assertEqual([(block.start_time, block.top) for block in day.free_blocks], [('08:30', 30), ('12:30', 270)])
+        self.assertEqual(day.appointment_blocks[0].top, 180)
+
+    def test_untimed_appointments_and_stylist_filter(self):
+        stylist = models.Stylist.objects.create(name='sam')
+        models.Appointment.objects.filter(id=self.appointment_1.id).update(start_time=None, end_time=None)
+        day = AppointmentCalendar(self.date, view='day').get_calendar()['days'][0]
+        self.assertEqual((day.appointment_blocks, day.untimed_appointments), ([], [self.appointment_1]))
+        models.Appointment.objects.filter(id=self.appointment_1.id).update(start_time=datetime.time(11, 0),
+                                                                           end_time=datetime.time(12, 30))
+        self.assertEqual(AppointmentCalendar(self.date, view='day', stylist=stylist).get_calendar()['days'][0]
+                         .appointment_blocks, [])
+
+    def test_constant_queries(self):
+        calendar = AppointmentCalendar(self.date)
+        with CaptureQueriesContext(connection) as one_appointment_queries:
+            calendar.get_calendar()
+        for day in range(7):
+            for hour in (12, 14):
+                models.Appointment(date=datetime.date(2019, 4, 8 + day), start_time=datetime.time(hour, 0),
+                                   customer=self.customer_1).save(services=[self.service_1])
+        with self.assertNumQueries(len(one_appointment_queries)):
+            days = calendar.get_calendar()['days']
+        self.assertEqual(sum(len(day.appointment_blocks) for day in days), 15)
+
+    def test_etag_changes_with_appointments(self):
+        calendar = AppointmentCalendar(self.date)
+        etag = calendar.get_etag()
+        self.assertEqual(calendar.get_etag(), etag)
+        self.assertNotEqual(AppointmentCalendar(self.date, view='day').get_etag(), etag)
+        self.appointment_1.save(services=[self.service_1])
+        self.assertNotEqual(calendar.get_etag(), etag)
+        etag = calendar.get_etag()
+        payments.mark_appointments_paid(models.Appointment.objects.all(), self.date)
+        self.assertNotEqual(calendar.get_etag(), etag)
+        etag = calendar.get_etag()
+        models.Appointment(date=datetime.date(2019, 4, 20), start_time=datetime.time(10, 0),
+                           customer=self.customer_1).save(services=[self.service_1])
+        self.assertEqual(calendar.get_etag(), etag)
+        self.appointment_1.delete()
+        self.assertNotEqual(calendar.get_etag(), etag)
+
+    def test_etag_changes_with_services_customer_and_stylist(self):
+        calendar = AppointmentCalendar(self.date)
+        etag = calendar.get_etag()
+        self.appointment_1.services.remove(self.service_2)
+        self.assertNotEqual(calendar.get_etag(), etag)
+        etag = calendar.get_etag()
+        self.service_2.appointment_set.add(self.appointment_1)
+        self.assertNotEqual(calendar.get_etag(), etag)
+        etag = calendar.get_etag()
+        self.customer_1.first_name = 'renamed'
+        self.customer_1.save()
+        self.assertNotEqual(calendar.get_etag(), etag)
+        stylist = models.Stylist.objects.create(name='sam')
+        models.Appointment.objects.filter(id=self.appointment_1.id).update(stylist=stylist)
+        etag = calendar.get_etag()
+        stylist.delete()
+        self.assertNotEqual(calendar.get_etag(), etag)
+
+    def test_calendar_page_conditional_get(self):
+        query = {'date': '2019-04-09', 'view': 'week'}
+        response = self.client.get(reverse('appointment_calendar'), query)
+        self.assertContains(response, 'hair service2')
+        self.assertContains(response, reverse('admin:salon_crm_base_appointment_change', args=[self.appointment_1.id]))
+        self.assertIn('date=2019-04-01', response.context['previous_query'])
+        etag = response['ETag']
+        response = self.client.get(reverse('appointment_calendar'), query, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        models.Appointment(date=self.date, start_time=datetime.time(14, 0),
+                           customer=self.customer_1).save(services=[self.service_1])
+        response = self.client.get(reverse('appointment_calendar'), query, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_calendar_page_requires_login(self):
+        self.client.logout()
+        response = self.client.get(reverse('appointment_calendar'))
+        self.assertEqual(response.status_code, 302)
+
+
+class ServiceCatalogueTestCase(GenericTestCase):
+    """
+    TestCase for the service catalogue used by AppointmentUtil in utils.py
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.ServiceCatalogueTestCase
+    """
+
+    def setUp(self):
+        super(ServiceCatalogueTestCase, self).setUp()
+        service_catalogue.invalidate()
+
+    def test_quote_costs_no_queries_once_loaded(self):
+        service_ids = [self.service_1.id, self.service_2.id]
+        with self.assertNumQueries(1):
+            AppointmentUtil.for_service_ids(service_ids, datetime.time(9, 0))
+        with self.assertNumQueries(0):
+            appointment_util = AppointmentUtil.for_service_ids(service_ids, datetime.time(9, 0))
+        self.assertEqual(appointment_util.end_time, datetime.time(10, 30))
+        self.assertEqual(appointment_util.get_quote(), 90)
+
+    def test_service_save_invalidates_catalogue(self):
+        service_catalogue.get_services([self.service_1.id])
+        self.service_1.price = 45
+        self.service_1.save()
+        self.assertEqual(service_catalogue.get_services([self.service_1.id])[0].price, 45)
+
+    def test_new_service_is_loaded(self):
+        service_catalogue.get_services([self.service_1.id])
+        service_3 = models.Service.objects.create(service="hair service3", price=10, estimated_minutes=15)
+        self.assertEqual(service_catalogue.get_services([service_3.id])[0].estimated_minutes, 15)
+
+    def test_missing_service_is_loaded_without_reloading_catalogue(self):
+        service_catalogue.get_services([self.service_1.id])
+        service_3 = models.Service(service="hair service3", price=10, estimated_minutes=15)
+        models.Service.objects.bulk_create([service_3])
+        service_3 = models.Service.objects.get(service="hair service3")
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(service_catalogue.get_services([service_3.id])[0].price, 10)
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertIn('IN ({})'.format(service_3.id), context.captured_queries[0]['sql'])
+
+    def test_change_reloads_catalogue_of_other_processes(self):
+        # A catalogue of its own stands in for the one of another worker process
+        other_catalogue = ServiceCatalogue()
+        self.assertEqual(other_catalogue.get_services([self.service_1.id])[0].price, 40)
+        models.Service.objects.filter(id=self.service_1.id).update(price=45)
+        service_catalogue.invalidate()
+        self.assertEqual(other_catalogue.get_services([self.service_1.id])[0].price, 45)
+
+    def test_invalidate_again_on_commit(self):
+        with mock.patch('salon_crm_base.utils.transaction.on_commit') as on_commit:
+            service_catalogue.invalidate()
+        # A lookup before the commit caches the table again under the new version
+        service_catalogue.get_services([self.service_1.id])
+        models.Service.objects.filter(id=self.service_1.id).update(price=45)
+        on_commit.call_args[0][0]()
+        self.assertEqual(service_catalogue.get_services([self.service_1.id])[0].price, 45)
+
+    def test_unknown_service_raises_validation_error(self):
+        with self.assertRaises(ValidationError):
+            service_catalogue.get_services([self.service_1.id, 12345])
+        with self.assertRaises(ValidationError):
+            AppointmentUtil.for_service_ids([12345], datetime.time(9, 0))
+
+    def test_appointment_save_with_service_ids(self):
+        self.appointment_1.save(services=[self.service_2.id])
+        self.assertEqual(self.appointment_1.quote, 50)
+        self.assertEqual(list(self.appointment_1.services.all()), [self.service_2])
+
+
+class AvailabilityFinderTestCase(GenericTestCase):
+    """
+    TestCase for AvailabilityFinder in availability.py
+    appointment_1 is booked 11:00-11:40
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.AvailabilityFinderTestCase
+    """
+
+    def book(self, start_time, service, date=None):
+        appointment = models.Appointment(date=date or self.date, start_time=start_time, customer=self.customer_1)
+        appointment.save(services=[service])
+        return appointment
+
+    def test_free_intervals_for_date(self):
+        availability_finder = AvailabilityFinder(self.date, self.date)
+        self.assertEqual(list(availability_finder.iter_free_intervals()),
+                         [(self.date, 9 * 60, 11 * 60, None), (self.date, 11 * 60 + 40, 17 * 60, None)])
+
+    def test_overlapping_appointments_are_merged(self):
+        self.book(datetime.time(10, 50), self.service_2)
+        availability_finder = AvailabilityFinder(self.date, self.date)
+        self.assertEqual(list(availability_finder.iter_free_intervals()),
+                         [(self.date, 9 * 60, 10 * 60 + 50, None), (self.date, 11 * 60 + 40, 17 * 60, None)])
+
+    def test_find_available_slots_fitting_duration(self):
+        self.book(datetime.time(12, 0), self.service_1)
+        availability_finder = AvailabilityFinder(self.date, self.date + datetime.timedelta(days=1))
+        available_slots = availability_finder.find_available_slots(75)
+        self.assertEqual(available_slots, [
+            AvailableSlot(self.date, datetime.time(9, 0), datetime.time(11, 0), None),
+            AvailableSlot(self.date, datetime.time(12, 40), datetime.time(17, 0), None),
+            AvailableSlot(self.date + datetime.timedelta(days=1), datetime.time(9, 0), datetime.time(17, 0), None)])
+
+    def test_find_available_slots_for_services_with_limit(self):
+        availability_finder = AvailabilityFinder(self.date, self.date + datetime.timedelta(weeks=4))
+        available_slots = availability_finder.find_available_slots_for_services(
+            [self.service_1.id, self.service_2.id], limit=1)
+        self.assertEqual(available_slots, [AvailableSlot(self.date, datetime.time(9, 0), datetime.time(11, 0), None)])
+
+    def test_not_before_skips_earlier_time(self):
+        availability_finder = AvailabilityFinder(self.date - datetime.timedelta(days=1), self.date,
+                                                 not_before=datetime.datetime(2019, 4, 9, 10, 15, 30))
+        self.assertEqual(availability_finder.find_available_slots(30, limit=1),
+                         [AvailableSlot(self.date, datetime.time(10, 16), datetime.time(11, 0), None)])
+
+    def test_month_of_availability_query_count(self):
+        """
+        One query each for the stylists, opening hours and booked time slots
+        """
+        for days in range(1, 28):
+            self.book(datetime.time(13, 0), self.service_1, date=self.date + datetime.timedelta(days=days))
+        availability_finder = AvailabilityFinder(self.date, self.date + datetime.timedelta(days=30))
+        with self.assertNumQueries(3):
+            free_intervals = list(availability_finder.iter_free_intervals())
+        self.assertEqual(len(free_intervals), 2 * 28 + 3)
+
+    def test_available_time_slots_view(self):
+        User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.client.login(username='admin', password='password')
+        date_from = datetime.date.today() + datetime.timedelta(days=7)
+        self.book(datetime.time(9, 0), self.service_1, date=date_from)
+        response = self.client.get(reverse('available_time_slots'),
+                                   {'services': [self.service_2.id], 'date_from': date_from.isoformat(), 'limit': 2})
+        self.assertEqual(response.context['available_slots'], [
+            AvailableSlot(date_from, datetime.time(9, 40), datetime.time(17, 0), None),
+            AvailableSlot(date_from + datetime.timedelta(days=1), datetime.time(9, 0), datetime.time(17, 0), None)])
+
+
+class TimeSlotsTestCase(GenericTestCase):
+    """
+    TestCase for the free interval calculation in the TimeSlots class in models.py
+    appointment_1 is booked 11:00-11:40
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.TimeSlotsTestCase
+    """
+
+    def test_get_free_intervals(self):
+        time_slots = models.TimeSlots(self.date)
+        self.assertEqual(time_slots.get_free_intervals(time_slots.get_time_slots_for_date()),
+                         [(9 * 60, 11 * 60), (11 * 60 + 40, 17 * 60)])
+
+    def test_appointment_within_another_is_merged(self):
+        time_slots = [(datetime.time(10, 0), datetime.time(12, 0)), (datetime.time(10, 30), datetime.time(11, 0))]
+        self.assertEqual(models.TimeSlots(self.date).get_free_intervals(time_slots),
+                         [(9 * 60, 10 * 60), (12 * 60, 17 * 60)])
+
+    def test_fully_booked_day_has_no_free_intervals(self):
+        time_slots = [(datetime.time(9, 0), datetime.time(17, 30))]
+        self.assertEqual(models.TimeSlots(self.date).get_free_intervals(time_slots), [])
+        self.assertEqual(models.TimeSlots(self.date).consolidate_available_time_slots_for_date(time_slots), '')
+
+    def test_format_free_intervals(self):
+        self.assertEqual(models.TimeSlots.format_free_intervals([(9 * 60, 11 * 60), (12 * 60 + 20, 17 * 60)]),
+                         '09:00-11:00 | 12:20-17:00')
+
+    def test_iter_free_intervals_for_dates(self):
+        next_date = self.date + datetime.timedelta(days=1)
+        time_slot_rows = [(self.date, datetime.time(11, 0), datetime.time(11, 40)),
+                          (next_date, datetime.time(9, 0), datetime.time(10, 0))]
+        self.assertEqual(list(models.TimeSlots.iter_free_intervals_for_dates(time_slot_rows)),
+                         [(self.date, [(9 * 60, 11 * 60), (11 * 60 + 40, 17 * 60)]),
+                          (next_date, [(10 * 60, 17 * 60)])])
+
+    def test_iter_free_intervals_for_dates_includes_empty_dates(self):
+        dates = [self.date - datetime.timedelta(days=1), self.date]
+        time_slot_rows = [(self.date, datetime.time(11, 0), datetime.time(11, 40))]
+        self.assertEqual(list(models.TimeSlots.iter_free_intervals_for_dates(time_slot_rows, dates=dates)),
+                         [(dates[0], [(9 * 60, 17 * 60)]),
+                          (self.date, [(9 * 60, 11 * 60), (11 * 60 + 40, 17 * 60)])])
+
+    def test_iter_time_slots_for_dates_pairs_items_with_their_rows(self):
+        next_date = self.date + datetime.timedelta(days=1)
+        time_slot_rows = [(self.date - datetime.timedelta(days=1), datetime.time(9, 0), datetime.time(9, 30)),
+                          (self.date, datetime.time(11, 0), datetime.time(11, 40)),
+                          (self.date, datetime.time(14, 0), datetime.time(14, 50))]
+        items = [{'date': self.date}, {'date': next_date}]
+        self.assertEqual(list(models.TimeSlots.iter_time_slots_for_dates(time_slot_rows, items,
+                                                                         key=itemgetter('date'))),
+                         [(items[0], [(datetime.time(11, 0), datetime.time(11, 40)),
+                                      (datetime.time(14, 0), datetime.time(14, 50))]),
+                          (items[1], [])])
+
+
+class StylistAvailabilityTestCase(GenericTestCase):
+    """
+    TestCase for opening hours and stylist capacity in TimeSlots, AvailabilityFinder
+    and the clash checks in models.py
+    appointment_1 is booked 11:00-11:40 without a stylist, on a Tuesday
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.StylistAvailabilityTestCase
+    """
+
+    def setUp(self):
+        super(StylistAvailabilityTestCase, self).setUp()
+        self.stylist_1 = models.Stylist.objects.create(name="stylist1")
+        self.stylist_2 = models.Stylist.objects.create(name="stylist2")
+        models.OpeningHours.objects.create(weekday=1, start_time=datetime.time(10, 0), end_time=datetime.time(18, 0))
+        models.OpeningHours.objects.create(stylist=self.stylist_2, weekday=1,
+                                           start_time=datetime.time(12, 0), end_time=datetime.time(14, 0))
+
+    def book(self, start_time, stylist):
+        appointment = models.Appointment(date=self.date, start_time=start_time, customer=self.customer_1,
+                                         stylist=stylist)
+        appointment.save(services=[self.service_1])
+        return appointment
+
+    def test_opening_hours_calendar(self):
+        opening_hours_calendar = models.OpeningHoursCalendar()
+        self.assertEqual(opening_hours_calendar.get_hours(self.date), (datetime.time(10, 0), datetime.time(18, 0)))
+        self.assertEqual(opening_hours_calendar.get_hours(self.date, self.stylist_1.id),
+                         (datetime.time(10, 0), datetime.time(18, 0)))
+        self.assertEqual(opening_hours_calendar.get_hours(self.date, self.stylist_2.id),
+                         (datetime.time(12, 0), datetime.time(14, 0)))
+        self.assertIsNone(opening_hours_calendar.get_hours(self.date + datetime.timedelta(days=1)))
+
+    def test_report_uses_salon_opening_hours(self):
+        self.assertEqual(models.AppointmentReportMaker().get_time_slots_available_for_date(self.date),
+                         '10:00-11:00 | 11:40-18:00')
+
+    def test_stylists_can_be_booked_at_the_same_time(self):
+        self.book(datetime.time(12, 0), self.stylist_1)
+        self.assertEqual(models.check_no_appointment_clashes(None, self.date, datetime.time(12, 0),
+                                                             datetime.time(12, 30), self.stylist_2), True)
+        with self.assertRaises(ValidationError):
+            models.check_no_appointment_clashes(None, self.date, datetime.time(12, 0), datetime.time(12, 30),
+                                                self.stylist_1)
+
+    def test_stylist_required_once_there_are_stylists(self):
+        with self.assertRaisesRegex(ValidationError, 'Please select a stylist'):
+            models.check_no_appointment_clashes(None, self.date, datetime.time(15, 0), datetime.time(15, 30))
+        with self.assertRaisesRegex(ValidationError, 'Please select a stylist'):
+            booking.book_appointment(self.customer_1, [self.service_1], self.date, datetime.time(15, 0))
+        with self.assertRaisesRegex(ValidationError, 'Please select a stylist'):
+            booking.book_recurring_series(self.customer_1, [self.service_1], datetime.time(15, 0), self.date, 2)
+        self.assertEqual(models.Appointment.objects.count(), 1)
+
+    def test_stylist_not_required_without_active_stylists(self):
+        models.Stylist.objects.update(active=False)
+        appointment = booking.book_appointment(self.customer_1, [self.service_1], self.date, datetime.time(15, 0))
+        self.assertIsNone(appointment.stylist)
+
+    def test_find_appointment_clashes_per_stylist(self):
+        self.book(datetime.time(12, 0), self.stylist_1)
+        appointments = [models.Appointment(date=self.date, start_time=datetime.time(12, 10),
+                                           end_time=datetime.time(12, 30), stylist=stylist,
+                                           customer=self.customer_1)
+                        for stylist in (self.stylist_1, self.stylist_2)]
+        clashes = models.find_appointment_clashes(appointments)
+        self.assertEqual(len(clashes), 1)
+        self.assertIs(clashes[0][0], appointments[0])
+
+    def test_availability_per_stylist(self):
+        self.book(datetime.time(12, 0), self.stylist_1)
+        availability_finder = AvailabilityFinder(self.date, self.date)
+        self.assertEqual(availability_finder.find_available_slots(60), [
+            AvailableSlot(self.date, datetime.time(10, 0), datetime.time(12, 0), self.stylist_1),
+            AvailableSlot(self.date, datetime.time(12, 0), datetime.time(14, 0), self.stylist_2),
+            AvailableSlot(self.date, datetime.time(12, 40), datetime.time(18, 0), self.stylist_1)])
+
+    def test_closed_day_has_no_availability(self):
+        date = self.date + datetime.timedelta(days=1)
+        self.assertEqual(AvailabilityFinder(date, date).find_available_slots(30), [])
+
+
+class OpeningHoursTestCase(GenericTestCase):
+    """
+    TestCase for the OpeningHours model and the daily summaries refreshed when it changes
+    appointment_1 is booked 11:00-11:40 on a Tuesday
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.OpeningHoursTestCase
+    """
+
+    def get_time_slots_available(self):
+        return models.DailySummary.objects.get(date=self.date).time_slots_available
+
+    def test_one_salon_row_per_weekday(self):
+        models.OpeningHours.objects.create(weekday=1, start_time=datetime.time(10, 0), end_time=datetime.time(18, 0))
+        opening_hours = models.OpeningHours(weekday=1, start_time=datetime.time(9, 0), end_time=datetime.time(17, 0))
+        with self.assertRaises(ValidationError):
+            opening_hours.full_clean()
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                opening_hours.save()
+        stylist = models.Stylist.objects.create(name="stylist1")
+        models.OpeningHours(stylist=stylist, weekday=1, start_time=datetime.time(9, 0),
+                            end_time=datetime.time(17, 0)).full_clean()
+
+    def test_daily_summaries_refreshed_when_opening_hours_change(self):
+        self.assertEqual(self.get_time_slots_available(), '09:00-11:00 | 11:40-17:00')
+        opening_hours = models.OpeningHours.objects.create(weekday=1, start_time=datetime.time(10, 0),
+                                                           end_time=datetime.time(18, 0))
+        self.assertEqual(self.get_time_slots_available(), '10:00-11:00 | 11:40-18:00')
+        opening_hours = models.OpeningHours.objects.get(id=opening_hours.id)
+        opening_hours.end_time = datetime.time(16, 0)
+        opening_hours.save()
+        self.assertEqual(self.get_time_slots_available(), '10:00-11:00 | 11:40-16:00')
+        opening_hours.delete()
+        self.assertEqual(self.get_time_slots_available(), '09:00-11:00 | 11:40-17:00')
+
+    def test_daily_summaries_refreshed_for_old_weekday(self):
+        models.OpeningHours.objects.create(weekday=0, start_time=datetime.time(9, 0), end_time=datetime.time(17, 0))
+        opening_hours = models.OpeningHours.objects.create(weekday=1, start_time=datetime.time(10, 0),
+                                                           end_time=datetime.time(18, 0))
+        self.assertEqual(self.get_time_slots_available(), '10:00-11:00 | 11:40-18:00')
+        opening_hours = models.OpeningHours.objects.get(id=opening_hours.id)
+        opening_hours.weekday = 2
+        opening_hours.save()
+        # Tuesday now has no salon row, so the salon is closed
+        self.assertEqual(self.get_time_slots_available(), '')
+
+    def test_stylist_hours_do_not_refresh_daily_summaries(self):
+        stylist = models.Stylist.objects.create(name="stylist1")
+        with self.assertNumQueries(1):
+            models.OpeningHours.objects.create(stylist=stylist, weekday=1, start_time=datetime.time(10, 0),
+                                               end_time=datetime.time(12, 0))
+
+
+class ImportCustomersTestCase(TestCase):
+    """
+    TestCase for CustomerImporter in importers.py and the import_customers command
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.ImportCustomersTestCase
+    """
+
+    def setUp(self):
+        models.Customer.objects.create(first_name='john', last_name='doe', email='john@test.com')
+
+    def import_csv(self, csv_text, batch_size=2):
+        customer_importer = CustomerImporter(batch_size=batch_size)
+        customer_importer.import_customers(StringIO(csv_text))
+        return customer_importer
+
+    def test_imports_and_normalises_rows(self):
+        customer_importer = self.import_csv(
+            "first_name,last_name,email,phone_no,postcode,SMS_is_contactable\n"
+            "jane,doe,Jane@Test.com,44 1632 960343,g74 4au,yes\n"
+            "jim,doe,jim@test.com,,,\n")
+        self.assertEqual(customer_importer.num_of_created, 2)
+        customer = models.Customer.objects.get(email='jane@test.com')
+        self.assertEqual(customer.phone_no, '01632 960343')
+        self.assertEqual(customer.postcode, 'G74 4AU')
+        self.assertTrue(customer.SMS_is_contactable)
+        self.assertTrue(customer.active)
+        self.assertIsNotNone(customer.date_activated)
+        self.assertIsNone(models.Customer.objects.get(email='jim@test.com').postcode)
+
+    def test_reports_errors_and_carries_on(self):
+        customer_importer = self.import_csv(
+            "first_name,last_name,email,phone_no,postcode\n"
+            "bad,postcode,bad1@test.com,,GU4 777\n"
+            "bad,phone,bad2@test.com,99773296034,\n"
+            "no,email,,,\n"
+            "superscript,phone,bad3@test.com,01632 96034\u00b2,\n"
+            "good,row,good@test.com,,\n")
+        self.assertEqual(customer_importer.num_of_created, 1)
+        self.assertEqual([line_num for line_num, _ in customer_importer.errors], [2, 3, 4, 5])
+        self.assertTrue(models.Customer.objects.filter(email='good@test.com').exists())
+
+    def test_skips_duplicate_emails(self):
+        customer_importer = self.import_csv(
+            "first_name,last_name,email\n"
+            "john,doe,JOHN@test.com\n"
+            "amy,lee,amy@test.com\n"
+            "amy,lee,amy@test.com\n")
+        self.assertEqual(customer_importer.num_of_created, 1)
+        self.assertEqual(customer_importer.num_of_duplicates, 2)
+
+    def test_inserts_in_batches(self):
+        csv_text = "first_name,last_name,email\n" + "".join(
+            "customer,{0},customer{0}@test.com\n".format(num) for num in range(5))
+        with CaptureQueriesContext(connection) as context:
+            self.import_csv(csv_text, batch_size=2)
+        inserts = [query for query in context.captured_queries
+                   if query['sql'].startswith('INSERT INTO "salon_crm_base_customer"')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(models.Customer.objects.count(), 6)
+
+    def test_import_customers_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as csv_file:
+            csv_file.write("first_name,last_name,email\namy,lee,amy@test.com\n")
+        self.addCleanup(os.remove, csv_file.name)
+        stdout = StringIO()
+        call_command('import_customers', csv_file.name, stdout=stdout, stderr=StringIO())
+        self.assertIn('Imported 1 customers', stdout.getvalue())
+
+
+class ExportTestCase(GenericTestCase):
+    """
+    TestCase for the exporters in exporters.py, the export_data view and command
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.ExportTestCase
+    """
+
+    def setUp(self):
+        super(ExportTestCase, self).setUp()
+        self.appointment_1.save(services=[self.service_1, self.service_2])
+        User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.client.login(username='admin', password='password')
+
+    def get_streamed_content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_customer_csv(self):
+        rows = list(csv.reader(StringIO("".join(exporters.CustomerExporter().iter_csv()))))
+        self.assertEqual(rows[0][:6], ['id', 'title', 'first_name', 'last_name', 'phone_no', 'email'])
+        self.assertEqual(rows[1][2:4], ['test_first_name', 'test_last_name'])
+
+    def test_csv_escapes_formulas(self):
+        models.Customer.objects.filter(id=self.customer_1.id).update(first_name='=HYPERLINK("x")', last_name='-1+2',
+                                                                     town='@SUM(A1)')
+        self.service_1.service = '+cmd'
+        self.service_1.save()
+        rows = list(csv.reader(StringIO("".join(exporters.CustomerExporter().iter_csv()))))
+        self.assertEqual(rows[1][2:4], ["'=HYPERLINK(\"x\")", "'-1+2"])
+        self.assertEqual(rows[1][12], "'@SUM(A1)")
+        rows = list(csv.reader(StringIO("".join(exporters.AppointmentExporter().iter_csv()))))
+        self.assertEqual(rows[1][-1], "'+cmd; hair service2")
+        customers = json.loads("".join(exporters.CustomerExporter().iter_json()))
+        self.assertEqual(customers[0]['first_name'], '=HYPERLINK("x")')
+
+    def test_exporter_requires_iter_rows(self):
+        with self.assertRaises(TypeError):
+            exporters.Exporter()
+
+    def test_appointment_json_includes_services(self):
+        appointments = json.loads("".join(exporters.AppointmentExporter().iter_json()))
+        self.assertEqual(appointments, [{
+            'id': self.appointment_1.id, 'date': '2019-04-09', 'start_time': '11:00:00', 'end_time': '12:30:00',
+            'quote': 90.0, 'date_paid': None, 'customer_id': self.customer_1.id, 'stylist_id': None,
+            'services': 'hair service1; hair service2'}])
+
+    def test_appointment_export_queries_per_chunk(self):
+        for days in range(1, 5):
+            appointment = models.Appointment(date=self.date + datetime.timedelta(days=days),
+                                             start_time=datetime.time(9, 0), customer=self.customer_1)
+            appointment.save(services=[self.service_1])
+        appointment_exporter = exporters.AppointmentExporter()
+        appointment_exporter.chunk_size = 2
+        with self.assertNumQueries(7):
+            rows = list(appointment_exporter.iter_rows())
+        self.assertEqual(len(rows), 5)
+
+    def test_export_view_streams_csv(self):
+        response = self.client.get(reverse('export_data', args=['appointment_summary']),
+                                   {'date_from': '2019-04-01'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(self.get_streamed_content(response).splitlines(), [
+            'date,count,paid_income,forecasted_income,booked_minutes,time_slots_available',
+            '2019-04-09,1,0.0,90.0,90,09:00-11:00 | 12:30-17:00'])
+
+    def test_export_view_unknown_export(self):
+        response = self.client.get(reverse('export_data', args=['users']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_export_data_command(self):
+        stdout = StringIO()
+        call_command('export_data', 'customers', '--format', 'json', stdout=stdout)
+        self.assertEqual(json.loads(stdout.getvalue())[0]['email'], 'test@test.com')
+
+
+class CustomerActivationTestCase(GenericTestCase):
+    """
+    TestCase for CustomerActivation in models.py, the customer admin actions
+    and the deactivate_lapsed_customers command
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.CustomerActivationTestCase
+    """
+
+    def setUp(self):
+        super(CustomerActivationTestCase, self).setUp()
+        self.today = datetime.date(2021, 1, 31)
+        self.customer_2 = models.Customer.objects.create(first_name='jane', last_name='doe', email='jane@test.com')
+        self.customer_3 = models.Customer.objects.create(first_name='jim', last_name='doe', email='jim@test.com')
+        models.Appointment.objects.create(date=datetime.date(2020, 12, 1), start_time=datetime.time(10, 0),
+                                          customer=self.customer_2)
+        models.Customer.objects.update(date_activated=datetime.date(2019, 1, 1))
+
+    def get_activation_fields(self, customer):
+        return models.Customer.objects.values_list('active', 'date_activated', 'date_deactivated').get(id=customer.id)
+
+    def test_bulk_update_matches_save(self):
+        customer_activation = models.CustomerActivation(today=datetime.date.today())
+        customer_activation.deactivate(models.Customer.objects.filter(id=self.customer_1.id))
+        self.customer_2.active = False
+        self.customer_2.save()
+        self.assertEqual(self.get_activation_fields(self.customer_1)[1:],
+                         self.get_activation_fields(self.customer_2)[1:])
+        customer_activation.activate(models.Customer.objects.filter(id=self.customer_1.id))
+        self.customer_2.active = True
+        self.customer_2.save()
+        self.assertEqual(self.get_activation_fields(self.customer_1), self.get_activation_fields(self.customer_2))
+
+    def test_deactivate_keeps_earlier_date_deactivated(self):
+        customer_activation = models.CustomerActivation(today=self.today)
+        self.assertEqual(customer_activation.deactivate(models.Customer.objects.all()), 3)
+        later_activation = models.CustomerActivation(today=self.today + datetime.timedelta(days=1))
+        self.assertEqual(later_activation.deactivate(models.Customer.objects.all()), 0)
+        self.assertEqual(self.get_activation_fields(self.customer_1), (False, None, self.today))
+
+    def test_months_before_clamps_day(self):
+        self.assertEqual(models.CustomerActivation(today=self.today).get_months_before(1), datetime.date(2020, 12, 31))
+        self.assertEqual(models.CustomerActivation(today=self.today).get_months_before(11), datetime.date(2020, 2, 29))
+
+    def test_deactivate_lapsed_with_one_update(self):
+        customer_activation = models.CustomerActivation(today=self.today)
+        with self.assertNumQueries(1):
+            num_of_customers = customer_activation.deactivate_lapsed(months=6)
+        self.assertEqual(num_of_customers, 2)
+        self.assertEqual(list(models.Customer.objects.filter(active=True)), [self.customer_2])
+        self.assertEqual(self.get_activation_fields(self.customer_3), (False, None, self.today))
+
+    def test_recently_activated_customers_are_not_lapsed(self):
+        models.Customer.objects.filter(id=self.customer_3.id).update(date_activated=datetime.date(2020, 12, 1))
+        lapsed_customers = models.CustomerActivation(today=self.today).get_lapsed_customers(months=6)
+        self.assertEqual(list(lapsed_customers), [self.customer_1])
+
+    def test_deactivate_lapsed_customers_command(self):
+        stdout = StringIO()
+        call_command('deactivate_lapsed_customers', months=6, dry_run=True, stdout=stdout)
+        self.assertIn('Would deactivate 3 customers', stdout.getvalue())
+        call_command('deactivate_lapsed_customers', months=6, stdout=stdout)
+        self.assertIn('Deactivated 3 customers', stdout.getvalue())
+        self.assertFalse(models.Customer.objects.filter(active=True).exists())
+
+    def test_admin_actions(self):
+        User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.client.login(username='admin', password='password')
+        url = reverse('admin:salon_crm_base_customer_changelist')
+        customer_ids = [self.customer_1.id, self.customer_3.id]
+        response = self.client.post(url, {'action': 'deactivate_customers', '_selected_action': customer_ids},
+                                    follow=True)
+        self.assertContains(response, 'Deactivated 2 customers')
+        response = self.client.post(url, {'action': 'activate_customers', '_selected_action': customer_ids},
+                                    follow=True)
+        self.assertContains(response, 'Activated 2 customers')
+        self.assertEqual(models.Customer.objects.filter(active=True).count(), 3)
+
+
+class CustomerSearchIndexTestCase(TestCase):
+    """
+    TestCase for CustomerSearchIndex in models.py and the customer admin search
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.CustomerSearchIndexTestCase
+    """
+
+    def setUp(self):
+        self.customer_1 = models.Customer.objects.create(first_name='Mary-Jane', last_name='Smith',
+                                                         email='mj@test.com', phone_no='01632 960343',
+                                                         postcode='G74 4AU')
+        self.customer_2 = models.Customer.objects.create(first_name='John', last_name='Smithers',
+                                                         email='john@test.com', postcode='GU4 7AB')
+        self.customer_search_index = models.CustomerSearchIndex()
+
+    def search(self, search_term):
+        return list(self.customer_search_index.search(models.Customer.objects.order_by('id'), search_term))
+
+    def test_tokens_kept_in_sync_on_save(self):
+        self.customer_1.last_name = 'Jones'
+        self.customer_1.save()
+        self.assertEqual(self.search('smith'), [self.customer_2])
+        self.assertEqual(self.search('jo'), [self.customer_1, self.customer_2])
+
+    def test_name_prefix(self):
+        self.assertEqual(self.search('SMI'), [self.customer_1, self.customer_2])
+        self.assertEqual(self.search('jane'), [self.customer_1])
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.search('john smi'), [self.customer_2])
+
+    def test_email_prefix(self):
+        self.assertEqual(self.search('john@'), [self.customer_2])
+
+    def test_phone_no_exact_in_any_format(self):
+        self.assertEqual(self.search('+44 1632 960343'), [self.customer_1])
+        self.assertEqual(self.search('01632960343'), [self.customer_1])
+
+    def test_phone_no_fragment(self):
+        self.assertEqual(self.search('960343'), [self.customer_1])
+        self.assertEqual(self.search('01632'), [self.customer_1])
+        self.assertEqual(self.search('1632 9603'), [self.customer_1])
+        self.assertEqual(self.search('960344'), [])
+
+    def test_email_fragment(self):
+        self.assertEqual(self.search('test.com'), [self.customer_1, self.customer_2])
+        self.assertEqual(self.search('mj@test'), [self.customer_1])
+
+    def test_apostrophe_and_hyphen_names(self):
+        customer_3 = models.Customer.objects.create(first_name='Mary', last_name="O'Brien-Smith")
+        self.assertEqual(self.search("o'brien"), [customer_3])
+        self.assertEqual(self.search("O'Brien-Smith"), [customer_3])
+        self.assertEqual(self.search("mary o'brien"), [customer_3])
+        self.assertEqual(self.search('obrien'), [customer_3])
+        self.assertEqual(self.search('mary-jane smith'), [self.customer_1])
+        self.assertEqual(self.search("o'connor"), [])
+
+    def test_postcode_exact(self):
+        self.assertEqual(self.search('g74 4au'), [self.customer_1])
+        self.assertEqual(self.search('G744AU'), [self.customer_1])
+
+    def test_rebuild(self):
+        models.CustomerSearchToken.objects.all().delete()
+        call_command('rebuild_customer_search_index', stdout=StringIO())
+        self.assertEqual(self.search('smithers'), [self.customer_2])
+
+    def test_imported_customers_are_indexed(self):
+        CustomerImporter().import_customers(StringIO("first_name,last_name,email\namy,lee,amy@test.com\n"))
+        self.assertEqual([customer.email for customer in self.search('lee')], ['amy@test.com'])
+
+    def test_admin_search_uses_index(self):
+        User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.client.login(username='admin', password='password')
+        response = self.client.get(reverse('admin:salon_crm_base_customer_changelist'), {'q': 'smithe'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.customer_2])
+
+
+class AppointmentChangelistTestCase(GenericTestCase):
+    """
+    TestCase for the number of queries made by the AppointmentAdmin changelist in admin.py
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.AppointmentChangelistTestCase
+    """
+
+    def setUp(self):
+        super(AppointmentChangelistTestCase, self).setUp()
+        User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.client.login(username='admin', password='password')
+        self.url = reverse('admin:salon_crm_base_appointment_changelist')
+
+    def add_appointments(self, num_of_appointments):
+        stylist = models.Stylist.objects.create(name="stylist{}".format(num_of_appointments))
+        for days in range(1, num_of_appointments + 1):
+            customer = models.Customer.objects.create(first_name="first{}".format(days),
+                                                      last_name="last{}".format(num_of_appointments),
+                                                      email="{}_{}@test.com".format(days, num_of_appointments))
+            appointment = models.Appointment(date=self.date + datetime.timedelta(days=days),
+                                             start_time=datetime.time(9, 0), customer=customer, stylist=stylist)
+            appointment.save(services=[self.service_1, self.service_2])
+
+    def count_changelist_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_query_count_independent_of_page_size(self):
+        self.add_appointments(2)
+        num_of_queries = self.count_changelist_queries()
+        self.add_appointments(20)
+        self.assertEqual(self.count_changelist_queries(), num_of_queries)
+
+    def test_services_summary_column(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, 'hair service1')
+
+
+class QueryPlanTestCase(GenericTestCase):
+    """
+    TestCase for the indexes used by the report and clash queries in models.py.
+    Checks the SQLite query plan reads the appointment table through an index rather than a table scan.
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.QueryPlanTestCase
+    """
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plans are checked on SQLite only')
+        super(QueryPlanTestCase, self).setUp()
+
+    def get_query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertUsesIndex(self, queryset, index_name):
+        query_plan = self.get_query_plan(queryset)
+        table_steps = [step for step in query_plan if 'salon_crm_base_appointment ' in step + ' ']
+        self.assertTrue(table_steps, query_plan)
+        for step in table_steps:
+            self.assertIn('INDEX ' + index_name, step, query_plan)
+
+    def test_daily_totals_use_covering_index(self):
+        appointment_report_maker = models.AppointmentReportMaker(date_from=self.date, date_to=self.date)
+        self.assertUsesIndex(appointment_report_maker.get_daily_totals(), 'appointment_date_totals_idx')
+
+    def test_report_time_slots_use_index(self):
+        appointment_report_maker = models.AppointmentReportMaker(date_from=self.date, date_to=self.date)
+        time_slots = appointment_report_maker.get_appointments_for_report() \
+            .values_list('date', 'start_time', 'end_time').order_by('date', 'start_time')
+        self.assertUsesIndex(time_slots, 'appointment_date_time_idx')
+
+    def test_clash_check_uses_index(self):
+        overlapping_appointments = models.Appointment.objects.filter(date=self.date,
+                                                                     stylist=None,
+                                                                     start_time__lt=datetime.time(12, 0),
+                                                                     end_time__gt=datetime.time(11, 0)) \
+            .order_by('start_time')
+        self.assertUsesIndex(overlapping_appointments, 'appointment_stylist_time_idx')
+
+
+class BenchmarkTestCase(TestCase):
+    """
+    Runs the benchmark suite at a tiny scale to check it produces results and rolls back
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.BenchmarkTestCase
+    """
+
+    def test_bench_command_outputs_results_and_rolls_back(self):
+        stdout = StringIO()
+        call_command('bench', customers=5, services=3, years=1, appointments_per_day=2, repeat=1, stdout=stdout)
+        results = json.loads(stdout.getvalue())
+        self.assertEqual(results['scale']['customers'], 5)
+        self.assertEqual(results['scale']['appointments'], 2 * 365)
+        names = [result['name'] for result in results['results']]
+        self.assertIn('appointment_save', names)
+        self.assertIn('appointment_changelist', names)
+        for result in results['results']:
+            self.assertGreaterEqual(result['median_ms'], result['best_ms'])
+        self.assertFalse(models.Customer.objects.exists())
+        self.assertFalse(models.Appointment.objects.exists())
+        self.assertFalse(User.objects.exists())
+
+    def test_bench_leaves_nothing_in_the_cache(self):
+        cache.clear()
+        cache.set('salon_crm_base:test', 1)
+        call_command('bench', customers=5, services=3, years=1, appointments_per_day=2, repeat=1, stdout=StringIO())
+        self.assertEqual(cache.get('salon_crm_base:test'), 1)
+        self.assertIsNone(cache.get(models.DailySummaryCache.key_prefix + ':generation'))
+        self.assertIsNone(cache.get(ServiceCatalogue.version_key))
+        self.assertIsNone(service_catalogue.services_by_id)
+
+    def test_compare_results_adds_ratio_to_baseline(self):
+        results = {'results': [{'name': 'report', 'median_ms': 3.0, 'queries': 3},
+                               {'name': 'new', 'median_ms': 1.0, 'queries': 1}]}
+        baseline = {'results': [{'name': 'report', 'median_ms': 6.0, 'queries': 4}]}
+        results = benchmarks.compare_results(results, baseline)
+        self.assertEqual(results['results'][0]['median_ratio'], 0.5)
+        self.assertEqual(results['results'][0]['baseline_queries'], 4)
+        self.assertNotIn('median_ratio', results['results'][1])
+
+
+class RequestTimingMiddlewareTestCase(GenericTestCase):
+    """
+    TestCase for RequestTimingMiddleware in middleware.py and the request_stats view
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.RequestTimingMiddlewareTestCase
+    """
+
+    def setUp(self):
+        super(RequestTimingMiddlewareTestCase, self).setUp()
+        middleware.request_stats.reset()
+        User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.client.login(username='admin', password='password')
+
+    def test_records_stats_per_view(self):
+        response = self.client.get(reverse('appointment_summary_report'),
+                                   {'date_from': '2019-04-01', 'date_to': '2019-04-30'})
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.client.get(reverse('appointment_summary_report'))
+        stats = {view_stats['view']: view_stats for view_stats in middleware.request_stats.get_stats()}
+        report_stats = stats['appointment_summary_report']
+        self.assertEqual(report_stats['requests'], 2)
+        self.assertGreater(report_stats['max_queries'], 0)
+        self.assertGreaterEqual(report_stats['max_ms'], report_stats['mean_ms'])
+
+    def test_server_timing_only_for_staff_or_debug(self):
+        self.client.logout()
+        response = self.client.get(reverse('admin:login'))
+        self.assertFalse(response.has_header('Server-Timing'))
+        with self.settings(DEBUG=True):
+            response = self.client.get(reverse('admin:login'))
+        self.assertTrue(response.has_header('Server-Timing'))
+        User.objects.create_user('front_desk', 'front_desk@test.com', 'password')
+        self.client.login(username='front_desk', password='password')
+        response = self.client.get(reverse('appointment_summary_report'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_logs_slow_requests_with_top_queries(self):
+        with self.settings(SLOW_REQUEST_MS=0):
+            with self.assertLogs('salon_crm_base.middleware', level='WARNING') as logs:
+                self.client.get(reverse('appointment_summary_report'))
+        self.assertIn('Slow request GET', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    def test_stats_view_is_staff_only(self):
+        self.client.get(reverse('appointment_summary_report'))
+        response = self.client.get(reverse('request_stats'))
+        views = [view_stats['view'] for view_stats in response.json()['views']]
+        self.assertIn('appointment_summary_report', views)
+        self.client.logout()
+        response = self.client.get(reverse('request_stats'))
+        self.assertEqual(response.status_code, 302)
+
+
+class DailySummaryCacheTestCase(GenericTestCase):
+    """
+    TestCase for DailySummaryCache and CachedDailySummaryReportMaker in models.py
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.DailySummaryCacheTestCase
+    """
+
+    def get_report(self, **report_filters):
+        report_filters.setdefault('date_from', datetime.date(2019, 4, 1))
+        report_filters.setdefault('date_to', datetime.date(2019, 4, 30))
+        report_maker = models.CachedDailySummaryReportMaker(**report_filters)
+        return report_maker.get_appointment_summary_report()['context_dict']
+
+    def test_repeat_report_served_from_cache(self):
+        with self.assertNumQueries(1):
+            first_report = self.get_report()
+        with self.assertNumQueries(0):
+            second_report = self.get_report()
+        self.assertEqual(first_report, second_report)
+        self.assertEqual([day['date'] for day in second_report['appointment_summary']], [self.date])
+
+    def test_matches_daily_summary_report_with_pagination(self):
+        for days in (1, 3):
+            models.Appointment.objects.create(date=self.date + datetime.timedelta(days=days),
+                                              start_time=datetime.time(10, 0),
+                                              customer=self.customer_1).save(services=[self.service_2])
+        for page_size in (1, 2, 3):
+            report_filters = {'date_from': datetime.date(2019, 4, 1), 'date_to': datetime.date(2019, 4, 30),
+                              'page_size': page_size, 'after': datetime.date(2019, 4, 9)}
+            expected = models.DailySummaryReportMaker(**report_filters).get_appointment_summary_report()
+            self.get_report(**report_filters)
+            self.assertEqual(self.get_report(**report_filters), expected['context_dict'])
+
+    def test_save_invalidates_only_its_date(self):
+        other_date = self.date + datetime.timedelta(days=2)
+        models.Appointment.objects.create(date=other_date, start_time=datetime.time(10, 0),
+                                          customer=self.customer_1).save(services=[self.service_2])
+        self.get_report()
+        self.appointment_1.save(services=[self.service_1, self.service_2])
+        self.assertEqual(set(models.DailySummaryCache().get_many([self.date, other_date])), {other_date})
+        report = self.get_report()
+        self.assertEqual(report['appointment_summary'][0]['forecasted_income'], 90)
+
+    def test_delete_and_services_change_invalidate(self):
+        self.get_report()
+        self.appointment_1.services.add(self.service_2)
+        self.assertEqual(models.DailySummaryCache().get_many([self.date]), {})
+        self.get_report()
+        self.service_2.appointment_set.clear()
+        self.assertEqual(models.DailySummaryCache().get_many([self.date]), {})
+        self.get_report()
+        self.appointment_1.delete()
+        self.assertNotIn('appointment_summary', self.get_report())
+
+    def test_rebuild_invalidates_all_dates(self):
+        self.get_report()
+        models.DailySummary.objects.update(count=5)
+        models.DailySummaryMaker().rebuild()
+        self.assertEqual(self.get_report()['appointment_summary'][0]['count'], 1)
+
+    def test_evicted_generation_does_not_bring_back_old_entries(self):
+        daily_summary_cache = models.DailySummaryCache()
+        daily_summary_cache.set_many({self.date: {'count': 1}})
+        daily_summary_cache.invalidate_all()
+        daily_summary_cache.set_many({self.date: {'count': 2}})
+        cache.delete(daily_summary_cache.key_prefix + ':generation')
+        self.assertEqual(daily_summary_cache.get_many([self.date]), {})
+
+    def test_cache_holds_a_year_of_dates(self):
+        self.assertGreater(settings.CACHES['default']['OPTIONS']['MAX_ENTRIES'], 2 * 366)
+
+    def test_open_ended_range_reads_table(self):
+        report = self.get_report(date_to=None)
+        self.assertEqual([day['date'] for day in report['appointment_summary']], [self.date])
+        self.assertEqual(models.DailySummaryCache().get_many([self.date]), {})
+
+
+class ConcurrentBookingTestCase(TransactionTestCase):
+    """
+    Runs parallel booking writers against the test database file to check the SQLite
+    settings (WAL, busy timeout and IMMEDIATE transactions) avoid "database is locked"
+    Use following to run TestCase in command line:
+    python manage.py test salon_crm_base.tests.ConcurrentBookingTestCase
+    """
+    available_apps = ['salon_crm_base']
+    num_of_writers = 6
+    bookings_per_writer = 8
+
+    def setUp(self):
+        cache.clear()
+        self.date = datetime.date(2019, 4, 9)
+        self.service = models.Service.objects.create(service="hair service1", price=40, estimated_minutes=10)
+        self.customer = models.Customer.objects.create(first_name="test_first_name",
+                                                       last_name="test_last_name",
+                                                       email="test@test.com")
+
+    def book(self, writer_num, errors):
+        try:
+            for booking_num in range(self.bookings_per_writer):
+                minutes = 9 * 60 + (writer_num * self.bookings_per_writer + booking_num) * 5
+                appointment = models.Appointment(date=self.date,
+                                                 start_time=datetime.time(minutes // 60, minutes % 60),
+                                                 customer=self.customer)
+                appointment.save(services=[self.service])
+        except Exception as exception:
+            errors.append(exception)
+        finally:
+            connection.close()
+
+    def test_sqlite_connection_settings(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("SQLite settings only")
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertGreater(cursor.fetchone()[0], 0)
+
+    def test_parallel_writers_do_not_fail(self):
+        errors = []
+        writers = [threading.Thread(target=self.book, args=(writer_num, errors))
+                   for writer_num in range(self.num_of_writers)]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+        self.assertEqual(errors, [])
+        num_of_bookings = self.num_of_writers * self.bookings_per_writer
+        self.assertEqual(models.Appointment.objects.count(), num_of_bookings)
+        self.assertEqual(models.DailySummary.objects.get(date=self.date).count, num_of_bookings)
+
+    def book_same_slot(self, barrier, results):
+        try:
+            barrier.wait()
+            results.append(booking.book_appointment(self.customer, [self.service], self.date,
+                                                    datetime.time(12, 0)))
+        except ValidationError as error:
+            results.append(error)
+        finally:
+            connection.close()
+
+    def test_concurrent_bookings_of_one_slot_book_once(self):
+        barrier = threading.Barrier(self.num_of_writers)
+        results = []
+        writers = [threading.Thread(target=self.book_same_slot, args=(barrier, results))
+                   for _ in range(self.num_of_writers)]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+        self.assertEqual(len([result for result in results if isinstance(result, models.Appointment)]), 1)
+        self.assertEqual(len([result for result in results if isinstance(result, ValidationError)]),
+                         self.num_of_writers - 1)
+        self.assertEqual(models.Appointment.objects.count(), 1)
+
+    def test_load_test_bookings_command(self):
+        stdout = StringIO()
+        call_command('load_test_bookings', threads=4, bookings_per_thread=10, dates=1,
+                     first_date=self.date, stdout=stdout, stderr=StringIO())
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(report['attempts'], 40)
+        self.assertEqual(report['booked'] + report['clashes'], 40)
+        self.assertGreater(report['booked'], 0)
+        self.assertEqual(report['double_bookings'], 0)
+        self.assertEqual(report['errors'], 0)
+        self.assertFalse(models.Appointment.objects.exists())
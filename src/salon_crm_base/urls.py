@@ -21,5 +21,11 @@ from . import views
 
 urlpatterns = [
     url(r'appointment_summary_report/$', views.appointment_summary_report, name="appointment_summary_report"),
+    url(r'appointment_calendar/$', views.appointment_calendar, name="appointment_calendar"),
+    url(r'revenue_analytics/$', views.revenue_analytics, name="revenue_analytics"),
+    url(r'available_time_slots/$', views.available_time_slots, name="available_time_slots"),
+    url(r'export/(?P<export_name>\w+)/$', views.export_data, name="export_data"),
+    url(r'outstanding_payments/$', views.outstanding_payments, name="outstanding_payments"),
+    url(r'request_stats/$', views.request_stats_view, name="request_stats"),
 
     ]
@@ -1,4 +1,98 @@
+from django.apps import apps
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from collections import namedtuple
 import datetime
+import threading
+import time
+
+
+def time_to_minutes(time):
+    return time.hour * 60 + time.minute
+
+
+def minutes_to_time(minutes):
+    return datetime.time(hour=minutes // 60, minute=minutes % 60)
+
+
+def format_minutes(minutes):
+    return "{:02d}:{:02d}".format(*divmod(minutes, 60))
+
+
+CatalogueService = namedtuple('CatalogueService', ['id', 'service', 'price', 'estimated_minutes'])
+
+
+class ServiceCatalogue:
+    """
+    In-process cache of service prices and estimated minutes keyed by service id,
+    so quoting an appointment does not query the Service table.
+    The whole table is loaded in one query on first use; ids not yet in the cache
+    are then fetched on their own and added to it, and ids that do not exist raise
+    a ValidationError. The loaded copy is tagged with a version kept in the Django cache,
+    which invalidate() moves on when the transaction commits, so every process reloads
+    the table on its next lookup after a change. The Service post_save and post_delete
+    signals call invalidate(). Updates made with queryset.update() bypass these signals,
+    so call invalidate() after them.
+    """
+    version_key = 'salon_crm_base:service_catalogue:version'
+
+    def __init__(self):
+        self.services_by_id = None
+        self.version = None
+        self.lock = threading.Lock()
+
+    def make_version(self):
+        return int(time.time() * 1000000)
+
+    def get_version(self):
+        return cache.get_or_set(self.version_key, self.make_version, None)
+
+    def load_services(self, service_ids=None):
+        services = apps.get_model('salon_crm_base', 'Service').objects.all()
+        if service_ids is not None:
+            services = services.filter(id__in=service_ids)
+        return {service_id: CatalogueService(service_id, service, price, estimated_minutes)
+                for service_id, service, price, estimated_minutes in
+                services.values_list('id', 'service', 'price', 'estimated_minutes')}
+
+    def get_services(self, service_ids):
+        service_ids = list(service_ids)
+        # The version is read before the table, so a change committed while loading
+        # moves it on again and the next lookup reloads
+        version = self.get_version()
+        services_by_id = self.services_by_id
+        if services_by_id is None or self.version != version:
+            with self.lock:
+                services_by_id = self.services_by_id = self.load_services()
+                self.version = version
+        missing_ids = [service_id for service_id in service_ids if service_id not in services_by_id]
+        if missing_ids:
+            with self.lock:
+                services_by_id = dict(self.services_by_id or services_by_id)
+                services_by_id.update(self.load_services(missing_ids))
+                self.services_by_id = services_by_id
+            missing_ids = [service_id for service_id in missing_ids if service_id not in services_by_id]
+            if missing_ids:
+                raise ValidationError("Please select existing services. No service with id {}".format(
+                    ", ".join(str(service_id) for service_id in missing_ids)))
+        return [services_by_id[service_id] for service_id in service_ids]
+
+    def invalidate(self):
+        """
+        Moves the shared version on and drops the loaded copy now and again when the
+        transaction commits, so no process keeps a copy loaded before the change was committed
+        """
+        def next_version():
+            version = cache.get(self.version_key) or 0
+            cache.set(self.version_key, max(self.make_version(), version + 1), None)
+            with self.lock:
+                self.services_by_id = None
+        next_version()
+        transaction.on_commit(next_version)
+
+
+service_catalogue = ServiceCatalogue()
 
 
 class AppointmentUtil:
@@ -6,6 +100,13 @@ class AppointmentUtil:
         self.services = services
         self.end_time = self.get_end_time(start_time)
 
+    @classmethod
+    def for_service_ids(cls, service_ids, start_time):
+        """
+        Resolves the price and estimated minutes of the services from the service catalogue
+        """
+        return cls(service_catalogue.get_services(service_ids), start_time)
+
     def __get_total_estimated_minutes(self):
         total_minutes = 0
         for service in self.services:
@@ -19,6 +120,9 @@ class AppointmentUtil:
         end = start + timedelta
         return end.time()
 
+    def get_total_estimated_minutes(self):
+        return self.__get_total_estimated_minutes()
+
     def get_end_time(self, start_time):
         total_minutes = self.__get_total_estimated_minutes()
         x = self.__add_time_delta_to_time(start_time, datetime.timedelta(minutes=total_minutes))
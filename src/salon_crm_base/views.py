@@ -1,13 +1,153 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
-from .models import AppointmentReportMaker
+from django.utils import timezone
+from .availability import AvailabilityFinder
+from .exporters import EXPORTERS
+from .analytics import RevenueAnalytics
+from .forms import (AppointmentCalendarForm, AppointmentSummaryReportFilterForm, AvailableTimeSlotsSearchForm,
+                    ExportForm, OutstandingPaymentsForm, RevenueAnalyticsFilterForm)
+from .middleware import request_stats
+from .models import CachedDailySummaryReportMaker
+from .payments import AGING_BUCKETS, OutstandingPaymentsLedger
+from .schedule import AppointmentCalendar
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+import datetime
+import logging
 
+logger = logging.getLogger(__name__)
 
 # Create your views here.
 
 @login_required
 def appointment_summary_report(request):
-    appointment_summary_report = AppointmentReportMaker()
+    filter_form = AppointmentSummaryReportFilterForm(request.GET or None)
+    report_filters = filter_form.get_report_filters()
+    appointment_summary_report = CachedDailySummaryReportMaker(**report_filters)
     appointment_summary = appointment_summary_report.get_appointment_summary_report()['context_dict']
-    print("Here is the dictionary: ", appointment_summary)
+    appointment_summary['filter_form'] = filter_form
+    appointment_summary.update(report_filters)
+    if 'next_after' in appointment_summary:
+        next_page_query = request.GET.copy()
+        next_page_query['after'] = appointment_summary['next_after'].isoformat()
+        appointment_summary['next_page_query'] = next_page_query.urlencode()
+    logger.debug("Appointment summary report for %s to %s after %s: %d dates",
+                 report_filters.get('date_from'), report_filters.get('date_to'), report_filters.get('after'),
+                 len(appointment_summary.get('appointment_summary', ())))
     return render(request, 'admin/appointment_summary_report.html', appointment_summary)
+
+
+@login_required
+def revenue_analytics(request):
+    filter_form = RevenueAnalyticsFilterForm(request.GET or None)
+    report_filters = filter_form.get_report_filters()
+    context = RevenueAnalytics(**report_filters).get_report()
+    context['filter_form'] = filter_form
+    context.update(report_filters)
+    return render(request, 'admin/revenue_analytics.html', context)
+
+
+def get_appointment_calendar(request):
+    calendar_form = AppointmentCalendarForm(request.GET or None)
+    return calendar_form, AppointmentCalendar(**calendar_form.get_calendar_filters())
+
+
+def appointment_calendar_etag(request):
+    return get_appointment_calendar(request)[1].get_etag()
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=appointment_calendar_etag)
+def appointment_calendar(request):
+    """
+    Day or week grid of appointments with free time shown between them.
+    Terminals polling the calendar get 304 Not Modified until an appointment
+    in the range or the opening hours change.
+    """
+    calendar_form, calendar = get_appointment_calendar(request)
+    context = calendar.get_calendar()
+    context['calendar_form'] = calendar_form
+    context['calendar'] = calendar
+    navigation_query = request.GET.copy()
+    for name, date in (('previous_query', calendar.get_previous_date()),
+                       ('next_query', calendar.get_next_date())):
+        navigation_query['date'] = date.isoformat()
+        context[name] = navigation_query.urlencode()
+    return render(request, 'admin/appointment_calendar.html', context)
+
+
+@login_required
+def available_time_slots(request):
+    search_form = AvailableTimeSlotsSearchForm(request.GET or None)
+    context = {'search_form': search_form}
+    if search_form.is_valid():
+        now = timezone.localtime().replace(tzinfo=None)
+        date_from = search_form.cleaned_data['date_from'] or now.date()
+        weeks = search_form.cleaned_data['weeks'] or 4
+        date_to = date_from + datetime.timedelta(weeks=weeks) - datetime.timedelta(days=1)
+        availability_finder = AvailabilityFinder(date_from, date_to, not_before=now)
+        service_ids = [service.id for service in search_form.cleaned_data['services']]
+        context['available_slots'] = availability_finder.find_available_slots_for_services(
+            service_ids, limit=search_form.cleaned_data['limit'] or 10)
+        context['date_from'] = date_from
+        context['date_to'] = date_to
+    return render(request, 'admin/available_time_slots.html', context)
+
+
+@staff_member_required
+def export_data(request, export_name):
+    """
+    Streams customers, appointments or the appointment summary as CSV or JSON,
+    so a full history can be exported without loading it into memory
+    """
+    if export_name not in EXPORTERS:
+        raise Http404("No export called {}".format(export_name))
+    export_form = ExportForm(request.GET)
+    if not export_form.is_valid():
+        return HttpResponseBadRequest(export_form.errors.as_text())
+    export_format = export_form.cleaned_data['format'] or 'csv'
+    exporter = EXPORTERS[export_name](date_from=export_form.cleaned_data['date_from'],
+                                      date_to=export_form.cleaned_data['date_to'])
+    content_type = 'application/json' if export_format == 'json' else 'text/csv'
+    response = StreamingHttpResponse(exporter.iter_export(export_format), content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(export_name, export_format)
+    return response
+
+
+@staff_member_required
+def outstanding_payments(request):
+    """
+    Shows the unpaid appointments owed by each customer with their aging buckets,
+    or returns them as JSON with format=json
+    """
+    payments_form = OutstandingPaymentsForm(request.GET or None)
+    if payments_form.is_bound and not payments_form.is_valid():
+        return HttpResponseBadRequest(payments_form.errors.as_text())
+    cleaned_data = payments_form.cleaned_data if payments_form.is_bound else {}
+    ledger = OutstandingPaymentsLedger(as_of=cleaned_data.get('as_of'),
+                                       customer_id=cleaned_data.get('customer')).get_ledger()
+    if cleaned_data.get('format') == 'json':
+        ledger['as_of'] = ledger['as_of'].isoformat()
+        for customer_balance in ledger['customer_balances']:
+            customer_balance['oldest_date'] = customer_balance['oldest_date'].isoformat()
+        return JsonResponse(ledger)
+    for row in ledger['customer_balances'] + [ledger['totals']]:
+        row['aged'] = [row['aged_' + name] for name, _, _, _ in AGING_BUCKETS]
+    ledger['aging_buckets'] = [label for _, label, _, _ in AGING_BUCKETS]
+    ledger['payments_form'] = payments_form
+    return render(request, 'admin/outstanding_payments.html', ledger)
+
+
+@staff_member_required
+def request_stats_view(request):
+    """
+    Returns the request timings and query counts per view recorded by RequestTimingMiddleware
+    in this server process, slowest views first. POST clears them.
+    """
+    if request.method == 'POST':
+        request_stats.reset()
+    stats = sorted(request_stats.get_stats(), key=lambda view_stats: view_stats['total_ms'], reverse=True)
+    return JsonResponse({'views': stats})
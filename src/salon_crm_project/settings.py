@@ -11,6 +11,9 @@ https://docs.djangoproject.com/en/2.1/ref/settings/
 """
 
 import os
+import sys
+
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -41,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'salon_crm_base.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,14 +77,74 @@ WSGI_APPLICATION = 'salon_crm_project.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
+# Configured from the environment. SALON_CRM_DB_ENGINE is sqlite (the default) or postgresql,
+# which needs psycopg2 installed. Connections are kept open for SALON_CRM_DB_CONN_MAX_AGE seconds.
+# SQLite runs in WAL mode so readers do not block the writer, and transactions begin
+# IMMEDIATE so concurrent writers wait up to SALON_CRM_SQLITE_BUSY_TIMEOUT_MS for each other.
+
+DATABASE_ENGINE = os.environ.get('SALON_CRM_DB_ENGINE', 'sqlite')
+
+DATABASE_CONN_MAX_AGE = int(os.environ.get('SALON_CRM_DB_CONN_MAX_AGE', 60))
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('SALON_CRM_DB_NAME', 'salon_crm'),
+            'USER': os.environ.get('SALON_CRM_DB_USER', ''),
+            'PASSWORD': os.environ.get('SALON_CRM_DB_PASSWORD', ''),
+            'HOST': os.environ.get('SALON_CRM_DB_HOST', ''),
+            'PORT': os.environ.get('SALON_CRM_DB_PORT', ''),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+        }
+    }
+elif DATABASE_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'salon_crm_base.db_backends.sqlite3',
+            'NAME': os.environ.get('SALON_CRM_DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'OPTIONS': {
+                'init_pragmas': {
+                    'journal_mode': 'WAL',
+                    'synchronous': 'NORMAL',
+                    'busy_timeout': int(os.environ.get('SALON_CRM_SQLITE_BUSY_TIMEOUT_MS', 5000)),
+                    'mmap_size': int(os.environ.get('SALON_CRM_SQLITE_MMAP_SIZE', 64 * 1024 * 1024)),
+                },
+                'transaction_mode': 'IMMEDIATE',
+            },
+            # A file, not the in-memory default, so tests can use WAL and several connections
+            'TEST': {
+                'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3'),
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured("SALON_CRM_DB_ENGINE must be sqlite or postgresql, not {}".format(DATABASE_ENGINE))
 
-DATABASES = {
+
+# Cache
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+# Holds the daily summaries of the appointment summary report, see models.DailySummaryCache.
+# The default file based cache is shared by every server process on the host, so a change
+# made in one process is not served stale by another; use memcached with several hosts.
+# It stores pickles, so it lives in the project rather than in a shared temporary directory.
+# One report can cache 366 days, so MAX_ENTRIES is kept well above that.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'BACKEND': os.environ.get('SALON_CRM_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('SALON_CRM_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('SALON_CRM_CACHE_MAX_ENTRIES', 10000)),
+        },
     }
 }
 
+# Tests get an in-memory cache of their own, so they neither clear nor fill the server's cache
+if sys.argv[1:2] == ['test']:
+    CACHES['default'].update(BACKEND='django.core.cache.backends.locmem.LocMemCache', LOCATION='salon_crm_test')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -119,3 +183,37 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.1/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Logging
+# https://docs.djangoproject.com/en/2.1/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'salon_crm_base': {
+            'handlers': ['console'],
+            'level': os.environ.get('SALON_CRM_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
+# Requests slower than this are logged by salon_crm_base.middleware.RequestTimingMiddleware
+# with their slowest queries
+
+SLOW_REQUEST_MS = 500
+
+SLOW_REQUEST_TOP_QUERIES = 5
+
+# Appointment reminders sent by the send_reminders command, see salon_crm_base.reminders.
+# FileReminderBackend writes them to REMINDER_FILE_PATH instead of the console.
+
+REMINDER_BACKEND = os.environ.get('SALON_CRM_REMINDER_BACKEND', 'salon_crm_base.reminders.ConsoleReminderBackend')
+
+REMINDER_FILE_PATH = os.environ.get('SALON_CRM_REMINDER_FILE_PATH', os.path.join(BASE_DIR, 'reminders.jsonl'))